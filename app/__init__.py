@@ -1,29 +1,79 @@
 from fastapi import FastAPI
 
-from .database import engine, models
+from .database import engine, migrations
 from .routes import (
     AuthRouter,
+    CertificatesRouter,
     CompaniesRouter,
+    DatabaseRouter,
     DevicesRouter,
+    FursRouter,
     InvoicesRouter,
     PremisesRouter,
+    ReportsRouter,
     UsersRouter,
 )
-from .util import certificates, furs
+from .util import (
+    certificates,
+    compression,
+    executor,
+    furs,
+    idempotency,
+    notifications,
+    outbox,
+    passwords,
+    principals,
+    replica,
+    signing,
+    sql_stats,
+)
 from .util.logging import initialize as initialize_logging
 
 initialize_logging()
-models.Base.metadata.create_all(bind=engine)
 app = FastAPI(title="Davcna blagajna API")
+if sql_stats.is_enabled():
+    sql_stats.install()
+    app.add_middleware(sql_stats.SqlStatsMiddleware)
+if compression.is_enabled():
+    app.add_middleware(compression.CompressionMiddleware)
+if replica.is_enabled():
+    replica.install()
+    app.add_middleware(replica.ReplicaMiddleware)
 app.include_router(AuthRouter)
+app.include_router(CertificatesRouter)
 app.include_router(CompaniesRouter)
+app.include_router(DatabaseRouter)
 app.include_router(InvoicesRouter)
 app.include_router(DevicesRouter)
+app.include_router(FursRouter)
 app.include_router(PremisesRouter)
+app.include_router(ReportsRouter)
 app.include_router(UsersRouter)
 
 
 @app.on_event("startup")
 async def startup():
+    migrations.upgrade(engine)
     certificates.load()
-    furs.register_premises()
+    signing.start([api.credentials for api in certificates.get_apis().values()])
+    passwords.start()
+    furs.start()
+    outbox.start()
+    idempotency.start()
+    principals.start()
+    certificates.start()
+    notifications.start()
+    replica.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    furs.stop()
+    outbox.stop()
+    idempotency.stop()
+    notifications.stop()
+    replica.stop()
+    certificates.stop()
+    signing.shutdown()
+    passwords.shutdown()
+    executor.shutdown()
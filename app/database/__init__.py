@@ -1,17 +1,175 @@
-from app.settings import DATABASE_URL
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from app.settings import (
+    DATABASE_ASYNC,
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL_PRE_PING,
+    DATABASE_POOL_SIZE,
+    DATABASE_POOL_TIMEOUT,
+    DATABASE_REPLICA_URL,
+    DATABASE_STATEMENT_CACHE_SIZE,
+    DATABASE_URL,
+)
+from app.util.executor import db_executor, run_in_db_executor, run_on
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from .pool import (
+    PoolStats,
+    TimedAsyncQueuePool,
+    TimedPoolMixin,
+    TimedQueuePool,
+)
+
+T = TypeVar("T")
+# What `get_db` yields, depending on DATABASE_ASYNC
+DbSession = Union[Session, AsyncSession]
+
+
+def pool_options(url: URL, poolclass) -> dict:
+    # SQLite brings its own pools, which aren't sized
+    if url.get_backend_name() == "sqlite":
+        return {}
+    return dict(
+        poolclass=poolclass,
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+        pool_pre_ping=DATABASE_POOL_PRE_PING,
+    )
+
+
+def use_utc(engine: Engine):
+    """
+    Run the PostgreSQL sessions of `engine` in UTC, so that times the server
+    fills in (the `now()` defaults) are naive UTC like the app's. The server's
+    own TimeZone is left to `RESET`, see migration 0003.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+
+    @event.listens_for(engine, "connect", insert=True)
+    def set_time_zone(dbapi_connection, connection_record):
+        autocommit = dbapi_connection.autocommit
+        dbapi_connection.autocommit = True
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SET TIME ZONE 'UTC'")
+        cursor.close()
+        dbapi_connection.autocommit = autocommit
+
+
+def create_engines(database_url: str) -> Tuple[Engine, Optional[AsyncEngine]]:
+    """
+    The blocking engine for `database_url`, and its asyncpg twin with
+    DATABASE_ASYNC
+    """
+    url = make_url(database_url)
+    sync_engine = create_engine(url, **pool_options(url, TimedQueuePool))
+    use_utc(sync_engine)
+    if not DATABASE_ASYNC:
+        return sync_engine, None
+    async_url = url.set(drivername="postgresql+asyncpg")
+    async_engine = create_async_engine(
+        async_url,
+        connect_args={"prepared_statement_cache_size": DATABASE_STATEMENT_CACHE_SIZE},
+        **pool_options(async_url, TimedAsyncQueuePool),
+    )
+    use_utc(async_engine.sync_engine)
+    return sync_engine, async_engine
+
+
+def async_sessionmaker(bind: Optional[AsyncEngine]) -> Optional[sessionmaker]:
+    if bind is None:
+        return None
+    # Nothing may be loaded lazily outside `run`, including after a commit
+    return sessionmaker(
+        bind,
+        class_=AsyncSession,
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False,
+    )
 
-engine = create_engine(DATABASE_URL)
+
+engine, async_engine = create_engines(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine)
+
+# Only ever read from, see `app.util.replica`
+replica_engine = replica_async_engine = None
+ReplicaSessionLocal = AsyncReplicaSessionLocal = None
+if DATABASE_REPLICA_URL:
+    replica_engine, replica_async_engine = create_engines(DATABASE_REPLICA_URL)
+    ReplicaSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, bind=replica_engine
+    )
+    AsyncReplicaSessionLocal = async_sessionmaker(replica_async_engine)
 
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
+@asynccontextmanager
+async def open_session(
+    sync_factory: sessionmaker, async_factory: Optional[sessionmaker]
+) -> AsyncIterator[DbSession]:
+    if async_factory is not None:
+        async with async_factory() as db:
+            yield db
+        return
+
+    db = sync_factory()
     try:
         yield db
     finally:
-        db.close()
+        await run_on(db_executor, db.close)
+
+
+async def get_db():
+    async with open_session(SessionLocal, AsyncSessionLocal) as db:
+        yield db
+
+
+async def run(db: DbSession, func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Call `func(session, *args, **kwargs)`, e.g. a `crud` function, without
+    blocking the event loop: through asyncpg for an async session, in the
+    database executor otherwise. Everything `func` loads lazily is loaded there too.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(func, *args, **kwargs)
+    if db.in_transaction():
+        # Already holds its connection
+        return await run_on(db_executor, func, db, *args, **kwargs)
+    return await run_in_db_executor(func, db, *args, **kwargs)
+
+
+def get_engines() -> Dict[str, Engine]:
+    """
+    The engines of this worker by name, async ones as their sync facade
+    """
+    engines = {"primary": engine, "replica": replica_engine}
+    if async_engine is not None:
+        engines["primary-async"] = async_engine.sync_engine
+    if replica_async_engine is not None:
+        engines["replica-async"] = replica_async_engine.sync_engine
+    return {name: target for name, target in engines.items() if target is not None}
+
+
+def get_pool_stats() -> Dict[str, PoolStats]:
+    return {
+        name: target.pool.stats()
+        for name, target in get_engines().items()
+        if isinstance(target.pool, TimedPoolMixin)
+    }
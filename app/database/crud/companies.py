@@ -1,9 +1,19 @@
 from typing import List
 
 from app.database import models
+from app.database.crud import devices, users
 from sqlalchemy.orm import Session
 
 from app.database.schemas import CompanyCreate
+from app.util import notifications, principals
+
+# Columns of `schemas.Company`, besides its users and devices
+COLUMNS = (
+    models.Company.id,
+    models.Company.name,
+    models.Company.tax_id,
+    models.Company.is_active,
+)
 
 
 def get_by_id(db: Session, company_id: int) -> models.Company:
@@ -14,8 +24,23 @@ def get_all_active(db: Session) -> List[models.Company]:
     return db.query(models.Company).filter(models.Company.is_active).all()
 
 
-def get_all(db: Session) -> List[models.Company]:
-    return db.query(models.Company).all()
+def get_all(db: Session) -> List[dict]:
+    """
+    All companies with their users and devices, as plain dicts shaped like
+    `schemas.Company`, in three queries
+    """
+    all_companies = {
+        row.id: dict(row._asdict(), users=[], devices=[]) for row in db.query(*COLUMNS)
+    }
+    for row in db.query(*users.COLUMNS):
+        all_companies[row.company_id]["users"].append(row._asdict())
+    for company_id, *device in db.query(
+        models.BusinessPremise.company_id, *devices.COLUMNS
+    ).join(models.Device.premise):
+        all_companies[company_id]["devices"].append(
+            dict(zip((column.key for column in devices.COLUMNS), device))
+        )
+    return list(all_companies.values())
 
 
 def create(db: Session, company: CompanyCreate):
@@ -32,5 +57,8 @@ def set_active(db: Session, company_id: int, state: bool):
         .filter(models.Company.id == company_id)
         .update({models.Company.is_active: state})
     )
+    principals.invalidate_company(db, company_id)
+    # Every worker loads or drops the company's certificate
+    notifications.publish(db, notifications.CERTIFICATES)
     db.commit()
     return data
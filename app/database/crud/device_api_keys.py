@@ -0,0 +1,63 @@
+from datetime import datetime
+from typing import List, Optional
+
+from app.database.models import BusinessPremise, Device, DeviceApiKey
+from sqlalchemy.orm import Session, joinedload
+
+
+def create(
+    db: Session, device_id: int, user_id: int, key_hash: str, prefix: str
+) -> DeviceApiKey:
+    db_key = DeviceApiKey(
+        device_id=device_id, user_id=user_id, key_hash=key_hash, prefix=prefix
+    )
+    db.add(db_key)
+    db.commit()
+    db.refresh(db_key)
+    return db_key
+
+
+def get_by_hash(db: Session, key_hash: str) -> Optional[DeviceApiKey]:
+    """
+    Resolve an unrevoked key together with its user, device, premise and
+    company in a single query
+    """
+    return (
+        db.query(DeviceApiKey)
+        .options(
+            joinedload(DeviceApiKey.user),
+            joinedload(DeviceApiKey.device)
+            .joinedload(Device.premise)
+            .joinedload(BusinessPremise.company),
+        )
+        .filter(DeviceApiKey.key_hash == key_hash, DeviceApiKey.revoked_at.is_(None))
+        .first()
+    )
+
+
+def get_by_id(db: Session, key_id: int) -> Optional[DeviceApiKey]:
+    return (
+        db.query(DeviceApiKey)
+        .options(joinedload(DeviceApiKey.device).joinedload(Device.premise))
+        .filter(DeviceApiKey.id == key_id)
+        .first()
+    )
+
+
+def get_by_device_id(db: Session, device_id: int) -> List[DeviceApiKey]:
+    return (
+        db.query(DeviceApiKey)
+        .filter(DeviceApiKey.device_id == device_id)
+        .order_by(DeviceApiKey.id)
+        .all()
+    )
+
+
+def revoke(db: Session, key_id: int):
+    data = (
+        db.query(DeviceApiKey)
+        .filter(DeviceApiKey.id == key_id, DeviceApiKey.revoked_at.is_(None))
+        .update({DeviceApiKey.revoked_at: datetime.utcnow()})
+    )
+    db.commit()
+    return data
@@ -1,10 +1,20 @@
 from typing import List, Optional
-from app.database.crud import premises
 
-from app.database.models import Device
+from app.database.models import BusinessPremise, Device
 from sqlalchemy import update
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session, joinedload
 
+# Columns of `schemas.Device`, for listings
+COLUMNS = (
+    Device.id,
+    Device.device_id,
+    Device.premise_id,
+    Device.is_active,
+    Device.seq_invoice_id,
+    Device.created_at,
+)
+
 
 def get_by_id(db: Session, device_id: int) -> Optional[Device]:
     return db.query(Device).filter(Device.id == device_id).first()
@@ -19,18 +29,38 @@ def get_by_id_with_premise(db: Session, device_id) -> Optional[Device]:
     )
 
 
-def get_all_for_company(db: Session, company_id: int) -> List[Device]:
-    company_premises = premises.get_all_for_company(db, company_id)
+def get_by_id_with_company(db: Session, device_id: int) -> Optional[Device]:
+    """
+    Load a device together with its premise and company in a single query
+    """
+    return (
+        db.query(Device)
+        .options(joinedload(Device.premise).joinedload(BusinessPremise.company))
+        .filter(Device.id == device_id)
+        .first()
+    )
+
+
+def get_by_ids_with_premise(db: Session, device_ids: List[int]) -> List[Device]:
     return (
         db.query(Device)
-        .filter(Device.premise_id.in_([p.id for p in company_premises]))
+        .options(joinedload(Device.premise))
+        .filter(Device.id.in_(device_ids))
+        .all()
+    )
+
+
+def get_all_for_company(db: Session, company_id: int) -> List[Row]:
+    return (
+        db.query(*COLUMNS)
+        .join(Device.premise)
+        .filter(BusinessPremise.company_id == company_id)
         .all()
     )
-    # return db.query(Device).filter(Device.company_id == company_id).all()
 
 
-def get_all(db: Session) -> List[Device]:
-    return db.query(Device).all()
+def get_all(db: Session) -> List[Row]:
+    return db.query(*COLUMNS).all()
 
 
 def set_active(db: Session, device_id: int, state: bool):
@@ -44,12 +74,43 @@ def set_active(db: Session, device_id: int, state: bool):
 
 
 def get_inc_id(db: Session, device_id: int) -> int:
+    """
+    Take the next invoice sequence number for a device. The number (and the
+    row lock on the device) belongs to the caller's transaction.
+    """
     stmt = (
         update(Device)
         .where(Device.id == device_id)
         .values(seq_invoice_id=Device.seq_invoice_id + 1)
         .returning(Device.seq_invoice_id)
     )
-    ret = db.execute(stmt).fetchall()[0][0]
-    db.commit()
-    return ret
+    return db.execute(stmt).fetchall()[0][0]
+
+
+def reserve_ids(db: Session, device_id: int, count: int) -> range:
+    """
+    Reserve `count` consecutive invoice sequence numbers for a device with a
+    single statement. Like `get_inc_id`, the numbers and the row lock belong
+    to the caller's transaction.
+    """
+    stmt = (
+        update(Device)
+        .where(Device.id == device_id)
+        .values(seq_invoice_id=Device.seq_invoice_id + count)
+        .returning(Device.seq_invoice_id)
+    )
+    last = db.execute(stmt).fetchall()[0][0]
+    return range(last - count + 1, last + 1)
+
+
+def release_id(db: Session, device_id: int, seq_id: int) -> bool:
+    """
+    Give back the invoice sequence number `seq_id` if it's still the last one
+    taken for the device. Returns whether it was given back.
+    """
+    stmt = (
+        update(Device)
+        .where(Device.id == device_id, Device.seq_invoice_id == seq_id)
+        .values(seq_invoice_id=seq_id - 1)
+    )
+    return db.execute(stmt).rowcount == 1
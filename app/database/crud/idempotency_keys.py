@@ -0,0 +1,96 @@
+from datetime import datetime
+from typing import Optional
+
+from app.database.models import IdempotencyKey
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload
+
+
+def get_valid(
+    db: Session, company_id: int, key: str, not_before: datetime
+) -> Optional[IdempotencyKey]:
+    """
+    The unexpired entry of the key, also while its invoice is still being
+    issued
+    """
+    return (
+        db.query(IdempotencyKey)
+        .options(joinedload(IdempotencyKey.invoice))
+        .filter(
+            IdempotencyKey.company_id == company_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.created_at >= not_before,
+        )
+        .first()
+    )
+
+
+def claim(
+    db: Session,
+    company_id: int,
+    key: str,
+    request_hash: str,
+    not_before: datetime,
+    abandoned_before: datetime,
+) -> bool:
+    """
+    Claim the key for a request in a transaction of its own, replacing an
+    expired entry or a claim abandoned without an invoice. Returns False if
+    the key is taken, without waiting for the request holding it.
+    """
+    db.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.company_id == company_id,
+            IdempotencyKey.key == key,
+            or_(
+                IdempotencyKey.created_at < not_before,
+                and_(
+                    IdempotencyKey.invoice_id.is_(None),
+                    IdempotencyKey.created_at < abandoned_before,
+                ),
+            ),
+        )
+    )
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    stmt = (
+        dialect.insert(IdempotencyKey)
+        .values(
+            company_id=company_id,
+            key=key,
+            request_hash=request_hash,
+            created_at=datetime.utcnow(),
+        )
+        .on_conflict_do_nothing()
+        .returning(IdempotencyKey.id)
+    )
+    claimed = db.execute(stmt).first() is not None
+    db.commit()
+    return claimed
+
+
+def set_invoice(db: Session, company_id: int, key: str, invoice_id: int):
+    db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.company_id == company_id, IdempotencyKey.key == key)
+        .values(invoice_id=invoice_id)
+    )
+
+
+def release(db: Session, company_id: int, key: str):
+    db.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.company_id == company_id, IdempotencyKey.key == key
+        )
+    )
+    db.commit()
+
+
+def delete_expired(db: Session, not_before: datetime) -> int:
+    deleted = (
+        db.query(IdempotencyKey)
+        .filter(IdempotencyKey.created_at < not_before)
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
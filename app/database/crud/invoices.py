@@ -1,11 +1,19 @@
-from typing import List
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
 
 from app.database import models, schemas
-from sqlalchemy.orm import Session
+from app.database.crud import reports
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Query, Session, joinedload
 
 
-def create(db: Session, invoice: schemas.InvoiceCreate) -> models.Invoice:
-    db_invoice = models.Invoice(
+def to_values(
+    invoice: schemas.InvoiceCreate, next_submit_at: Optional[datetime] = None
+) -> dict:
+    if invoice.status == models.InvoiceStatus.PENDING and next_submit_at is None:
+        next_submit_at = datetime.utcnow()
+    return dict(
         zoi=invoice.zoi,
         eor=invoice.eor,
         invoice_number=invoice.invoice_number,
@@ -14,22 +22,276 @@ def create(db: Session, invoice: schemas.InvoiceCreate) -> models.Invoice:
         user_id=invoice.user_id,
         company_id=invoice.company_id,
         device_id=invoice.device_id,
+        status=invoice.status,
+        submission=invoice.submission,
+        next_submit_at=(
+            next_submit_at if invoice.status == models.InvoiceStatus.PENDING else None
+        ),
     )
-    db.add(db_invoice)
+
+
+def create(db: Session, invoice: schemas.InvoiceCreate, commit: bool = True) -> int:
+    stmt = (
+        insert(models.Invoice).values(**to_values(invoice)).returning(models.Invoice.id)
+    )
+    invoice_id = db.execute(stmt).scalar_one()
+    reports.record(db, [(invoice_id, invoice)])
+    if commit:
+        db.commit()
+    return invoice_id
+
+
+def create_many(
+    db: Session,
+    invoices: List[schemas.InvoiceCreate],
+    next_submit_at: Optional[datetime] = None,
+) -> List[int]:
+    """
+    Insert all invoices with a single multi-row INSERT and return their IDs, in
+    the same order as the input. Pending invoices are due for the outbox at
+    `next_submit_at`, right away by default.
+    """
+    if not invoices:
+        return []
+    stmt = (
+        insert(models.Invoice)
+        .values([to_values(invoice, next_submit_at) for invoice in invoices])
+        .returning(models.Invoice.id, models.Invoice.invoice_number)
+    )
+    ids = {number: invoice_id for invoice_id, number in db.execute(stmt)}
+    invoice_ids = [ids[invoice.invoice_number] for invoice in invoices]
+    reports.record(db, list(zip(invoice_ids, invoices)))
     db.commit()
-    db.refresh(db_invoice)
-    return db_invoice
+    return invoice_ids
 
 
 def get_by_id(db: Session, invoice_id: int) -> models.Invoice:
     return db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
 
 
-def get_by_company_id(db: Session, company_id: int) -> List[models.Invoice]:
+def get_by_id_with_device(db: Session, invoice_id: int) -> Optional[models.Invoice]:
+    return (
+        db.query(models.Invoice)
+        .options(joinedload(models.Invoice.device).joinedload(models.Device.premise))
+        .filter(models.Invoice.id == invoice_id)
+        .first()
+    )
+
+
+def get_by_number_with_device(
+    db: Session, company_id: int, invoice_number: str
+) -> Optional[models.Invoice]:
+    return (
+        db.query(models.Invoice)
+        .options(joinedload(models.Invoice.device).joinedload(models.Device.premise))
+        .filter(
+            models.Invoice.invoice_number == invoice_number,
+            models.Invoice.company_id == company_id,
+        )
+        .first()
+    )
+
+
+def get_by_numbers_with_device(
+    db: Session, company_id: int, invoice_numbers: List[str]
+) -> List[models.Invoice]:
+    return (
+        db.query(models.Invoice)
+        .options(joinedload(models.Invoice.device).joinedload(models.Device.premise))
+        .filter(
+            models.Invoice.invoice_number.in_(invoice_numbers),
+            models.Invoice.company_id == company_id,
+        )
+        .all()
+    )
+
+
+def get_by_zoi(db: Session, company_id: int, zoi: str) -> Optional[models.Invoice]:
+    return (
+        db.query(models.Invoice)
+        .filter(models.Invoice.zoi == zoi, models.Invoice.company_id == company_id)
+        .first()
+    )
+
+
+def get_by_eor(db: Session, company_id: int, eor: str) -> Optional[models.Invoice]:
+    return (
+        db.query(models.Invoice)
+        .filter(models.Invoice.eor == eor, models.Invoice.company_id == company_id)
+        .first()
+    )
+
+
+def get_by_ids_with_device(db: Session, invoice_ids: List[int]) -> List[models.Invoice]:
+    return (
+        db.query(models.Invoice)
+        .options(joinedload(models.Invoice.device).joinedload(models.Device.premise))
+        .filter(models.Invoice.id.in_(invoice_ids))
+        .all()
+    )
+
+
+# Columns of `schemas.Invoice`, for listings and exports
+COLUMNS = (
+    models.Invoice.id,
+    models.Invoice.invoice_number,
+    models.Invoice.issued_at,
+    models.Invoice.total,
+    models.Invoice.zoi,
+    models.Invoice.eor,
+    models.Invoice.status,
+    models.Invoice.company_id,
+    models.Invoice.device_id,
+    models.Invoice.user_id,
+)
+
+
+def apply_filter(
+    query: Query, invoice_filter: schemas.InvoiceFilter, company_id: Optional[int]
+) -> Query:
+    # Works on both ORM queries and Core selects
+    Invoice = models.Invoice
+    if company_id is not None:
+        query = query.filter(Invoice.company_id == company_id)
+    if invoice_filter.issued_from is not None:
+        query = query.filter(Invoice.issued_at >= invoice_filter.issued_from)
+    if invoice_filter.issued_to is not None:
+        query = query.filter(Invoice.issued_at < invoice_filter.issued_to)
+    if invoice_filter.device_id is not None:
+        query = query.filter(Invoice.device_id == invoice_filter.device_id)
+    if invoice_filter.user_id is not None:
+        query = query.filter(Invoice.user_id == invoice_filter.user_id)
+    if invoice_filter.premise_id is not None:
+        query = query.filter(
+            Invoice.device_id.in_(
+                select(models.Device.id).where(
+                    models.Device.premise_id == invoice_filter.premise_id
+                )
+            )
+        )
+    return query
+
+
+def get_page(
+    db: Session,
+    invoice_filter: schemas.InvoiceFilter,
+    limit: int,
+    company_id: Optional[int] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+) -> List[Row]:
+    """
+    Up to `limit` invoices as plain rows of `COLUMNS`, newest first, issued
+    before the `(issued_at, id)` of the last invoice of the previous page. Each
+    page is a range scan on one of the `(..., issued_at, id)` indexes, however
+    deep it is.
+    """
+    query = apply_filter(db.query(*COLUMNS), invoice_filter, company_id)
+    if before is not None:
+        query = query.filter(
+            tuple_(models.Invoice.issued_at, models.Invoice.id) < tuple_(*before)
+        )
     return (
-        db.query(models.Invoice).filter(models.Invoice.company_id == company_id).all()
+        query.order_by(models.Invoice.issued_at.desc(), models.Invoice.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def stream_for_export(
+    db: Session,
+    invoice_filter: schemas.InvoiceFilter,
+    batch_size: int,
+    company_id: Optional[int] = None,
+) -> Iterator[Row]:
+    """
+    All matching invoices as plain rows, oldest first. Rows are fetched
+    `batch_size` at a time through a server-side cursor, so memory use
+    doesn't grow with the number of rows.
+    """
+    stmt = apply_filter(select(*COLUMNS), invoice_filter, company_id)
+    stmt = stmt.order_by(models.Invoice.issued_at, models.Invoice.id)
+    result = db.execute(
+        stmt, execution_options={"stream_results": True, "yield_per": batch_size}
+    )
+    return iter(result)
+
+
+def lease_pending_for_submit(
+    db: Session, limit: int, lease_until: datetime
+) -> List[Row]:
+    """
+    Take up to `limit` invoices that are due for submission, moving their next
+    attempt to `lease_until` so that other workers leave them alone while
+    they're submitted, and commit
+    """
+    pending = db.execute(
+        select(
+            models.Invoice.id,
+            models.Invoice.company_id,
+            models.Invoice.zoi,
+            models.Invoice.invoice_number,
+            models.Invoice.issued_at,
+            models.Invoice.submission,
+            models.Invoice.submit_attempts,
+        )
+        .where(
+            models.Invoice.status == models.InvoiceStatus.PENDING,
+            models.Invoice.next_submit_at <= datetime.utcnow(),
+        )
+        .order_by(models.Invoice.next_submit_at, models.Invoice.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if pending:
+        db.execute(
+            update(models.Invoice)
+            .where(models.Invoice.id.in_([invoice.id for invoice in pending]))
+            .values(next_submit_at=lease_until)
+        )
+    db.commit()
+    return pending
+
+
+def set_submitted(db: Session, invoice_id: int, eor: str):
+    db.execute(
+        update(models.Invoice)
+        .where(
+            models.Invoice.id == invoice_id,
+            models.Invoice.status == models.InvoiceStatus.PENDING,
+        )
+        .values(
+            eor=eor,
+            status=models.InvoiceStatus.SUBMITTED,
+            submit_attempts=models.Invoice.submit_attempts + 1,
+            last_submit_error=None,
+            next_submit_at=None,
+        )
+    )
+
+
+def set_submit_failed(
+    db: Session, invoice_id: int, error: str, next_submit_at: datetime
+):
+    db.execute(
+        update(models.Invoice)
+        .where(
+            models.Invoice.id == invoice_id,
+            models.Invoice.status == models.InvoiceStatus.PENDING,
+        )
+        .values(
+            submit_attempts=models.Invoice.submit_attempts + 1,
+            last_submit_error=error,
+            next_submit_at=next_submit_at,
+        )
     )
 
 
-def get_all(db: Session) -> List[models.Invoice]:
-    return db.query(models.Invoice).all()
+def get_outbox_stats(
+    db: Session, company_id: Optional[int] = None
+) -> Tuple[int, Optional[datetime]]:
+    query = db.query(
+        func.count(models.Invoice.id), func.min(models.Invoice.issued_at)
+    ).filter(models.Invoice.status == models.InvoiceStatus.PENDING)
+    if company_id is not None:
+        query = query.filter(models.Invoice.company_id == company_id)
+    return query.one()
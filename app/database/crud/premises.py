@@ -1,14 +1,82 @@
-from typing import List
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session, contains_eager, joinedload, selectinload
 
-from app.database.models import BusinessPremise
+from app.database.models import BusinessPremise, Company
 
 
 def get_all_for_company(db: Session, company_id: int) -> List[BusinessPremise]:
     return (
-        db.query(BusinessPremise).filter(BusinessPremise.company_id == company_id).all()
+        db.query(BusinessPremise)
+        .options(selectinload(BusinessPremise.devices))
+        .filter(BusinessPremise.company_id == company_id)
+        .all()
     )
 
 
 def get_all(db: Session) -> List[BusinessPremise]:
-    return db.query(BusinessPremise).all()
+    return (
+        db.query(BusinessPremise).options(selectinload(BusinessPremise.devices)).all()
+    )
+
+
+def get_all_for_active_companies(db: Session) -> List[BusinessPremise]:
+    return (
+        db.query(BusinessPremise)
+        .join(BusinessPremise.company)
+        .filter(Company.is_active)
+        .options(contains_eager(BusinessPremise.company))
+        .all()
+    )
+
+
+def lock_for_registration(db: Session, premise_id: int) -> Optional[BusinessPremise]:
+    """
+    Lock the premise until the transaction ends. Returns None if another
+    worker is registering it right now.
+    """
+    return (
+        db.query(BusinessPremise)
+        .filter(
+            BusinessPremise.id == premise_id,
+            or_(
+                BusinessPremise.registration_leased_until.is_(None),
+                BusinessPremise.registration_leased_until < datetime.utcnow(),
+            ),
+        )
+        .options(joinedload(BusinessPremise.company, innerjoin=True))
+        .with_for_update(skip_locked=True, of=BusinessPremise)
+        .first()
+    )
+
+
+def lease_for_registration(db: Session, premise: BusinessPremise, until: datetime):
+    """
+    Keep other workers from registering the locked premise until `until`, or
+    until the registration is recorded
+    """
+    premise.registration_leased_until = until
+    db.commit()
+
+
+def set_registered(db: Session, premise_id: int, registration_hash: str):
+    db.execute(
+        update(BusinessPremise)
+        .where(BusinessPremise.id == premise_id)
+        .values(
+            registration_hash=registration_hash,
+            registered_at=datetime.utcnow(),
+            registration_leased_until=None,
+        )
+    )
+    db.commit()
+
+
+def release_registration(db: Session, premise_id: int):
+    db.execute(
+        update(BusinessPremise)
+        .where(BusinessPremise.id == premise_id)
+        .values(registration_leased_until=None)
+    )
+    db.commit()
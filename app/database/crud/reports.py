@@ -0,0 +1,156 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pytz
+from app.database import models, schemas
+from app.settings import REPORT_TIMEZONE
+from app.util.invoices import round_cents
+from sqlalchemy import func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Query, Session
+
+report_timezone = pytz.timezone(REPORT_TIMEZONE)
+
+
+def sales_day(issued_at: datetime) -> date:
+    # Naive times are UTC, as stored
+    if issued_at.tzinfo is None:
+        issued_at = pytz.UTC.localize(issued_at)
+    return issued_at.astimezone(report_timezone).date()
+
+
+def increment(db: Session, model, rows: List[dict], totals: Sequence[str]):
+    """
+    Insert the rollup rows, or add their `totals` to the existing ones
+    """
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    table = model.__table__
+    stmt = dialect.insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key],
+        set_={name: table.c[name] + stmt.excluded[name] for name in totals},
+    )
+    db.execute(stmt)
+
+
+def record(db: Session, created: Sequence[Tuple[int, schemas.InvoiceCreate]]):
+    """
+    Store the VAT lines of newly inserted invoices and add them to the daily
+    rollups, in the caller's transaction
+    """
+    if not created:
+        return
+    sales: Dict[tuple, List] = {}
+    vat: Dict[tuple, List] = {}
+    vat_lines = []
+    for invoice_id, invoice in created:
+        key = (
+            invoice.company_id,
+            sales_day(invoice.issued_at),
+            invoice.premise_id,
+            invoice.device_id,
+        )
+        day_sales = sales.setdefault(key, [0, Decimal(0)])
+        day_sales[0] += 1
+        day_sales[1] += round_cents(invoice.total)
+        for line in invoice.vat_lines:
+            vat_lines.append(dict(invoice_id=invoice_id, **line.dict()))
+            day_vat = vat.setdefault((*key, line.tax_rate), [Decimal(0), Decimal(0)])
+            day_vat[0] += line.base
+            day_vat[1] += line.tax
+
+    if vat_lines:
+        db.execute(insert(models.InvoiceVatLine), vat_lines)
+    # Rollup rows stay locked until the caller commits; taking the locks in key
+    # order keeps concurrent transactions from deadlocking
+    sales_rows = []
+    for (company_id, day, premise_id, device_id), (invoices, total) in sorted(
+        sales.items()
+    ):
+        sales_rows.append(
+            dict(
+                company_id=company_id,
+                day=day,
+                premise_id=premise_id,
+                device_id=device_id,
+                invoices=invoices,
+                total=total,
+            )
+        )
+    increment(db, models.DailySales, sales_rows, ["invoices", "total"])
+    vat_rows = []
+    for (company_id, day, premise_id, device_id, tax_rate), (base, tax) in sorted(
+        vat.items()
+    ):
+        vat_rows.append(
+            dict(
+                company_id=company_id,
+                day=day,
+                premise_id=premise_id,
+                device_id=device_id,
+                tax_rate=tax_rate,
+                base=base,
+                tax=tax,
+            )
+        )
+    if vat_rows:
+        increment(db, models.DailyVat, vat_rows, ["base", "tax"])
+
+
+def apply_filter(
+    query: Query,
+    model,
+    date_from: date,
+    date_to: date,
+    company_id: Optional[int],
+    premise_id: Optional[int],
+    device_id: Optional[int],
+) -> Query:
+    query = query.filter(model.day >= date_from, model.day <= date_to)
+    if company_id is not None:
+        query = query.filter(model.company_id == company_id)
+    if premise_id is not None:
+        query = query.filter(model.premise_id == premise_id)
+    if device_id is not None:
+        query = query.filter(model.device_id == device_id)
+    return query
+
+
+def get_daily_sales(
+    db: Session,
+    date_from: date,
+    date_to: date,
+    company_id: Optional[int] = None,
+    premise_id: Optional[int] = None,
+    device_id: Optional[int] = None,
+) -> List[Row]:
+    """
+    (day, invoices, total) for every day with sales, from the rollups
+    """
+    model = models.DailySales
+    query = db.query(model.day, func.sum(model.invoices), func.sum(model.total))
+    query = apply_filter(
+        query, model, date_from, date_to, company_id, premise_id, device_id
+    )
+    return query.group_by(model.day).order_by(model.day).all()
+
+
+def get_vat_totals(
+    db: Session,
+    date_from: date,
+    date_to: date,
+    company_id: Optional[int] = None,
+    premise_id: Optional[int] = None,
+    device_id: Optional[int] = None,
+) -> List[Row]:
+    """
+    (tax rate, base, tax) for the whole period, from the rollups
+    """
+    model = models.DailyVat
+    query = db.query(model.tax_rate, func.sum(model.base), func.sum(model.tax))
+    query = apply_filter(
+        query, model, date_from, date_to, company_id, premise_id, device_id
+    )
+    return query.group_by(model.tax_rate).order_by(model.tax_rate).all()
@@ -1,9 +1,19 @@
 from typing import List, Optional
 
 from app.database import models, schemas
-from argon2 import PasswordHasher
+from app.util import principals
 from sqlalchemy.orm import Session
 
+# Columns of `schemas.User`, for listings
+COLUMNS = (
+    models.User.id,
+    models.User.username,
+    models.User.email,
+    models.User.role,
+    models.User.company_id,
+    models.User.active,
+)
+
 
 def get_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
@@ -21,12 +31,14 @@ def get_by_company_id(db: Session, company_id: int) -> List[models.User]:
     return db.query(models.User).filter(models.User.company_id == company_id).all()
 
 
-def create(db: Session, user: schemas.UserCreate) -> models.User:
-    hash = PasswordHasher().hash(user.password)
+def create(db: Session, user: schemas.UserCreate, password_hash: str) -> models.User:
+    """
+    Create a user with a password hashed by `passwords.hash_password`
+    """
     db_user = models.User(
         username=user.username,
         email=user.email,
-        password=hash,
+        password=password_hash,
         role=user.role,
         company_id=user.company_id,
     )
@@ -36,6 +48,25 @@ def create(db: Session, user: schemas.UserCreate) -> models.User:
     return db_user
 
 
+def set_password(db: Session, user_id: int, password_hash: str):
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.password: password_hash}
+    )
+    db.commit()
+
+
 def delete(db: Session, user_id: int):
     db.query(models.User).filter(models.User.id == user_id).delete()
+    principals.invalidate_user(db, user_id)
+    db.commit()
+
+
+def set_active(db: Session, user_id: int, state: bool):
+    data = (
+        db.query(models.User)
+        .filter(models.User.id == user_id)
+        .update({models.User.active: state})
+    )
+    principals.invalidate_user(db, user_id)
     db.commit()
+    return data
@@ -0,0 +1,41 @@
+-- Existing tables, up to date with the FURS outbox (invoices without an EOR
+-- yet), tracked premise registration, keyset pagination and invoice lookups.
+-- Safe to run on a database that already has some of these.
+
+ALTER TABLE business_premises ADD COLUMN IF NOT EXISTS registration_hash VARCHAR;
+ALTER TABLE business_premises ADD COLUMN IF NOT EXISTS registered_at TIMESTAMP WITHOUT TIME ZONE;
+
+DO $$ BEGIN
+    CREATE TYPE invoicestatus AS ENUM ('PENDING', 'SUBMITTED');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
+ALTER TABLE invoices ALTER COLUMN eor DROP NOT NULL;
+-- Every invoice issued so far has its EOR
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS status invoicestatus NOT NULL DEFAULT 'SUBMITTED';
+ALTER TABLE invoices ALTER COLUMN status DROP DEFAULT;
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS submission JSON;
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS submit_attempts INTEGER NOT NULL DEFAULT '0';
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS next_submit_at TIMESTAMP WITHOUT TIME ZONE;
+ALTER TABLE invoices ADD COLUMN IF NOT EXISTS last_submit_error VARCHAR;
+
+CREATE INDEX IF NOT EXISTS ix_invoices_status_next_submit_at ON invoices (status, next_submit_at);
+CREATE INDEX IF NOT EXISTS ix_invoices_issued_at_id ON invoices (issued_at, id);
+CREATE INDEX IF NOT EXISTS ix_invoices_company_id_issued_at_id ON invoices (company_id, issued_at, id);
+CREATE INDEX IF NOT EXISTS ix_invoices_device_id_issued_at_id ON invoices (device_id, issued_at, id);
+CREATE INDEX IF NOT EXISTS ix_invoices_user_id_issued_at_id ON invoices (user_id, issued_at, id);
+
+-- Fails if a company has duplicate invoice numbers, ZOIs or EORs, which have to
+-- be resolved by hand first
+DO $$ BEGIN
+    ALTER TABLE invoices ADD CONSTRAINT uq_invoices_invoice_number_company_id UNIQUE (invoice_number, company_id);
+EXCEPTION WHEN duplicate_object OR duplicate_table THEN NULL;
+END $$;
+DO $$ BEGIN
+    ALTER TABLE invoices ADD CONSTRAINT uq_invoices_zoi_company_id UNIQUE (zoi, company_id);
+EXCEPTION WHEN duplicate_object OR duplicate_table THEN NULL;
+END $$;
+DO $$ BEGIN
+    ALTER TABLE invoices ADD CONSTRAINT uq_invoices_eor_company_id UNIQUE (eor, company_id);
+EXCEPTION WHEN duplicate_object OR duplicate_table THEN NULL;
+END $$;
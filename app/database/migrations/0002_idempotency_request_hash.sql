@@ -0,0 +1,4 @@
+-- Idempotency keys remember the request they were first used with. Keys
+-- claimed before have no fingerprint, and match any request.
+
+ALTER TABLE idempotency_keys ADD COLUMN IF NOT EXISTS request_hash VARCHAR;
@@ -0,0 +1,15 @@
+-- Times used to be stored as the wall-clock time of the session's TimeZone,
+-- which was the server's default. The app now stores naive UTC and runs its
+-- sessions in UTC, so convert the times stored before, in that default zone.
+-- A server that defaults to UTC is left as it is.
+
+SET LOCAL TimeZone TO DEFAULT;
+
+UPDATE business_premises
+SET validity_from = (validity_from AT TIME ZONE current_setting('TimeZone')) AT TIME ZONE 'UTC';
+UPDATE devices
+SET created_at = (created_at AT TIME ZONE current_setting('TimeZone')) AT TIME ZONE 'UTC';
+UPDATE invoices
+SET issued_at = (issued_at AT TIME ZONE current_setting('TimeZone')) AT TIME ZONE 'UTC';
+
+SET LOCAL TimeZone TO 'UTC';
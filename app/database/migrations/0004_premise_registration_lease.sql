@@ -0,0 +1,4 @@
+-- Premises are leased to the worker registering them, instead of staying
+-- locked while FURS is called
+
+ALTER TABLE business_premises ADD COLUMN IF NOT EXISTS registration_leased_until TIMESTAMP WITHOUT TIME ZONE;
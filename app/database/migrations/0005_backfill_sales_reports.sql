@@ -0,0 +1,57 @@
+-- Invoices issued before the sales reports existed have no VAT lines and
+-- aren't in the daily rollups, so reports of those days came out empty. Their
+-- VAT lines are summed from the amounts submitted to FURS, and the rollups are
+-- rebuilt from all invoices. Invoices older than stored submissions have no
+-- VAT amounts to go by, so they count towards the sales but not the VAT.
+-- Days are in the report time zone, which `upgrade` passes as
+-- app.report_timezone.
+
+INSERT INTO invoice_vat_lines (invoice_id, tax_rate, base, tax)
+SELECT
+    invoices.id,
+    (vat_amount->>0)::numeric,
+    round(sum((vat_amount->>1)::numeric), 2),
+    round(sum((vat_amount->>2)::numeric), 2)
+FROM invoices
+CROSS JOIN LATERAL json_array_elements(invoices.submission->'vat_amounts') AS vat_amount
+WHERE NOT EXISTS (
+    SELECT FROM invoice_vat_lines WHERE invoice_vat_lines.invoice_id = invoices.id
+)
+GROUP BY invoices.id, (vat_amount->>0)::numeric;
+
+CREATE TEMPORARY TABLE invoice_sales_days ON COMMIT DROP AS
+SELECT
+    invoices.id,
+    invoices.company_id,
+    ((invoices.issued_at AT TIME ZONE 'UTC')
+        AT TIME ZONE current_setting('app.report_timezone'))::date AS day,
+    devices.premise_id,
+    invoices.device_id,
+    round(invoices.total::numeric, 2) AS total
+FROM invoices
+JOIN devices ON devices.id = invoices.device_id;
+
+TRUNCATE daily_sales, daily_vat;
+
+INSERT INTO daily_sales (company_id, day, premise_id, device_id, invoices, total)
+SELECT company_id, day, premise_id, device_id, count(*), sum(total)
+FROM invoice_sales_days
+GROUP BY company_id, day, premise_id, device_id;
+
+INSERT INTO daily_vat (company_id, day, premise_id, device_id, tax_rate, base, tax)
+SELECT
+    invoice_sales_days.company_id,
+    invoice_sales_days.day,
+    invoice_sales_days.premise_id,
+    invoice_sales_days.device_id,
+    invoice_vat_lines.tax_rate,
+    sum(invoice_vat_lines.base),
+    sum(invoice_vat_lines.tax)
+FROM invoice_sales_days
+JOIN invoice_vat_lines ON invoice_vat_lines.invoice_id = invoice_sales_days.id
+GROUP BY
+    invoice_sales_days.company_id,
+    invoice_sales_days.day,
+    invoice_sales_days.premise_id,
+    invoice_sales_days.device_id,
+    invoice_vat_lines.tax_rate;
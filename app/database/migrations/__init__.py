@@ -0,0 +1,54 @@
+# Schema migrations. `create_all` only creates missing tables, so changes to
+# existing ones are shipped as SQL files in this directory, applied in order
+# by `upgrade` and recorded in `schema_migrations`. A new database gets the
+# current schema from the models, so its migrations are only recorded.
+from pathlib import Path
+from typing import List
+
+from app.database import Base, models
+from app.settings import REPORT_TIMEZONE
+from loguru import logger
+from sqlalchemy import inspect, insert, select, text
+from sqlalchemy.engine import Engine
+
+MIGRATIONS_DIR = Path(__file__).parent
+# Advisory lock held while migrating, so that workers starting at the same time
+# migrate one after another
+LOCK_ID = 0x6675727372656C61
+
+
+def get_migrations() -> List[Path]:
+    return sorted(MIGRATIONS_DIR.glob("*.sql"))
+
+
+def upgrade(engine: Engine):
+    """
+    Create missing tables and apply pending migrations, in one transaction
+    """
+    with engine.begin() as connection:
+        postgresql = connection.dialect.name == "postgresql"
+        if postgresql:
+            connection.execute(
+                text("SELECT pg_advisory_xact_lock(:id)"), {"id": LOCK_ID}
+            )
+            # For migrations that need the days of the sales reports
+            connection.execute(
+                text("SELECT set_config('app.report_timezone', :timezone, true)"),
+                {"timezone": REPORT_TIMEZONE},
+            )
+        new = not inspect(connection).has_table(models.Invoice.__tablename__)
+        Base.metadata.create_all(bind=connection)
+        applied = set(connection.execute(select(models.SchemaMigration.name)).scalars())
+        for path in get_migrations():
+            if path.stem in applied:
+                continue
+            if not new:
+                if not postgresql:
+                    logger.warning(
+                        f"Not applying migration {path.stem}, migrations are "
+                        "written for PostgreSQL"
+                    )
+                    continue
+                logger.info(f"Applying migration {path.stem}")
+                connection.exec_driver_sql(path.read_text())
+            connection.execute(insert(models.SchemaMigration).values(name=path.stem))
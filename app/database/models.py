@@ -1,4 +1,5 @@
 import enum
+from datetime import timezone
 
 from app.database import Base
 from furs_fiscal.api import (
@@ -10,17 +11,38 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    Date,
     DateTime,
     Enum,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    JSON,
+    Numeric,
     String,
+    TypeDecorator,
+    UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 
+class UTCDateTime(TypeDecorator):
+    """
+    Naive UTC timestamps. Aware datetimes are converted on the way in, which
+    asyncpg (unlike psycopg2) insists on.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
 class BusinessPremiseType(enum.Enum):
     MOVABLE = "MOVABLE"
     IMMOVABLE = "IMMOVABLE"
@@ -38,6 +60,11 @@ class UserRole(enum.IntEnum):
     ADMIN = 2
 
 
+class InvoiceStatus(enum.Enum):
+    PENDING = "PENDING"
+    SUBMITTED = "SUBMITTED"
+
+
 class Company(Base):
     __tablename__ = "companies"
     id = Column(Integer, primary_key=True, index=True)
@@ -49,6 +76,14 @@ class Company(Base):
     users = relationship("User", back_populates="company")
     premises = relationship("BusinessPremise", back_populates="company")
     invoices = relationship("Invoice", back_populates="company")
+    # Devices of all the company's premises
+    devices = relationship(
+        "Device",
+        secondary="business_premises",
+        primaryjoin="Company.id == BusinessPremise.company_id",
+        secondaryjoin="BusinessPremise.id == Device.premise_id",
+        viewonly=True,
+    )
 
 
 class User(Base):
@@ -70,7 +105,7 @@ class BusinessPremise(Base):
     __tablename__ = "business_premises"
     id = Column(Integer, primary_key=True, index=True)
     furs_id = Column(String, nullable=False)
-    validity_from = Column(DateTime, nullable=False, server_default=func.now())
+    validity_from = Column(UTCDateTime, nullable=False, server_default=func.now())
     notes = Column(String, nullable=True)
     premise_type = Column(Enum(BusinessPremiseType), nullable=False)
 
@@ -88,6 +123,13 @@ class BusinessPremise(Base):
     city = Column(String)
     postal_code = Column(String)
 
+    # Hash of the data last registered with FURS (see `util.furs`), to only
+    # register new and changed premises
+    registration_hash = Column(String, nullable=True)
+    registered_at = Column(UTCDateTime, nullable=True)
+    # Set while a worker registers the premise, so that others leave it alone
+    registration_leased_until = Column(UTCDateTime, nullable=True)
+
     company_id = Column(ForeignKey("companies.id"), nullable=False)
     company = relationship("Company", back_populates="premises")
 
@@ -100,7 +142,7 @@ class Device(Base):
     device_id = Column(String, unique=True, nullable=False)
     seq_invoice_id = Column(Integer, nullable=False, server_default="0")
     is_active = Column(Boolean, nullable=False, server_default="1")
-    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    created_at = Column(UTCDateTime, nullable=False, server_default=func.now())
 
     premise_id = Column(ForeignKey("business_premises.id"), nullable=False)
     premise: BusinessPremise = relationship("BusinessPremise", back_populates="devices")
@@ -112,11 +154,21 @@ class Invoice(Base):
     __tablename__ = "invoices"
     id = Column(Integer, primary_key=True, index=True)
     zoi = Column(String, nullable=False)
-    eor = Column(String, nullable=False)
+    eor = Column(String, nullable=True)
     invoice_number = Column(String, nullable=False)
-    issued_at = Column(DateTime, nullable=False)
+    issued_at = Column(UTCDateTime, nullable=False)
     total = Column(Float(asdecimal=True), nullable=False)
 
+    # Fiscalization state; invoices without an EOR wait in the outbox until
+    # they are (re)submitted to FURS
+    status = Column(
+        Enum(InvoiceStatus), nullable=False, default=InvoiceStatus.SUBMITTED
+    )
+    submission = Column(JSON, nullable=True)
+    submit_attempts = Column(Integer, nullable=False, server_default="0")
+    next_submit_at = Column(UTCDateTime, nullable=True)
+    last_submit_error = Column(String, nullable=True)
+
     user_id = Column(ForeignKey("users.id"), nullable=False)
     user = relationship("User", back_populates="invoices")
 
@@ -125,3 +177,100 @@ class Invoice(Base):
 
     device_id = Column(ForeignKey("devices.id"), nullable=False)
     device = relationship("Device", back_populates="invoices")
+
+    __table_args__ = (
+        Index("ix_invoices_status_next_submit_at", status, next_submit_at),
+        # Keyset pagination (newest first) over every listing filter
+        Index("ix_invoices_issued_at_id", issued_at, id),
+        Index("ix_invoices_company_id_issued_at_id", company_id, issued_at, id),
+        Index("ix_invoices_device_id_issued_at_id", device_id, issued_at, id),
+        Index("ix_invoices_user_id_issued_at_id", user_id, issued_at, id),
+        # Lookups by what's printed on the invoice (or returned by FURS), within
+        # a company or across all of them
+        UniqueConstraint(
+            invoice_number, company_id, name="uq_invoices_invoice_number_company_id"
+        ),
+        UniqueConstraint(zoi, company_id, name="uq_invoices_zoi_company_id"),
+        UniqueConstraint(eor, company_id, name="uq_invoices_eor_company_id"),
+    )
+
+
+class InvoiceVatLine(Base):
+    """
+    VAT breakdown of an invoice, one row per tax rate
+    """
+
+    __tablename__ = "invoice_vat_lines"
+    invoice_id = Column(ForeignKey("invoices.id"), primary_key=True)
+    tax_rate = Column(Numeric(5, 2), primary_key=True)
+    base = Column(Numeric(14, 2), nullable=False)
+    tax = Column(Numeric(14, 2), nullable=False)
+
+
+# Daily sales rollups, updated in the same transaction as the invoices they
+# count (see `crud.reports`). Days are in REPORT_TIMEZONE.
+class DailySales(Base):
+    __tablename__ = "daily_sales"
+    company_id = Column(ForeignKey("companies.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    premise_id = Column(ForeignKey("business_premises.id"), primary_key=True)
+    device_id = Column(ForeignKey("devices.id"), primary_key=True)
+    invoices = Column(Integer, nullable=False)
+    total = Column(Numeric(16, 2), nullable=False)
+
+
+class DailyVat(Base):
+    __tablename__ = "daily_vat"
+    company_id = Column(ForeignKey("companies.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    premise_id = Column(ForeignKey("business_premises.id"), primary_key=True)
+    device_id = Column(ForeignKey("devices.id"), primary_key=True)
+    tax_rate = Column(Numeric(5, 2), primary_key=True)
+    base = Column(Numeric(16, 2), nullable=False)
+    tax = Column(Numeric(16, 2), nullable=False)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, nullable=False)
+    created_at = Column(UTCDateTime, nullable=False, server_default=func.now())
+    # Fingerprint of the request the key was first used with, see
+    # `util.idempotency.fingerprint`
+    request_hash = Column(String, nullable=True)
+
+    company_id = Column(ForeignKey("companies.id"), nullable=False)
+
+    # Set once the invoice has been issued
+    invoice_id = Column(ForeignKey("invoices.id"), nullable=True)
+    invoice = relationship("Invoice")
+
+    __table_args__ = (UniqueConstraint(company_id, key),)
+
+
+class DeviceApiKey(Base):
+    __tablename__ = "device_api_keys"
+    id = Column(Integer, primary_key=True, index=True)
+    # Keyed hash of the key (see `util.api_keys`), the key itself isn't stored
+    key_hash = Column(String, unique=True, nullable=False)
+    # Start of the key, to tell keys apart
+    prefix = Column(String, nullable=False)
+    created_at = Column(UTCDateTime, nullable=False, server_default=func.now())
+    revoked_at = Column(UTCDateTime, nullable=True)
+
+    device_id = Column(ForeignKey("devices.id"), nullable=False)
+    device: Device = relationship("Device")
+
+    # The user invoices issued with the key are attributed to
+    user_id = Column(ForeignKey("users.id"), nullable=False)
+    user: User = relationship("User")
+
+
+class SchemaMigration(Base):
+    """
+    A migration from `app/database/migrations` applied to the database
+    """
+
+    __tablename__ = "schema_migrations"
+    name = Column(String, primary_key=True)
+    applied_at = Column(UTCDateTime, nullable=False, server_default=func.now())
@@ -0,0 +1,70 @@
+# Connection pools that time every checkout, i.e. how long callers wait for a
+# connection while the pool is exhausted (or while a new one is opened)
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Called with the wait of every checkout, e.g. to attribute it to a request
+wait_hooks: List[Callable[[float], None]] = []
+
+
+@dataclass
+class PoolStats:
+    size: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    wait_seconds: float
+    max_wait_seconds: float
+
+
+class TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            for hook in wait_hooks:
+                hook(waited)
+
+    def stats(self) -> PoolStats:
+        with self.stats_lock:
+            return PoolStats(
+                size=self.size(),
+                checked_out=self.checkedout(),
+                overflow=max(self.overflow(), 0),
+                checkouts=self.checkouts,
+                timeouts=self.timeouts,
+                wait_seconds=round(self.wait_seconds, 6),
+                max_wait_seconds=round(self.max_wait_seconds, 6),
+            )
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
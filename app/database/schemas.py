@@ -2,8 +2,12 @@ from datetime import datetime
 from decimal import Decimal
 from typing import List, Optional
 
-from app.database.models import BusinessPremiseType, MovablePremiseType
-from pydantic import BaseModel
+from app.database.models import (
+    BusinessPremiseType,
+    InvoiceStatus,
+    MovablePremiseType,
+)
+from pydantic import BaseModel, PrivateAttr
 
 
 class UserBase(BaseModel):
@@ -29,6 +33,21 @@ class UserInDb(User):
     password: str
 
 
+class DeviceUser(User):
+    """
+    A user authenticated with a device API key, who may only issue invoices
+    on that device
+    """
+
+    device_id: int
+    # The key's device, with its premise and company loaded
+    _device = PrivateAttr(default=None)
+
+    @property
+    def device(self):
+        return self._device
+
+
 class DeviceBase(BaseModel):
     device_id: str
     premise_id: int
@@ -104,17 +123,27 @@ class CompanyInDb(Company):
 
 class InvoiceBase(BaseModel):
     zoi: str
-    eor: str
+    eor: Optional[str]
     invoice_number: str
     issued_at: datetime
     total: Decimal
     user_id: int
     company_id: int
     device_id: int
+    status: InvoiceStatus = InvoiceStatus.SUBMITTED
+
+
+class VatLine(BaseModel):
+    tax_rate: Decimal
+    base: Decimal
+    tax: Decimal
 
 
 class InvoiceCreate(InvoiceBase):
-    pass
+    submission: Optional[dict] = None
+    # For the VAT breakdown and the sales rollups
+    premise_id: int
+    vat_lines: List[VatLine] = []
 
 
 class Invoice(InvoiceBase):
@@ -122,3 +151,12 @@ class Invoice(InvoiceBase):
 
     class Config:
         orm_mode = True
+
+
+class InvoiceFilter(BaseModel):
+    # Issued at or after `issued_from` and before `issued_to`
+    issued_from: Optional[datetime] = None
+    issued_to: Optional[datetime] = None
+    device_id: Optional[int] = None
+    user_id: Optional[int] = None
+    premise_id: Optional[int] = None
@@ -1,6 +1,10 @@
 from .auth import router as AuthRouter
+from .certificates import router as CertificatesRouter
 from .companies import router as CompaniesRouter
+from .database import router as DatabaseRouter
 from .devices import router as DevicesRouter
+from .furs import router as FursRouter
 from .invoices import router as InvoicesRouter
 from .premises import router as PremisesRouter
+from .reports import router as ReportsRouter
 from .users import router as UsersRouter
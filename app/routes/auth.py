@@ -1,17 +1,15 @@
 from dataclasses import dataclass
 from datetime import timedelta
 
-from app.database import get_db
+from app.database import DbSession, get_db, run
 from app.database.crud import users
 from app.database.schemas import User
 from app.settings import ACCESS_TOKEN_EXPIRE_MINUTES
 from app.util.auth import create_access_token, get_current_active_user
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
+from app.util.passwords import hash_password, login_admission, verify_password
 from fastapi import Depends, HTTPException, status
 from fastapi.routing import APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -26,21 +24,24 @@ class TokenResponse:
     "/token", summary="Login to obtain an access token", response_model=TokenResponse
 )
 async def login(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(), db: DbSession = Depends(get_db)
 ):
 
-    user = users.get_by_username(db, form_data.username)
+    user = await run(db, users.get_by_username, form_data.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials"
         )
 
-    try:
-        PasswordHasher().verify(user.password, form_data.password)
-    except VerifyMismatchError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials"
-        )
+    async with login_admission:
+        valid, needs_rehash = await verify_password(user.password, form_data.password)
+        if not valid:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials"
+            )
+        if needs_rehash:
+            password_hash = await hash_password(form_data.password)
+            await run(db, users.set_password, user.id, password_hash)
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
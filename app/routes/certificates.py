@@ -1,22 +1,31 @@
 from typing import List
 
-from app import certificates
+from app.util import certificates
+from app.database import DbSession, get_db, run
 from app.database.models import UserRole
 from app.database.schemas import User
 from app.util.auth import ActiveUserWithRole
 from app.util.datatypes import ActionResponse
 from fastapi import APIRouter, Depends
 from loguru import logger
+from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/certificates", tags=["certificates"])
 
 
 @router.post(
-    "/refresh", summary="Reload all certificates", response_model=ActionResponse
+    "/refresh",
+    summary="Reload changed certificates on all workers",
+    response_model=ActionResponse,
 )
-async def refresh_certificates(_: User = Depends(ActiveUserWithRole([UserRole.ADMIN]))):
-    logger.info("Certificate reload requested")
-    certificates.load()
+async def refresh_certificates(
+    _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
+    db: DbSession = Depends(get_db),
+):
+    logger.info("Certificate refresh requested")
+    await certificates.refresh()
+    await run(db, certificates.publish_refresh)
+    await run(db, Session.commit)
     return ActionResponse(success=True)
 
 
@@ -30,3 +39,14 @@ async def get_certificates(
     for api_data in certificates.get_apis().values():
         company_taxid_list.append(api_data.tax_id)
     return company_taxid_list
+
+
+@router.get(
+    "/stats",
+    summary="Get certificate cache statistics",
+    response_model=certificates.CertificateStats,
+)
+async def get_certificate_stats(
+    _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
+):
+    return certificates.get_stats()
@@ -1,15 +1,16 @@
 from sqlite3 import IntegrityError
 from typing import List
 
-from app.database import get_db
+from app.database import DbSession, get_db, run
 from app.database.crud import companies
 from app.database.models import UserRole
 from app.database.schemas import Company, CompanyCreate, User
 from app.util.auth import ActiveUserWithRole
 from app.util.datatypes import ActionResponse
+from app.util.replica import get_read_db
+from app.util.responses import FastJSONResponse
 from fastapi import APIRouter, Depends, HTTPException, status
 from psycopg2.errors import UniqueViolation
-from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/companies", tags=["companies"])
 
@@ -19,9 +20,9 @@ router = APIRouter(prefix="/companies", tags=["companies"])
 )
 async def get_companies(
     _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_read_db),
 ):
-    return companies.get_all(db)
+    return FastJSONResponse(await run(db, companies.get_all))
 
 
 @router.post(
@@ -33,10 +34,13 @@ async def get_companies(
 async def create_company(
     company: CompanyCreate,
     _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_db),
 ):
     try:
-        created_company = companies.create(db, company)
+        # Serialized in the session, its users and devices are loaded lazily
+        created_company = await run(
+            db, lambda db: Company.from_orm(companies.create(db, company))
+        )
     except IntegrityError | UniqueViolation:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -53,9 +57,9 @@ async def create_company(
 async def disable_company(
     company_id: int,
     _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_db),
 ):
-    if companies.set_active(db, company_id, False) == 0:
+    if await run(db, companies.set_active, company_id, False) == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Company with id {company_id} not found",
@@ -71,9 +75,9 @@ async def disable_company(
 async def enable_company(
     company_id: int,
     _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_db),
 ):
-    if companies.set_active(db, company_id, True) == 0:
+    if await run(db, companies.set_active, company_id, True) == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Company with id {company_id} not found",
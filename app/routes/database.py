@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+from typing import List
+
+from app.database import get_pool_stats
+from app.database.models import UserRole
+from app.database.pool import PoolStats
+from app.database.schemas import User
+from app.util import replica
+from app.util.auth import ActiveUserWithRole
+from fastapi import APIRouter, Depends
+
+router = APIRouter(prefix="/database", tags=["database"])
+
+
+@dataclass
+class EnginePool:
+    # "primary" and "replica" (with DATABASE_REPLICA_URL), plus their asyncpg
+    # twins "primary-async" and "replica-async" with DATABASE_ASYNC
+    engine: str
+    pool: PoolStats
+
+
+@router.get(
+    "/pools",
+    summary="Get connection pool usage and checkout wait times of this worker",
+    response_model=List[EnginePool],
+)
+async def get_pools(_: User = Depends(ActiveUserWithRole([UserRole.ADMIN]))):
+    return [
+        EnginePool(engine=name, pool=stats) for name, stats in get_pool_stats().items()
+    ]
+
+
+@router.get(
+    "/replica",
+    summary="Get the replica lag and how reads of this worker were routed",
+    response_model=replica.ReplicaStatus,
+)
+async def get_replica(_: User = Depends(ActiveUserWithRole([UserRole.ADMIN]))):
+    return replica.get_status()
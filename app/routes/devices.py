@@ -1,26 +1,55 @@
-from typing import List
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
 
-from app.database import get_db
-from app.database.crud import devices
+from app.database import DbSession, get_db, run
+from app.database.crud import device_api_keys, devices, users
 from app.database.models import UserRole
 from app.database.schemas import Device, User
+from app.util import api_keys
 from app.util.auth import ActiveUserWithRole, get_current_active_user
 from app.util.datatypes import ActionResponse
+from app.util.replica import get_read_db
+from app.util.responses import FastJSONResponse, to_dicts
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/devices", tags=["devices"])
 
 
+@dataclass
+class ApiKeyCreate:
+    # Invoices issued with the key are attributed to this user, by default
+    # the one creating the key
+    user_id: Optional[int] = None
+
+
+@dataclass
+class ApiKeyInfo:
+    id: int
+    prefix: str
+    device_id: int
+    user_id: int
+    created_at: datetime
+    revoked_at: Optional[datetime]
+
+
+@dataclass
+class CreatedApiKey(ApiKeyInfo):
+    # Only ever returned here, it can't be recovered later
+    key: str
+
+
 @router.get(
     "/list",
     summary="Get a list of all devices for your company",
     response_model=List[Device],
 )
 async def get_devices(
-    user: User = Depends(get_current_active_user), db: Session = Depends(get_db)
+    user: User = Depends(get_current_active_user), db: DbSession = Depends(get_read_db)
 ):
-    return devices.get_all_for_company(db, user.company_id)
+    rows = await run(db, devices.get_all_for_company, user.company_id)
+    return FastJSONResponse(to_dicts(rows))
 
 
 @router.get(
@@ -28,9 +57,9 @@ async def get_devices(
 )
 async def get_all_devices(
     _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_read_db),
 ):
-    return devices.get_all(db)
+    return FastJSONResponse(to_dicts(await run(db, devices.get_all)))
 
 
 @router.post(
@@ -43,10 +72,10 @@ async def disable_device(
     user: User = Depends(
         ActiveUserWithRole([UserRole.ADMIN, UserRole.ORGANIZATION_ADMIN])
     ),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_db),
 ):
     if user.role < int(UserRole.ADMIN):
-        device_data = devices.get(db, device_id)
+        device_data = await run(db, devices.get, device_id)
         if device_data is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -57,7 +86,7 @@ async def disable_device(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail=f"Insufficient permission to edit foreign device",
             )
-    if devices.set_active(db, device_id, False) == 0:
+    if await run(db, devices.set_active, device_id, False) == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Device with id {device_id} not found",
@@ -75,10 +104,10 @@ async def enable_device(
     user: User = Depends(
         ActiveUserWithRole([UserRole.ADMIN, UserRole.ORGANIZATION_ADMIN])
     ),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_db),
 ):
     if user.role < int(UserRole.ADMIN):
-        device_data = devices.get(db, device_id)
+        device_data = await run(db, devices.get, device_id)
         if device_data is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -90,9 +119,118 @@ async def enable_device(
                 detail=f"Insufficient permission to edit foreign device",
             )
 
-    if devices.set_active(db, device_id, True) == 0:
+    if await run(db, devices.set_active, device_id, True) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Device with id {device_id} not found",
+        )
+    return ActionResponse(success=True)
+
+
+def get_manageable_device(db: Session, user: User, device_id: int):
+    device = devices.get_by_id_with_premise(db, device_id)
+    if device is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Device with id {device_id} not found",
         )
+    if user.role < int(UserRole.ADMIN) and device.premise.company_id != user.company_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Insufficient permission to edit foreign device",
+        )
+    return device
+
+
+def require_api_keys():
+    if not api_keys.is_enabled():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Device API keys are disabled, API_KEY_SECRET is not set",
+        )
+
+
+def api_key_info(api_key) -> ApiKeyInfo:
+    return ApiKeyInfo(
+        id=api_key.id,
+        prefix=api_key.prefix,
+        device_id=api_key.device_id,
+        user_id=api_key.user_id,
+        created_at=api_key.created_at,
+        revoked_at=api_key.revoked_at,
+    )
+
+
+@router.post(
+    "/api-keys/create/{device_id}",
+    summary="Create an API key for a device",
+    response_model=CreatedApiKey,
+    status_code=201,
+    dependencies=[Depends(require_api_keys)],
+)
+async def create_api_key(
+    device_id: int,
+    request: ApiKeyCreate,
+    user: User = Depends(
+        ActiveUserWithRole([UserRole.ADMIN, UserRole.ORGANIZATION_ADMIN])
+    ),
+    db: DbSession = Depends(get_db),
+):
+    device = await run(db, get_manageable_device, user, device_id)
+    key_user_id = request.user_id if request.user_id is not None else user.id
+    key_user = await run(db, users.get_by_id, key_user_id)
+    if key_user is None or key_user.company_id != device.premise.company_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"User with id {key_user_id} not found in the device's company",
+        )
+
+    key, key_hash, prefix = api_keys.generate()
+    api_key = await run(
+        db, device_api_keys.create, device.id, key_user.id, key_hash, prefix
+    )
+    return CreatedApiKey(**api_key_info(api_key).__dict__, key=key)
+
+
+@router.get(
+    "/api-keys/list/{device_id}",
+    summary="List the API keys of a device",
+    response_model=List[ApiKeyInfo],
+    dependencies=[Depends(require_api_keys)],
+)
+async def list_api_keys(
+    device_id: int,
+    user: User = Depends(
+        ActiveUserWithRole([UserRole.ADMIN, UserRole.ORGANIZATION_ADMIN])
+    ),
+    db: DbSession = Depends(get_db),
+):
+    await run(db, get_manageable_device, user, device_id)
+    return [
+        api_key_info(api_key)
+        for api_key in await run(db, device_api_keys.get_by_device_id, device_id)
+    ]
+
+
+@router.post(
+    "/api-keys/revoke/{key_id}",
+    summary="Revoke a device API key",
+    response_model=ActionResponse,
+    dependencies=[Depends(require_api_keys)],
+)
+async def revoke_api_key(
+    key_id: int,
+    user: User = Depends(
+        ActiveUserWithRole([UserRole.ADMIN, UserRole.ORGANIZATION_ADMIN])
+    ),
+    db: DbSession = Depends(get_db),
+):
+    api_key = await run(db, device_api_keys.get_by_id, key_id)
+    if api_key is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"API key with id {key_id} not found",
+        )
+    await run(db, get_manageable_device, user, api_key.device_id)
+    await run(db, device_api_keys.revoke, key_id)
     return ActionResponse(success=True)
@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+from typing import List
+
+from app.database.models import UserRole
+from app.database.schemas import User
+from app.util.auth import ActiveUserWithRole
+from app.util.breaker import BreakerStatus
+from app.util.certificates import company_limits
+from fastapi import APIRouter, Depends
+
+router = APIRouter(prefix="/furs", tags=["furs"])
+
+
+@dataclass
+class CompanyBreakers:
+    tax_id: int
+    breakers: List[BreakerStatus]
+
+
+@router.get(
+    "/breakers",
+    summary="Get the state of the FURS circuit breakers",
+    response_model=List[CompanyBreakers],
+)
+async def get_breakers(_: User = Depends(ActiveUserWithRole([UserRole.ADMIN]))):
+    return [
+        CompanyBreakers(
+            tax_id=limits.tax_id,
+            breakers=[breaker.status() for breaker in limits.breakers.values()],
+        )
+        for limits in company_limits.values()
+    ]
@@ -1,29 +1,68 @@
+import asyncio
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import List, Optional
+from typing import List, Optional, Tuple, Union
 
-import pytz
-from app.database import get_db, models, schemas
-from app.database.crud import companies, devices, invoices
-from app.util.auth import ActiveUserWithRole, get_current_active_user
+from app.database import DbSession, get_db, models, run, schemas
+from app.database.crud import companies, devices, idempotency_keys, invoices
+from app.settings import (
+    FURS_DEFER_WHEN_OPEN,
+    FURS_OUTBOX_LEASE_SECONDS,
+    FURS_OUTBOX_MODE,
+    INVOICE_BATCH_MAX_SIZE,
+    INVOICE_PAGE_MAX_SIZE,
+    INVOICE_PAGE_SIZE,
+)
+from app.util import idempotency, outbox, replica, sequence
+from app.util.auth import ActiveUserWithRole, get_current_active_user_or_device
+from app.util.breaker import CircuitOpenError
 from app.util.certificates import CompanyAPI, get_api_for_company
-from app.util.invoices import generate_invoice_number
-from fastapi import APIRouter, Depends, HTTPException
-from furs_fiscal.api import TaxesPerSeller
+from app.util.invoices import (
+    build_eor_request,
+    build_submission,
+    build_vat_lines,
+    generate_invoice_number,
+    price_vat_amounts,
+)
+from app.util.export import MEDIA_TYPES, ExportFormat, stream_invoices
+from app.util.pagination import decode_cursor, encode_cursor
+from app.util.replica import get_read_db
+from app.util.responses import FastJSONResponse, to_dicts
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from loguru import logger
 from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/invoices", tags=["invoices"])
 
+STORNO_REFERENCE_CONFLICT = (
+    "Give either storno_invoice_id or storno_invoice_number, not both"
+)
+
 
 @dataclass
 class InvoiceResponse:
     internal_id: int
     invoice_number: str
     zoi: str
-    eor: str
+    eor: Optional[str]
     issued_at: datetime
+    status: models.InvoiceStatus
+
+
+@dataclass
+class InvoicePage:
+    invoices: List[schemas.Invoice]
+    # Pass as `cursor` to get the next page; None on the last page
+    next_cursor: Optional[str]
+
+
+@dataclass
+class OutboxStatus:
+    pending: int
+    oldest_issued_at: Optional[datetime]
+    oldest_age_seconds: Optional[float]
 
 
 @dataclass
@@ -38,7 +77,60 @@ class Invoice:
     operator_tax_id: int
     prices: List[PriceEntry]
     issued_at: Optional[datetime] = None
+    # The invoice being cancelled, by internal id or by its printed number
     storno_invoice_id: Optional[int] = None
+    storno_invoice_number: Optional[str] = None
+
+    @property
+    def is_storno(self) -> bool:
+        return (
+            self.storno_invoice_id is not None or self.storno_invoice_number is not None
+        )
+
+
+@dataclass
+class BatchInvoiceResult:
+    index: int
+    success: bool
+    invoice: Optional[InvoiceResponse] = None
+    error: Optional[str] = None
+
+
+def invoice_vat_amounts(invoice: Invoice) -> List[Tuple[Decimal, Decimal, Decimal]]:
+    return price_vat_amounts((price.amount, price.tax_rate) for price in invoice.prices)
+
+
+def invoice_vat_lines(invoice: Invoice) -> List[schemas.VatLine]:
+    return build_vat_lines(invoice_vat_amounts(invoice))
+
+
+def invoice_submission(
+    invoice: Invoice,
+    company: models.Company,
+    device: models.Device,
+    storno_invoice: Optional[models.Invoice] = None,
+    storno_device: Optional[models.Device] = None,
+) -> dict:
+    is_storno = storno_invoice is not None
+    return build_submission(
+        tax_number=company.tax_id,
+        business_premise_id=device.premise.furs_id,
+        electronic_device_id=device.device_id,
+        invoice_amount=float(sum(price.amount for price in invoice.prices)),
+        vat_amounts=[
+            (float(tax_rate), float(base), float(tax))
+            for tax_rate, base, tax in invoice_vat_amounts(invoice)
+        ],
+        operator_tax_number=invoice.operator_tax_id,
+        reference_invoice_number=storno_invoice.invoice_number if is_storno else None,
+        reference_invoice_business_premise_id=(
+            storno_device.premise.furs_id if is_storno else None
+        ),
+        reference_invoice_electronic_device_id=(
+            storno_device.device_id if is_storno else None
+        ),
+        reference_invoice_issued_date=storno_invoice.issued_at if is_storno else None,
+    )
 
 
 @router.post(
@@ -49,11 +141,78 @@ class Invoice:
 )
 async def create_invoice(
     invoice: Invoice,
-    user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    user: models.User = Depends(get_current_active_user_or_device),
+    db: DbSession = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None),
 ):
+    if idempotency_key is None:
+        return await issue_invoice(invoice, user, db)
+
+    # Retries with the same key get the original response, without issuing
+    # (and fiscalizing) the invoice again. Reusing the key for a different
+    # invoice is an error.
+    request_hash = idempotency.fingerprint(invoice)
+    return await idempotency.store.run(
+        (user.company_id, idempotency_key, request_hash),
+        lambda: issue_invoice(invoice, user, db, idempotency_key, request_hash),
+        lambda: run(
+            db,
+            stored_invoice_response,
+            user.company_id,
+            idempotency_key,
+            request_hash,
+        ),
+    )
+
+
+def stored_invoice_response(
+    db: Session, company_id: int, idempotency_key: str, request_hash: str
+) -> Optional[InvoiceResponse]:
+    """
+    The response to the request the key was used with, None while there is
+    none (yet)
+    """
+    stored = idempotency_keys.get_valid(
+        db, company_id, idempotency_key, idempotency.not_before()
+    )
+    if stored is None:
+        return None
+    # Keys claimed before requests were fingerprinted match any request
+    if stored.request_hash is not None and stored.request_hash != request_hash:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency key was used for a different invoice",
+        )
+    if stored.invoice is None:
+        return None
+    return InvoiceResponse(
+        internal_id=stored.invoice.id,
+        invoice_number=stored.invoice.invoice_number,
+        zoi=stored.invoice.zoi,
+        eor=stored.invoice.eor,
+        issued_at=stored.invoice.issued_at,
+        status=stored.invoice.status,
+    )
+
+
+async def issue_invoice(
+    invoice: Invoice,
+    user: models.User,
+    db: DbSession,
+    idempotency_key: Optional[str] = None,
+    request_hash: Optional[str] = None,
+) -> InvoiceResponse:
+    if isinstance(user, schemas.DeviceUser):
+        # Device API keys come with their device, premise and company loaded
+        if invoice.device_id != user.device_id:
+            raise HTTPException(
+                status_code=403, detail="API key is not valid for this device"
+            )
+        device: models.Device = user.device
+    else:
+        device = await run(db, devices.get_by_id_with_company, invoice.device_id)
+
     # Verify that the provided device is active
-    device: models.Device = devices.get_by_id_with_premise(db, invoice.device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
     elif not device.is_active:
@@ -64,88 +223,141 @@ async def create_invoice(
         raise HTTPException(status_code=403, detail="Device not owned by company")
 
     # Verify that the company is active
-    company = companies.get_by_id(db, user.company_id)
-    if not company:
-        raise HTTPException(status_code=404, detail="Company not found???")
-    elif not company.is_active:
+    company: models.Company = device.premise.company
+    if not company.is_active:
         raise HTTPException(status_code=403, detail="Company not active")
 
-    seq_id = devices.get_inc_id(db, invoice.device_id)
-    company_api: CompanyAPI = get_api_for_company(user.company_id)
+    company_api: CompanyAPI = await get_api_for_company(user.company_id)
+
+    storno_invoice = None
+    if (
+        invoice.storno_invoice_id is not None
+        and invoice.storno_invoice_number is not None
+    ):
+        raise HTTPException(status_code=400, detail=STORNO_REFERENCE_CONFLICT)
+    elif invoice.storno_invoice_id is not None:
+        storno_invoice = await run(
+            db, invoices.get_by_id_with_device, invoice.storno_invoice_id
+        )
+    elif invoice.storno_invoice_number is not None:
+        storno_invoice = await run(
+            db,
+            invoices.get_by_number_with_device,
+            user.company_id,
+            invoice.storno_invoice_number,
+        )
+    if invoice.is_storno and (
+        not storno_invoice or storno_invoice.company_id != user.company_id
+    ):
+        raise HTTPException(status_code=404, detail="Storno invoice not found")
+
+    submission = invoice_submission(
+        invoice,
+        company,
+        device,
+        storno_invoice,
+        storno_invoice.device if storno_invoice else None,
+    )
+    # Committing the claim or the number expires the loaded rows
+    tax_number = company.tax_id
+    premise_furs_id = device.premise.furs_id
+    electronic_device_id = device.device_id
+    device_id, premise_id = device.id, device.premise_id
+
+    if idempotency_key is not None:
+        # The claim is committed right away, so that concurrent requests with
+        # the same key in other workers see it without waiting for this one
+        claimed = await run(
+            db,
+            idempotency_keys.claim,
+            user.company_id,
+            idempotency_key,
+            request_hash,
+            idempotency.not_before(),
+            idempotency.abandoned_before(),
+        )
+        if not claimed:
+            stored = await run(
+                db,
+                stored_invoice_response,
+                user.company_id,
+                idempotency_key,
+                request_hash,
+            )
+            if stored is None:
+                raise HTTPException(
+                    status_code=409,
+                    detail="Idempotency key is in use by another request",
+                )
+            return stored
 
-    is_storno = invoice.storno_invoice_id is not None
-    if is_storno:
-        storno_invoice = invoices.get_by_id(db, invoice.storno_invoice_id)
-        storno_device: models.Device = devices.get_by_id_with_premise(db, storno_invoice.device_id)
-        if not storno_device:
-            raise HTTPException(status_code=404, detail="Storno device not found")
-        if not storno_invoice:
-            raise HTTPException(status_code=404, detail="Storno invoice not found")
+    # The number is committed right away, so the device row lock is held for a
+    # single statement rather than across the FURS round trip. If the invoice
+    # can't be stored after all, its number stays unused.
+    numbers, now = await run(db, sequence.take_numbers, device_id)
+    seq_id = numbers[0]
+    await run(db, Session.commit)
 
     subsequent_submit = not invoice.issued_at is None
     if invoice.issued_at is None:
-        invoice.issued_at = datetime.now(tz=pytz.UTC)
+        invoice.issued_at = now
 
     total_invoice_amount = sum(price.amount for price in invoice.prices)
 
-    zoi = company_api.api.calculate_zoi(
-        company.tax_id,
+    zoi = await company_api.calculate_zoi(
+        tax_number,
         invoice.issued_at,
         str(seq_id),
-        device.premise.furs_id,
-        device.device_id,
+        premise_furs_id,
+        electronic_device_id,
         total_invoice_amount,
     )
 
-    seller_one = TaxesPerSeller(
-        other_taxes_amount=None,
-        exempt_vat_taxable_amount=None,
-        reverse_vat_taxable_amount=None,
-        non_taxable_amount=None,
-        special_tax_rules_amount=None,
-        seller_tax_number=None,
-    )
-
-    for price in invoice.prices:
-        seller_one.add_vat_amount(
-            float(price.tax_rate),
-            float(price.amount),
-            float(price.amount * (price.tax_rate / 100)),
-        )
-
     invoice_number = generate_invoice_number(
-        device.premise.furs_id, device.device_id, seq_id
+        premise_furs_id, electronic_device_id, seq_id
     )
 
-    try:
-        eor = company_api.api.get_invoice_eor(
-            zoi=zoi,
-            tax_number=company.tax_id,
-            issued_date=invoice.issued_at,
-            invoice_number=invoice_number,
-            business_premise_id=device.premise.furs_id,
-            electronic_device_id=device.device_id,
-            invoice_amount=float(total_invoice_amount),
-            taxes_per_seller=[seller_one],
-            operator_tax_number=invoice.operator_tax_id,
-            subsequent_submit=subsequent_submit,
-            reference_invoice_number=storno_invoice.invoice_number
-            if is_storno
-            else None,
-            reference_invoice_business_premise_id=storno_device.premise.furs_id
-            if is_storno
-            else None,
-            reference_invoice_electronic_device_id=storno_invoice.device_id
-            if is_storno
-            else None,
-            reference_invoice_issued_date=storno_invoice.issued_at if is_storno else None,
-        )
-    except Exception as e:
-        logger.warning("Failed to get EOR for invoice", exc_info=e)
-        raise HTTPException(status_code=502, detail=str(e))
+    # In outbox mode (or while FURS is unavailable) don't wait for FURS, the
+    # outbox worker will obtain the EOR later
+    eor = None
+    invoice_status = models.InvoiceStatus.PENDING
+    if not FURS_OUTBOX_MODE:
+        try:
+            eor = await company_api.get_invoice_eor(
+                **build_eor_request(
+                    submission,
+                    zoi=zoi,
+                    issued_at=invoice.issued_at,
+                    invoice_number=invoice_number,
+                    subsequent_submit=subsequent_submit,
+                )
+            )
+            invoice_status = models.InvoiceStatus.SUBMITTED
+        except CircuitOpenError as e:
+            if not FURS_DEFER_WHEN_OPEN:
+                # Nothing was sent to FURS, so the number is given back unless
+                # another request has taken a later one in the meantime
+                await run(db, devices.release_id, device_id, seq_id)
+                if idempotency_key is not None:
+                    await run(
+                        db, idempotency_keys.release, user.company_id, idempotency_key
+                    )
+                await run(db, Session.commit)
+                raise HTTPException(status_code=503, detail=str(e))
+            logger.info(f"Deferring submission of invoice {invoice_number}: {e}")
+        except Exception as e:
+            logger.warning("Failed to get EOR for invoice", exc_info=e)
+            # FURS may have recorded the invoice even though the request failed,
+            # so the sequence number stays taken
+            if idempotency_key is not None:
+                await run(
+                    db, idempotency_keys.release, user.company_id, idempotency_key
+                )
+            raise HTTPException(status_code=502, detail=str(e))
 
-    created_invoice = invoices.create(
+    invoice_id = await run(
         db,
+        invoices.create,
         schemas.InvoiceCreate(
             zoi=zoi,
             eor=eor,
@@ -153,20 +365,258 @@ async def create_invoice(
             total=total_invoice_amount,
             user_id=user.id,
             company_id=user.company_id,
-            device_id=device.id,
+            device_id=device_id,
+            premise_id=premise_id,
             issued_at=invoice.issued_at,
+            status=invoice_status,
+            submission=submission,
+            vat_lines=invoice_vat_lines(invoice),
         ),
+        commit=False,
     )
+    if idempotency_key is not None:
+        await run(
+            db,
+            idempotency_keys.set_invoice,
+            user.company_id,
+            idempotency_key,
+            invoice_id,
+        )
+    await run(db, Session.commit)
 
     return InvoiceResponse(
         invoice_number=invoice_number,
-        internal_id=created_invoice.id,
+        internal_id=invoice_id,
         zoi=zoi,
         eor=eor,
         issued_at=invoice.issued_at,
+        status=invoice_status,
     )
 
 
+def record_submissions(
+    db: Session, invoice_ids: List[int], eors: List[Union[str, BaseException]]
+):
+    """
+    Store the EORs of a batch's invoices, hand the ones that failed over to the
+    outbox, and commit
+    """
+    retry_at = datetime.utcnow() + outbox.backoff(1)
+    for invoice_id, eor in zip(invoice_ids, eors):
+        if isinstance(eor, BaseException):
+            invoices.set_submit_failed(db, invoice_id, str(eor), retry_at)
+        else:
+            invoices.set_submitted(db, invoice_id, eor)
+    db.commit()
+
+
+@router.post(
+    "/create/batch",
+    summary="Create & issue multiple invoices",
+    status_code=200,
+    response_model=List[BatchInvoiceResult],
+)
+async def create_invoices(
+    batch: List[Invoice],
+    user: models.User = Depends(get_current_active_user_or_device),
+    db: DbSession = Depends(get_db),
+):
+    if len(batch) > INVOICE_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {INVOICE_BATCH_MAX_SIZE} invoices can be issued at once",
+        )
+
+    # Verify that the company is active
+    company = await run(db, companies.get_by_id, user.company_id)
+    if not company:
+        raise HTTPException(status_code=404, detail="Company not found???")
+    elif not company.is_active:
+        raise HTTPException(status_code=403, detail="Company not active")
+    company_api: CompanyAPI = await get_api_for_company(user.company_id)
+
+    # Load all referenced devices and storno invoices up front
+    batch_devices = {
+        device.id: device
+        for device in await run(
+            db,
+            devices.get_by_ids_with_premise,
+            list({invoice.device_id for invoice in batch}),
+        )
+    }
+    storno_invoices = {
+        storno_invoice.id: storno_invoice
+        for storno_invoice in await run(
+            db,
+            invoices.get_by_ids_with_device,
+            list(
+                {
+                    invoice.storno_invoice_id
+                    for invoice in batch
+                    if invoice.storno_invoice_id is not None
+                }
+            ),
+        )
+    }
+    storno_invoices_by_number = {
+        storno_invoice.invoice_number: storno_invoice
+        for storno_invoice in await run(
+            db,
+            invoices.get_by_numbers_with_device,
+            user.company_id,
+            list(
+                {
+                    invoice.storno_invoice_number
+                    for invoice in batch
+                    if invoice.storno_invoice_number is not None
+                }
+            ),
+        )
+    }
+
+    results = [BatchInvoiceResult(index=i, success=False) for i in range(len(batch))]
+    accepted = []
+    batch_stornos = {}
+    for i, invoice in enumerate(batch):
+        device = batch_devices.get(invoice.device_id)
+        storno_invoice = batch_stornos[i] = (
+            storno_invoices.get(invoice.storno_invoice_id)
+            if invoice.storno_invoice_id is not None
+            else storno_invoices_by_number.get(invoice.storno_invoice_number)
+        )
+        if isinstance(user, schemas.DeviceUser) and invoice.device_id != user.device_id:
+            results[i].error = "API key is not valid for this device"
+        elif not device:
+            results[i].error = "Device not found"
+        elif not device.is_active:
+            results[i].error = "Device not active"
+        elif device.premise.company_id != user.company_id:
+            results[i].error = "Device not owned by company"
+        elif (
+            invoice.storno_invoice_id is not None
+            and invoice.storno_invoice_number is not None
+        ):
+            results[i].error = STORNO_REFERENCE_CONFLICT
+        elif invoice.is_storno and (
+            not storno_invoice or storno_invoice.company_id != user.company_id
+        ):
+            results[i].error = "Storno invoice not found"
+        else:
+            accepted.append(i)
+
+    # Take sequence numbers for each device with a single statement, and
+    # commit them right away so the device row lock is held only briefly
+    seq_ids = {}
+    accepted_per_device = {}
+    subsequent_submit = {i: batch[i].issued_at is not None for i in accepted}
+    for i in accepted:
+        accepted_per_device.setdefault(batch[i].device_id, []).append(i)
+    for device_id, indices in accepted_per_device.items():
+        numbers, now = await run(db, sequence.take_numbers, device_id, len(indices))
+        await run(db, Session.commit)
+        seq_ids.update(zip(indices, numbers))
+        for i in indices:
+            if batch[i].issued_at is None:
+                batch[i].issued_at = now
+
+    zois = await company_api.calculate_zois(
+        [
+            (
+                company.tax_id,
+                batch[i].issued_at,
+                str(seq_ids[i]),
+                batch_devices[batch[i].device_id].premise.furs_id,
+                batch_devices[batch[i].device_id].device_id,
+                sum(price.amount for price in batch[i].prices),
+            )
+            for i in accepted
+        ]
+    )
+
+    to_create = []
+    for i, zoi in zip(accepted, zois):
+        invoice = batch[i]
+        device = batch_devices[invoice.device_id]
+        storno_invoice = batch_stornos[i]
+        to_create.append(
+            schemas.InvoiceCreate(
+                zoi=zoi,
+                eor=None,
+                invoice_number=generate_invoice_number(
+                    device.premise.furs_id, device.device_id, seq_ids[i]
+                ),
+                total=sum(price.amount for price in invoice.prices),
+                user_id=user.id,
+                company_id=user.company_id,
+                device_id=device.id,
+                premise_id=device.premise_id,
+                issued_at=invoice.issued_at,
+                status=models.InvoiceStatus.PENDING,
+                submission=invoice_submission(
+                    invoice,
+                    company,
+                    device,
+                    storno_invoice,
+                    storno_invoice.device if storno_invoice else None,
+                ),
+                vat_lines=invoice_vat_lines(invoice),
+            )
+        )
+
+    # The invoices are stored before they're submitted, like in the outbox, so
+    # that none get lost if the worker dies while waiting for FURS. They're
+    # leased to this request meanwhile, the outbox submits any left pending.
+    lease_until = None
+    if not FURS_OUTBOX_MODE:
+        lease_until = datetime.utcnow() + timedelta(seconds=FURS_OUTBOX_LEASE_SECONDS)
+    created_ids = await run(db, invoices.create_many, to_create, lease_until)
+
+    eors = [None] * len(to_create)
+    if not FURS_OUTBOX_MODE:
+        eors = await asyncio.gather(
+            *(
+                company_api.get_invoice_eor(
+                    **build_eor_request(
+                        created.submission,
+                        zoi=created.zoi,
+                        issued_at=created.issued_at,
+                        invoice_number=created.invoice_number,
+                        subsequent_submit=subsequent_submit[i],
+                    )
+                )
+                for i, created in zip(accepted, to_create)
+            ),
+            return_exceptions=True,
+        )
+        await run(db, record_submissions, created_ids, eors)
+
+    for i, created, internal_id, eor in zip(accepted, to_create, created_ids, eors):
+        if isinstance(eor, BaseException):
+            logger.warning("Failed to get EOR for invoice", exc_info=eor)
+            # An error, as for a single invoice, unless submissions are
+            # deferred while FURS is unavailable. The invoice is stored either
+            # way, so it's returned too, and the outbox submits it later.
+            deferred = isinstance(eor, CircuitOpenError) and FURS_DEFER_WHEN_OPEN
+            if not deferred:
+                results[i].error = str(eor)
+            results[i].success = deferred
+        else:
+            created.eor = eor
+            if eor is not None:
+                created.status = models.InvoiceStatus.SUBMITTED
+            results[i].success = True
+        results[i].invoice = InvoiceResponse(
+            internal_id=internal_id,
+            invoice_number=created.invoice_number,
+            zoi=created.zoi,
+            eor=created.eor,
+            issued_at=created.issued_at,
+            status=created.status,
+        )
+
+    return results
+
+
 @router.get(
     "/get/{invoice_id}",
     summary="Get an invoice by ID",
@@ -178,9 +628,9 @@ async def get_invoice(
     user: models.User = Depends(
         ActiveUserWithRole([models.UserRole.ORGANIZATION_ADMIN, models.UserRole.ADMIN])
     ),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_read_db),
 ):
-    invoice = invoices.get_by_id(db, invoice_id)
+    invoice = await run(db, invoices.get_by_id, invoice_id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     elif invoice.company_id != user.company_id:
@@ -189,29 +639,209 @@ async def get_invoice(
     return invoice
 
 
+@router.get(
+    "/by-number/{invoice_number}",
+    summary="Get an invoice by its printed invoice number",
+    status_code=200,
+    response_model=schemas.Invoice,
+)
+async def get_invoice_by_number(
+    invoice_number: str,
+    user: models.User = Depends(
+        ActiveUserWithRole([models.UserRole.ORGANIZATION_ADMIN, models.UserRole.ADMIN])
+    ),
+    db: DbSession = Depends(get_read_db),
+):
+    invoice = await run(
+        db, invoices.get_by_number_with_device, user.company_id, invoice_number
+    )
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return invoice
+
+
+@router.get(
+    "/by-zoi/{zoi}",
+    summary="Get an invoice by its ZOI",
+    status_code=200,
+    response_model=schemas.Invoice,
+)
+async def get_invoice_by_zoi(
+    zoi: str,
+    user: models.User = Depends(
+        ActiveUserWithRole([models.UserRole.ORGANIZATION_ADMIN, models.UserRole.ADMIN])
+    ),
+    db: DbSession = Depends(get_read_db),
+):
+    # ZOIs are stored as lowercase hex
+    invoice = await run(db, invoices.get_by_zoi, user.company_id, zoi.lower())
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return invoice
+
+
+@router.get(
+    "/by-eor/{eor}",
+    summary="Get an invoice by its EOR",
+    status_code=200,
+    response_model=schemas.Invoice,
+)
+async def get_invoice_by_eor(
+    eor: str,
+    user: models.User = Depends(
+        ActiveUserWithRole([models.UserRole.ORGANIZATION_ADMIN, models.UserRole.ADMIN])
+    ),
+    db: DbSession = Depends(get_read_db),
+):
+    invoice = await run(db, invoices.get_by_eor, user.company_id, eor)
+    if not invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return invoice
+
+
+def invoice_page(
+    db: Session,
+    invoice_filter: schemas.InvoiceFilter,
+    limit: int,
+    cursor: Optional[str],
+    company_id: Optional[int] = None,
+) -> FastJSONResponse:
+    before = decode_cursor(cursor) if cursor is not None else None
+    page = invoices.get_page(db, invoice_filter, limit, company_id, before)
+    # Shaped like `InvoicePage`
+    return FastJSONResponse(
+        dict(
+            invoices=to_dicts(page),
+            next_cursor=(
+                encode_cursor(page[-1].issued_at, page[-1].id)
+                if len(page) == limit
+                else None
+            ),
+        )
+    )
+
+
 @router.get(
     "/list",
-    summary="List invoices",
+    summary="List invoices, newest first",
     status_code=200,
-    response_model=List[schemas.Invoice],
+    response_model=InvoicePage,
 )
 async def list_invoices(
+    invoice_filter: schemas.InvoiceFilter = Depends(),
+    limit: int = Query(INVOICE_PAGE_SIZE, ge=1, le=INVOICE_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
     user: models.User = Depends(
         ActiveUserWithRole([models.UserRole.ORGANIZATION_ADMIN, models.UserRole.ADMIN])
     ),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_read_db),
 ):
-    return invoices.get_by_company_id(db, user.company_id)
+    return await run(db, invoice_page, invoice_filter, limit, cursor, user.company_id)
 
 
 @router.get(
     "/list/all",
-    summary="List all invoices",
+    summary="List all invoices, newest first",
     status_code=200,
-    response_model=List[schemas.Invoice],
+    response_model=InvoicePage,
 )
 async def list_all_invoices(
+    invoice_filter: schemas.InvoiceFilter = Depends(),
+    limit: int = Query(INVOICE_PAGE_SIZE, ge=1, le=INVOICE_PAGE_MAX_SIZE),
+    cursor: Optional[str] = None,
+    company_id: Optional[int] = None,
+    _: models.User = Depends(ActiveUserWithRole([models.UserRole.ADMIN])),
+    db: DbSession = Depends(get_read_db),
+):
+    return await run(db, invoice_page, invoice_filter, limit, cursor, company_id)
+
+
+def export_response(
+    invoice_filter: schemas.InvoiceFilter,
+    export_format: ExportFormat,
+    min_lsn: Optional[int],
+    company_id: Optional[int] = None,
+) -> StreamingResponse:
+    filename = f"invoices.{export_format.value}"
+    return StreamingResponse(
+        stream_invoices(
+            invoice_filter,
+            export_format,
+            company_id,
+            replica.read_session_factory(min_lsn),
+        ),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get(
+    "/export",
+    summary="Export invoices as NDJSON or CSV, oldest first",
+    response_class=StreamingResponse,
+)
+async def export_invoices(
+    invoice_filter: schemas.InvoiceFilter = Depends(),
+    format: ExportFormat = ExportFormat.NDJSON,
+    user: models.User = Depends(
+        ActiveUserWithRole([models.UserRole.ORGANIZATION_ADMIN, models.UserRole.ADMIN])
+    ),
+    min_lsn: Optional[int] = Depends(replica.client_lsn),
+):
+    return export_response(invoice_filter, format, min_lsn, user.company_id)
+
+
+@router.get(
+    "/export/all",
+    summary="Export all invoices as NDJSON or CSV, oldest first",
+    response_class=StreamingResponse,
+)
+async def export_all_invoices(
+    invoice_filter: schemas.InvoiceFilter = Depends(),
+    format: ExportFormat = ExportFormat.NDJSON,
+    company_id: Optional[int] = None,
+    _: models.User = Depends(ActiveUserWithRole([models.UserRole.ADMIN])),
+    min_lsn: Optional[int] = Depends(replica.client_lsn),
+):
+    return export_response(invoice_filter, format, min_lsn, company_id)
+
+
+def outbox_status(db: Session, company_id: Optional[int] = None) -> OutboxStatus:
+    pending, oldest_issued_at = invoices.get_outbox_stats(db, company_id)
+    return OutboxStatus(
+        pending=pending,
+        oldest_issued_at=oldest_issued_at,
+        oldest_age_seconds=(
+            (datetime.utcnow() - oldest_issued_at).total_seconds()
+            if oldest_issued_at
+            else None
+        ),
+    )
+
+
+@router.get(
+    "/outbox",
+    summary="Get the state of the FURS submission outbox",
+    status_code=200,
+    response_model=OutboxStatus,
+)
+async def get_outbox(
+    user: models.User = Depends(
+        ActiveUserWithRole([models.UserRole.ORGANIZATION_ADMIN, models.UserRole.ADMIN])
+    ),
+    db: DbSession = Depends(get_db),
+):
+    return await run(db, outbox_status, user.company_id)
+
+
+@router.get(
+    "/outbox/all",
+    summary="Get the state of the FURS submission outbox for all companies",
+    status_code=200,
+    response_model=OutboxStatus,
+)
+async def get_outbox_all(
     _: models.User = Depends(ActiveUserWithRole([models.UserRole.ADMIN])),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_db),
 ):
-    return invoices.get_all(db)
+    return await run(db, outbox_status)
@@ -1,12 +1,12 @@
 from typing import List
 
-from app.database import get_db
+from app.database import DbSession, run
 from app.database.crud import premises
 from app.database.models import UserRole
 from app.database.schemas import BusinessPremise, User
 from app.util.auth import ActiveUserWithRole, get_current_active_user
+from app.util.replica import get_read_db
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
 
 router = APIRouter(prefix="/premises", tags=["premises"])
 
@@ -17,9 +17,9 @@ router = APIRouter(prefix="/premises", tags=["premises"])
     response_model=List[BusinessPremise],
 )
 async def get_premises(
-    user: User = Depends(get_current_active_user), db: Session = Depends(get_db)
+    user: User = Depends(get_current_active_user), db: DbSession = Depends(get_read_db)
 ):
-    return premises.get_all_for_company(db, user.company_id)
+    return await run(db, premises.get_all_for_company, user.company_id)
 
 
 @router.get(
@@ -29,6 +29,6 @@ async def get_premises(
 )
 async def get_all_premises(
     _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_read_db),
 ):
-    return premises.get_all(db)
+    return await run(db, premises.get_all)
@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import List, Optional
+
+from app.database import DbSession, run
+from app.database.crud import reports
+from app.database.models import UserRole
+from app.database.schemas import User
+from app.util.auth import ActiveUserWithRole
+from app.util.replica import get_read_db
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+router = APIRouter(prefix="/reports", tags=["reports"])
+
+
+@dataclass
+class DailySales:
+    day: date
+    invoices: int
+    total: Decimal
+
+
+@dataclass
+class VatTotal:
+    tax_rate: Decimal
+    base: Decimal
+    tax: Decimal
+
+
+@dataclass
+class SalesReport:
+    date_from: date
+    date_to: date
+    invoices: int
+    total: Decimal
+    vat: List[VatTotal]
+    days: List[DailySales]
+
+
+def sales_report(
+    db: Session,
+    date_from: date,
+    date_to: date,
+    company_id: Optional[int],
+    premise_id: Optional[int],
+    device_id: Optional[int],
+) -> SalesReport:
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to is before date_from")
+    days = [
+        DailySales(day=day, invoices=invoices, total=total)
+        for day, invoices, total in reports.get_daily_sales(
+            db, date_from, date_to, company_id, premise_id, device_id
+        )
+    ]
+    vat = [
+        VatTotal(tax_rate=tax_rate, base=base, tax=tax)
+        for tax_rate, base, tax in reports.get_vat_totals(
+            db, date_from, date_to, company_id, premise_id, device_id
+        )
+    ]
+    return SalesReport(
+        date_from=date_from,
+        date_to=date_to,
+        invoices=sum(day.invoices for day in days),
+        total=sum((day.total for day in days), Decimal(0)),
+        vat=vat,
+        days=days,
+    )
+
+
+@router.get(
+    "/sales",
+    summary="Get sales and VAT totals for a period (both days inclusive)",
+    response_model=SalesReport,
+)
+async def get_sales_report(
+    date_from: date,
+    date_to: date,
+    premise_id: Optional[int] = None,
+    device_id: Optional[int] = None,
+    user: User = Depends(
+        ActiveUserWithRole([UserRole.ORGANIZATION_ADMIN, UserRole.ADMIN])
+    ),
+    db: DbSession = Depends(get_read_db),
+):
+    return await run(
+        db, sales_report, date_from, date_to, user.company_id, premise_id, device_id
+    )
+
+
+@router.get(
+    "/sales/all",
+    summary="Get sales and VAT totals for a period across all companies",
+    response_model=SalesReport,
+)
+async def get_all_sales_report(
+    date_from: date,
+    date_to: date,
+    company_id: Optional[int] = None,
+    premise_id: Optional[int] = None,
+    device_id: Optional[int] = None,
+    _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
+    db: DbSession = Depends(get_read_db),
+):
+    return await run(
+        db, sales_report, date_from, date_to, company_id, premise_id, device_id
+    )
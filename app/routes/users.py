@@ -1,11 +1,12 @@
 from typing import List
 
-from app.database import get_db
+from app.database import DbSession, get_db, run
 from app.database.crud import users
 from app.database.models import UserRole
 from app.database.schemas import User
 from app.util.auth import ActiveUserWithRole
 from app.util.datatypes import ActionResponse
+from app.util.replica import get_read_db
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
@@ -14,30 +15,23 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 @router.get("/list", summary="Get a list of all users", response_model=List[User])
 async def get_users(
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_read_db),
     user: User = Depends(
         ActiveUserWithRole([UserRole.ORGANIZATION_ADMIN, UserRole.ADMIN])
     ),
 ):
-    return users.get_by_company_id(db, user.company_id)
+    return await run(db, users.get_by_company_id, user.company_id)
 
 
 @router.get("/list/all", summary="Get a list of all users", response_model=List[User])
 async def get_users(
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_read_db),
     _: User = Depends(ActiveUserWithRole([UserRole.ADMIN])),
 ):
-    return users.get_all(db)
+    return await run(db, users.get_all)
 
 
-@router.delete("/delete/{user_id}", summary="Delete a user")
-async def delete_user(
-    user_id: int,
-    db: Session = Depends(get_db),
-    user: User = Depends(
-        ActiveUserWithRole([UserRole.ADMIN, UserRole.ORGANIZATION_ADMIN])
-    ),
-):
+def get_manageable_user(db: Session, user: User, user_id: int):
     target_user = users.get_by_id(db, user_id)
     if target_user is None:
         raise HTTPException(
@@ -47,15 +41,56 @@ async def delete_user(
     if target_user.role == UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can not delete other admins",
+            detail="You can not modify other admins",
         )
 
     if target_user.company_id != user.company_id and user.role != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only delete users in your own company",
+            detail="You can only modify users in your own company",
         )
+    return target_user
+
 
-    users.delete(db, user_id)
+@router.delete("/delete/{user_id}", summary="Delete a user")
+async def delete_user(
+    user_id: int,
+    db: DbSession = Depends(get_db),
+    user: User = Depends(
+        ActiveUserWithRole([UserRole.ADMIN, UserRole.ORGANIZATION_ADMIN])
+    ),
+):
+    await run(db, get_manageable_user, user, user_id)
+    await run(db, users.delete, user_id)
 
     return ActionResponse(success=True)
+
+
+@router.post(
+    "/disable/{user_id}", summary="Disable a user", response_model=ActionResponse
+)
+async def disable_user(
+    user_id: int,
+    db: DbSession = Depends(get_db),
+    user: User = Depends(
+        ActiveUserWithRole([UserRole.ADMIN, UserRole.ORGANIZATION_ADMIN])
+    ),
+):
+    await run(db, get_manageable_user, user, user_id)
+    await run(db, users.set_active, user_id, False)
+    return ActionResponse(success=True)
+
+
+@router.post(
+    "/enable/{user_id}", summary="Enable a user", response_model=ActionResponse
+)
+async def enable_user(
+    user_id: int,
+    db: DbSession = Depends(get_db),
+    user: User = Depends(
+        ActiveUserWithRole([UserRole.ADMIN, UserRole.ORGANIZATION_ADMIN])
+    ),
+):
+    await run(db, get_manageable_user, user, user_id)
+    await run(db, users.set_active, user_id, True)
+    return ActionResponse(success=True)
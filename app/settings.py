@@ -6,17 +6,150 @@ from starlette.config import Config
 config = Config(os.getenv("CREDPATH") or ".env")
 
 DATABASE_URL = config("DATABASE_URL", cast=str)
+# Serve requests through asyncpg (PostgreSQL only, needs the `asyncpg` package);
+# background workers keep using the blocking driver of DATABASE_URL
+DATABASE_ASYNC = config("DATABASE_ASYNC", cast=bool, default=False)
+# Connections kept open per engine and worker, and opened on top of them during
+# bursts; requests wait up to DATABASE_POOL_TIMEOUT seconds for one
+DATABASE_POOL_SIZE = config("DATABASE_POOL_SIZE", cast=int, default=20)
+DATABASE_MAX_OVERFLOW = config("DATABASE_MAX_OVERFLOW", cast=int, default=20)
+DATABASE_POOL_TIMEOUT = config("DATABASE_POOL_TIMEOUT", cast=float, default=30)
+# Test connections before handing them out, e.g. behind proxies that drop
+# idle connections
+DATABASE_POOL_PRE_PING = config("DATABASE_POOL_PRE_PING", cast=bool, default=False)
+# Prepared statements cached per asyncpg connection; 0 for PgBouncer in
+# transaction mode
+DATABASE_STATEMENT_CACHE_SIZE = config(
+    "DATABASE_STATEMENT_CACHE_SIZE", cast=int, default=100
+)
+# Hot standby serving read-only requests while it lags DATABASE_URL by at most
+# DATABASE_REPLICA_MAX_LAG seconds, measured every DATABASE_REPLICA_LAG_INTERVAL
+DATABASE_REPLICA_URL = config("DATABASE_REPLICA_URL", cast=str, default=None)
+DATABASE_REPLICA_MAX_LAG = config("DATABASE_REPLICA_MAX_LAG", cast=float, default=5)
+DATABASE_REPLICA_LAG_INTERVAL = config(
+    "DATABASE_REPLICA_LAG_INTERVAL", cast=float, default=1
+)
 ACCESS_TOKEN_EXPIRE_MINUTES = config(
     "ACCESS_TOKEN_EXPIRE_MINUTES", cast=int, default=1440
 )
 JWT_KEY = config("JWT_KEY", cast=str)
 JWT_ALGORITHM = config("JWT_ALGORITHM", cast=str, default="HS256")
+# Key for hashing device API keys, separate from JWT_KEY; changing it
+# invalidates all issued keys. Without it, device API keys are disabled.
+API_KEY_SECRET = config("API_KEY_SECRET", cast=str, default=None)
+# Argon2 parameters for new password hashes; existing hashes are upgraded on
+# the next successful login
+ARGON2_TIME_COST = config("ARGON2_TIME_COST", cast=int, default=3)
+ARGON2_MEMORY_COST = config("ARGON2_MEMORY_COST", cast=int, default=65536)
+ARGON2_PARALLELISM = config("ARGON2_PARALLELISM", cast=int, default=4)
+# Worker processes for Argon2; 0 hashes in the FURS thread pool instead
+PASSWORD_HASHING_PROCESSES = config("PASSWORD_HASHING_PROCESSES", cast=int, default=2)
+# Logins hashed at once, and logins allowed to wait before 503 is returned
+LOGIN_CONCURRENCY = config("LOGIN_CONCURRENCY", cast=int, default=2)
+LOGIN_QUEUE_SIZE = config("LOGIN_QUEUE_SIZE", cast=int, default=100)
+# Authenticated users are cached per worker; 0 disables the cache
+PRINCIPAL_CACHE_TTL_SECONDS = config(
+    "PRINCIPAL_CACHE_TTL_SECONDS", cast=float, default=30
+)
+PRINCIPAL_CACHE_SIZE = config("PRINCIPAL_CACHE_SIZE", cast=int, default=10000)
 
 CERTIFICATE_DIR = Path(
     config("CERTIFICATE_DIR", cast=str, default="./data/certificates")
 )
 CERTIFICATE_KEY = bytes.fromhex(config("CERTIFICATE_KEY", cast=str))
+# Load certificates on first use instead of at startup, keeping at most
+# CERTIFICATE_CACHE_SIZE of them and dropping those idle for too long
+CERTIFICATE_LAZY_LOADING = config("CERTIFICATE_LAZY_LOADING", cast=bool, default=False)
+CERTIFICATE_CACHE_SIZE = config("CERTIFICATE_CACHE_SIZE", cast=int, default=1000)
+CERTIFICATE_IDLE_SECONDS = config("CERTIFICATE_IDLE_SECONDS", cast=float, default=3600)
+# How long a company that failed to load lazily is answered with 404 before
+# loading it is tried again
+CERTIFICATE_NEGATIVE_TTL_SECONDS = config(
+    "CERTIFICATE_NEGATIVE_TTL_SECONDS", cast=float, default=30
+)
+# Threads parsing certificates in parallel on startup and refresh
+CERTIFICATE_LOAD_WORKERS = config(
+    "CERTIFICATE_LOAD_WORKERS", cast=int, default=os.cpu_count() or 1
+)
+# Check for changed certificates and companies every this many seconds (0 only
+# refreshes on request)
+CERTIFICATE_REFRESH_INTERVAL = config(
+    "CERTIFICATE_REFRESH_INTERVAL", cast=float, default=0
+)
 FURS_API_TIMEOUT = config("FURS_API_TIMEOUT", cast=int, default=10)
 FURS_API_PRODUCTION = config("FURS_API_PRODUCTION", cast=bool, default=False)
+# Overrides the FURS server, e.g. to point the relay at `python -m furs_mock`
+FURS_API_ENDPOINT = config("FURS_API_ENDPOINT", cast=str, default=None)
+FURS_API_WORKERS = config("FURS_API_WORKERS", cast=int, default=256)
+FURS_API_COMPANY_CONCURRENCY = config(
+    "FURS_API_COMPANY_CONCURRENCY", cast=int, default=32
+)
+# Premises registered with FURS at once, in the background after startup
+PREMISE_REGISTRATION_CONCURRENCY = config(
+    "PREMISE_REGISTRATION_CONCURRENCY", cast=int, default=8
+)
+# How long a worker has to register a premise before others may try again
+PREMISE_REGISTRATION_LEASE_SECONDS = config(
+    "PREMISE_REGISTRATION_LEASE_SECONDS", cast=float, default=300
+)
+
+# Per-company circuit breakers around FURS calls; the call timeout adapts to
+# the observed p99 latency, up to FURS_API_TIMEOUT
+FURS_API_MIN_TIMEOUT = config("FURS_API_MIN_TIMEOUT", cast=float, default=1.0)
+FURS_API_TIMEOUT_P99_FACTOR = config(
+    "FURS_API_TIMEOUT_P99_FACTOR", cast=float, default=3.0
+)
+FURS_BREAKER_WINDOW = config("FURS_BREAKER_WINDOW", cast=float, default=60)
+FURS_BREAKER_MIN_REQUESTS = config("FURS_BREAKER_MIN_REQUESTS", cast=int, default=20)
+FURS_BREAKER_ERROR_THRESHOLD = config(
+    "FURS_BREAKER_ERROR_THRESHOLD", cast=float, default=0.5
+)
+FURS_BREAKER_OPEN_SECONDS = config("FURS_BREAKER_OPEN_SECONDS", cast=float, default=30)
+FURS_BREAKER_HALF_OPEN_PROBES = config(
+    "FURS_BREAKER_HALF_OPEN_PROBES", cast=int, default=1
+)
+# Issue invoices as pending (see FURS_OUTBOX_MODE) instead of failing while the
+# circuit is open
+FURS_DEFER_WHEN_OPEN = config("FURS_DEFER_WHEN_OPEN", cast=bool, default=True)
+
+# Worker processes for ZOI signatures; 0 signs in the FURS thread pool instead
+ZOI_SIGNING_PROCESSES = config("ZOI_SIGNING_PROCESSES", cast=int, default=0)
+
+# Outbox mode persists invoices without waiting for FURS; the EOR is obtained
+# later by a background worker (subsequent submit)
+FURS_OUTBOX_MODE = config("FURS_OUTBOX_MODE", cast=bool, default=False)
+FURS_OUTBOX_BATCH_SIZE = config("FURS_OUTBOX_BATCH_SIZE", cast=int, default=50)
+FURS_OUTBOX_POLL_INTERVAL = config("FURS_OUTBOX_POLL_INTERVAL", cast=float, default=5)
+FURS_OUTBOX_BACKOFF_BASE = config("FURS_OUTBOX_BACKOFF_BASE", cast=float, default=5)
+FURS_OUTBOX_BACKOFF_MAX = config("FURS_OUTBOX_BACKOFF_MAX", cast=float, default=600)
+# How long a worker has to submit the invoices it picked up from the outbox
+# before others may pick them up again
+FURS_OUTBOX_LEASE_SECONDS = config("FURS_OUTBOX_LEASE_SECONDS", cast=float, default=300)
+
+IDEMPOTENCY_TTL_SECONDS = config("IDEMPOTENCY_TTL_SECONDS", cast=int, default=86400)
+# A key claimed this long ago without an invoice belongs to a request that
+# crashed, and may be claimed again
+IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS = config(
+    "IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS", cast=int, default=300
+)
+IDEMPOTENCY_CACHE_SIZE = config("IDEMPOTENCY_CACHE_SIZE", cast=int, default=10000)
+INVOICE_BATCH_MAX_SIZE = config("INVOICE_BATCH_MAX_SIZE", cast=int, default=5000)
+# Invoices per page of a listing, by default and at most
+INVOICE_PAGE_SIZE = config("INVOICE_PAGE_SIZE", cast=int, default=100)
+INVOICE_PAGE_MAX_SIZE = config("INVOICE_PAGE_MAX_SIZE", cast=int, default=1000)
+# Invoices fetched (and sent) at once while streaming an export
+INVOICE_EXPORT_BATCH_SIZE = config("INVOICE_EXPORT_BATCH_SIZE", cast=int, default=1000)
+# Compress responses of at least this many bytes (0 never), with brotli if
+# installed and accepted, gzip otherwise
+RESPONSE_COMPRESSION_MIN_SIZE = config(
+    "RESPONSE_COMPRESSION_MIN_SIZE", cast=int, default=1024
+)
+# Time zone of the days in sales reports
+REPORT_TIMEZONE = config("REPORT_TIMEZONE", cast=str, default="Europe/Ljubljana")
+
+# Count SQL statements per request: report them in X-SQL-* response headers,
+# and log requests running more than SQL_STATEMENT_WARNING of them (0 never)
+SQL_DEBUG_HEADERS = config("SQL_DEBUG_HEADERS", cast=bool, default=False)
+SQL_STATEMENT_WARNING = config("SQL_STATEMENT_WARNING", cast=int, default=0)
 
 SOFTWARE_SUPPLIER_TAX_NUMBER = config("SOFTWARE_SUPPLIER_TAX_NUMBER", cast=int)
@@ -0,0 +1,35 @@
+import hashlib
+import hmac
+import secrets
+from typing import Tuple
+
+from app.settings import API_KEY_SECRET
+
+# Marks bearer tokens that are device API keys rather than JWTs
+KEY_PREFIX = "frk_"
+# Characters of the key kept in the clear, to tell keys apart
+DISPLAY_PREFIX_LENGTH = len(KEY_PREFIX) + 8
+
+
+def is_enabled() -> bool:
+    return API_KEY_SECRET is not None
+
+
+def is_api_key(token: str) -> bool:
+    return token.startswith(KEY_PREFIX)
+
+
+def hash_key(key: str) -> str:
+    """
+    Keys are random and long, so a keyed hash is enough to store them safely;
+    unlike passwords they don't need a slow hash
+    """
+    return hmac.new(API_KEY_SECRET.encode(), key.encode(), hashlib.sha256).hexdigest()
+
+
+def generate() -> Tuple[str, str, str]:
+    """
+    Create a new key. Returns the key, its hash and its display prefix.
+    """
+    key = KEY_PREFIX + secrets.token_urlsafe(32)
+    return key, hash_key(key), key[:DISPLAY_PREFIX_LENGTH]
@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
 from typing import List, Optional
 
-from app.database import get_db
-from app.database.crud import users
+from app.database import DbSession, get_db, run
+from app.database.crud import device_api_keys, users
 from app.database.models import UserRole
-from app.database.schemas import User
+from app.database.schemas import DeviceUser, User
 from app.settings import JWT_ALGORITHM, JWT_KEY
+from app.util import api_keys, principals
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -26,29 +27,78 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+def get_device_user(db: Session, token: str) -> Optional[DeviceUser]:
+    api_key = device_api_keys.get_by_hash(db, api_keys.hash_key(token))
+    if api_key is None:
+        return None
+    # Keys only issue invoices, whatever the role of the user who created them
+    user = DeviceUser(
+        **{**User.from_orm(api_key.user).dict(), "role": UserRole.DEFAULT},
+        device_id=api_key.device_id,
+    )
+    user._device = api_key.device
+    return user
+
+
+def get_user(db: Session, user_id: int) -> Optional[User]:
+    db_user = users.get_by_id(db, user_id)
+    return User.from_orm(db_user) if db_user is not None else None
+
+
 async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-):
+    token: str = Depends(oauth2_scheme), db: DbSession = Depends(get_db)
+) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if api_keys.is_api_key(token):
+        if not api_keys.is_enabled():
+            raise credentials_exception
+        user = await run(db, get_device_user, token)
+        if user is None:
+            raise credentials_exception
+        return user
+
     try:
         payload = jwt.decode(token, JWT_KEY, algorithms=[JWT_ALGORITHM])
         user_id: int = int(payload.get("sub"))
     except JWTError:
         raise credentials_exception
-    user = users.get_by_id(db, user_id)
+
+    user = principals.cache.get(user_id)
+    if user is not None:
+        return user
+
+    generation = principals.cache.generation
+    user = await run(db, get_user, user_id)
     if user is None:
         raise credentials_exception
+    principals.cache.put(user, generation)
     return user
 
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)):
+async def get_current_active_user_or_device(
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Like `get_current_active_user`, but also accepts device API keys. Only for
+    the endpoints issuing invoices.
+    """
     if not current_user.active:
         raise HTTPException(status_code=403, detail="Account has been disabled")
-    return User(**current_user.__dict__)
+    return current_user
+
+
+async def get_current_active_user(
+    current_user: User = Depends(get_current_active_user_or_device),
+):
+    if isinstance(current_user, DeviceUser):
+        raise HTTPException(
+            status_code=403, detail="API keys may only be used to issue invoices"
+        )
+    return current_user
 
 
 class ActiveUserWithRole:
@@ -0,0 +1,191 @@
+import asyncio
+import enum
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Optional
+
+from app.settings import (
+    FURS_API_MIN_TIMEOUT,
+    FURS_API_TIMEOUT,
+    FURS_API_TIMEOUT_P99_FACTOR,
+    FURS_BREAKER_ERROR_THRESHOLD,
+    FURS_BREAKER_HALF_OPEN_PROBES,
+    FURS_BREAKER_MIN_REQUESTS,
+    FURS_BREAKER_OPEN_SECONDS,
+    FURS_BREAKER_WINDOW,
+)
+from loguru import logger
+
+from .executor import run_in_executor
+from .furs_client import ConnectionTimedOutException, is_unavailable, request_timeout
+
+MAX_SAMPLES = 1000
+
+
+class BreakerState(enum.Enum):
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+@dataclass
+class Sample:
+    at: float
+    ok: bool
+    latency: float
+
+
+@dataclass
+class BreakerStatus:
+    name: str
+    state: BreakerState
+    requests: int
+    error_rate: float
+    latency_p50: Optional[float]
+    latency_p99: Optional[float]
+    timeout: float
+
+
+def call_with_timeout(timeout: float, func, *args, **kwargs):
+    with request_timeout(timeout):
+        return func(*args, **kwargs)
+
+
+class CircuitBreaker:
+    """
+    Tracks the error rate and latency of calls to one FURS endpoint over a
+    rolling window. When the error rate crosses the threshold the breaker opens
+    and calls fail immediately; after a cool-down a limited number of probe
+    calls is let through, and the breaker closes again once one succeeds. Only
+    errors saying that FURS is unavailable (timeouts, failed connections and
+    5xx responses) count, not FURS rejecting a request.
+
+    Call timeouts are derived from the observed p99 latency of successful calls,
+    bounded by FURS_API_MIN_TIMEOUT and FURS_API_TIMEOUT.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = BreakerState.CLOSED
+        self.opened_at = 0.0
+        self.probes = 0
+        self.samples: Deque[Sample] = deque(maxlen=MAX_SAMPLES)
+
+    def _prune(self, now: float):
+        while self.samples and self.samples[0].at < now - FURS_BREAKER_WINDOW:
+            self.samples.popleft()
+
+    def _latencies(self) -> list:
+        return sorted(sample.latency for sample in self.samples if sample.ok)
+
+    def percentile(self, q: float) -> Optional[float]:
+        latencies = self._latencies()
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(not sample.ok for sample in self.samples) / len(self.samples)
+
+    @property
+    def timeout(self) -> float:
+        if len(self.samples) < FURS_BREAKER_MIN_REQUESTS:
+            return float(FURS_API_TIMEOUT)
+        p99 = self.percentile(0.99)
+        if p99 is None:
+            return float(FURS_API_TIMEOUT)
+        return min(
+            float(FURS_API_TIMEOUT),
+            max(FURS_API_MIN_TIMEOUT, p99 * FURS_API_TIMEOUT_P99_FACTOR),
+        )
+
+    def allow(self) -> bool:
+        """
+        Raise `CircuitOpenError` if the call may not proceed. Returns whether
+        the call is a half-open probe.
+        """
+        if self.state == BreakerState.OPEN:
+            if time.monotonic() - self.opened_at < FURS_BREAKER_OPEN_SECONDS:
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+            self.state = BreakerState.HALF_OPEN
+            self.probes = 0
+        if self.state == BreakerState.HALF_OPEN:
+            if self.probes >= FURS_BREAKER_HALF_OPEN_PROBES:
+                raise CircuitOpenError(f"Circuit for {self.name} is half-open")
+            self.probes += 1
+            return True
+        return False
+
+    def record(self, ok: bool, latency: float, probe: bool = False):
+        now = time.monotonic()
+        if probe:
+            self.probes -= 1
+            if ok and self.state == BreakerState.HALF_OPEN:
+                logger.info(f"Circuit for {self.name} closed")
+                self.state = BreakerState.CLOSED
+                self.samples.clear()
+            elif not ok:
+                self.trip(now)
+                return
+
+        self.samples.append(Sample(now, ok, latency))
+        self._prune(now)
+        if (
+            self.state == BreakerState.CLOSED
+            and len(self.samples) >= FURS_BREAKER_MIN_REQUESTS
+            and self.error_rate >= FURS_BREAKER_ERROR_THRESHOLD
+        ):
+            self.trip(now)
+
+    def trip(self, now: float):
+        logger.warning(f"Circuit for {self.name} opened")
+        self.state = BreakerState.OPEN
+        self.opened_at = now
+
+    async def call(self, func, *args, **kwargs):
+        probe = self.allow()
+        timeout = self.timeout
+        start = time.monotonic()
+        try:
+            # The HTTP request itself times out, which frees the thread. Since
+            # connecting and reading may each take up to the timeout, the call
+            # is only abandoned once twice that has passed.
+            result = await asyncio.wait_for(
+                run_in_executor(call_with_timeout, timeout, func, *args, **kwargs),
+                2 * timeout,
+            )
+        except (asyncio.TimeoutError, ConnectionTimedOutException):
+            self.record(False, time.monotonic() - start, probe)
+            raise TimeoutError(f"FURS request timed out after {timeout:.1f}s")
+        except asyncio.CancelledError:
+            if probe:
+                self.probes -= 1
+            raise
+        except Exception as e:
+            if is_unavailable(e):
+                self.record(False, time.monotonic() - start, probe)
+            elif probe:
+                self.probes -= 1
+            raise
+        self.record(True, time.monotonic() - start, probe)
+        return result
+
+    def status(self) -> BreakerStatus:
+        self._prune(time.monotonic())
+        return BreakerStatus(
+            name=self.name,
+            state=self.state,
+            requests=len(self.samples),
+            error_rate=self.error_rate,
+            latency_p50=self.percentile(0.5),
+            latency_p99=self.percentile(0.99),
+            timeout=self.timeout,
+        )
@@ -1,85 +1,478 @@
+import asyncio
+import hashlib
 import json
+import time
 from base64 import b64decode
-from dataclasses import dataclass
-from typing import List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
 
 from app.database import SessionLocal
 from app.database.crud import companies
 from app.database.models import Company
 from app.settings import (
+    CERTIFICATE_CACHE_SIZE,
     CERTIFICATE_DIR,
+    CERTIFICATE_IDLE_SECONDS,
     CERTIFICATE_KEY,
-    FURS_API_PRODUCTION,
-    FURS_API_TIMEOUT,
+    CERTIFICATE_LAZY_LOADING,
+    CERTIFICATE_LOAD_WORKERS,
+    CERTIFICATE_NEGATIVE_TTL_SECONDS,
+    CERTIFICATE_REFRESH_INTERVAL,
+    FURS_API_COMPANY_CONCURRENCY,
 )
 from Crypto.Cipher import ChaCha20_Poly1305
 from fastapi import HTTPException
-from furs_fiscal.api import FURSBusinessPremiseAPI, FURSInvoiceAPI
 from loguru import logger
+from sqlalchemy.orm import Session
 
-loaded_certificates = {}
+from . import notifications, signing
+from .breaker import CircuitBreaker
+from .executor import run_in_db_executor, run_in_executor
+from .furs_client import Connector, InvoiceAPI, PremiseAPI
+
+# Loaded APIs per company id, least recently used first
+loaded_certificates: "OrderedDict[int, CompanyAPI]" = OrderedDict()
+last_used: Dict[int, float] = {}
+# Lazy loads in progress, shared by all requests for the same company
+loading: Dict[int, asyncio.Future] = {}
+# Companies that failed to load lazily (unknown, inactive or without a usable
+# certificate), by company id, until the monotonic time they may be retried
+not_loadable: Dict[int, float] = {}
+
+refresh_lock = asyncio.Lock()
+# Set to have the watcher refresh right away, e.g. when notified by another worker
+refresh_requested = asyncio.Event()
+watch_task: Optional[asyncio.Task] = None
+
+
+@dataclass
+class CertificateStats:
+    lazy: bool
+    loaded: int
+    capacity: Optional[int]
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    load_failures: int = 0
+    refreshes: int = 0
+    rebuilt: int = 0
+    removed: int = 0
+
+
+stats = CertificateStats(
+    lazy=CERTIFICATE_LAZY_LOADING,
+    loaded=0,
+    capacity=CERTIFICATE_CACHE_SIZE if CERTIFICATE_LAZY_LOADING else None,
+)
+
+
+@dataclass(frozen=True)
+class CertificateVersion:
+    """
+    What an API was built from: the certificate's modification time, size and
+    content hash, and the company's encrypted certificate password
+    """
+
+    mtime_ns: int
+    size: int
+    sha256: str
+    cert_key: str
+
+
+@dataclass
+class CompanyLimits:
+    """
+    How much of FURS a company may use: its in-flight request limit and its
+    circuit breakers. Kept apart from its API, so that they outlive evicting
+    or rebuilding it.
+    """
+
+    tax_id: int
+    limiter: asyncio.Semaphore = field(
+        default_factory=lambda: asyncio.Semaphore(FURS_API_COMPANY_CONCURRENCY)
+    )
+    breakers: Dict[str, CircuitBreaker] = field(default_factory=dict)
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(f"{self.tax_id}/{endpoint}")
+        return self.breakers[endpoint]
+
+
+# Per company tax number
+company_limits: Dict[int, CompanyLimits] = {}
+
+
+def get_limits(tax_id: int) -> CompanyLimits:
+    limits = company_limits.get(tax_id)
+    if limits is None:
+        limits = company_limits[tax_id] = CompanyLimits(tax_id)
+    return limits
 
 
 @dataclass
 class CompanyAPI:
     tax_id: int
-    api: FURSInvoiceAPI
-    premise_api: FURSBusinessPremiseAPI
+    api: InvoiceAPI
+    premise_api: PremiseAPI
+    cert_path: Optional[Path] = None
+    cert_password: Optional[str] = field(default=None, repr=False)
+    version: Optional[CertificateVersion] = None
+
+    @property
+    def limiter(self) -> asyncio.Semaphore:
+        return get_limits(self.tax_id).limiter
 
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        return get_limits(self.tax_id).breaker(endpoint)
 
-def get_apis() -> dict[int, CompanyAPI]:
+    @property
+    def credentials(self) -> signing.Credentials:
+        return (
+            self.tax_id,
+            self.cert_path,
+            self.cert_password,
+            self.version.sha256 if self.version is not None else None,
+        )
+
+    async def calculate_zoi(self, *args) -> str:
+        return (await self.calculate_zois([args]))[0]
+
+    async def calculate_zois(self, requests: Sequence[tuple]) -> List[str]:
+        if signing.is_enabled() and self.cert_path is not None:
+            return await signing.calculate_zois(self.credentials, requests)
+        return await run_in_executor(
+            lambda: [self.api.calculate_zoi(*request) for request in requests]
+        )
+
+    async def get_invoice_eor(self, *args, **kwargs) -> str:
+        # Bound the number of in-flight FURS requests per company, so that a
+        # single busy tenant can't occupy the whole executor
+        async with self.limiter:
+            return await self.breaker("invoices").call(
+                self.api.get_invoice_eor, *args, **kwargs
+            )
+
+
+def get_apis() -> Dict[int, CompanyAPI]:
     return loaded_certificates
 
 
-def get_api_for_company(company_id: int) -> CompanyAPI:
+def get_stats() -> CertificateStats:
+    stats.loaded = len(loaded_certificates)
+    return stats
+
+
+def touch(company_id: int):
+    loaded_certificates.move_to_end(company_id)
+    last_used[company_id] = time.monotonic()
+
+
+def evict():
+    """
+    Drop the least recently used APIs over capacity, and those that have been
+    idle for too long (lazy loading only)
+    """
+    if not CERTIFICATE_LAZY_LOADING:
+        return
+    idle_since = time.monotonic() - CERTIFICATE_IDLE_SECONDS
+    while loaded_certificates:
+        company_id = next(iter(loaded_certificates))
+        if (
+            len(loaded_certificates) <= CERTIFICATE_CACHE_SIZE
+            and last_used.get(company_id, 0) >= idle_since
+        ):
+            break
+        del loaded_certificates[company_id]
+        last_used.pop(company_id, None)
+        stats.evictions += 1
+        logger.debug(f"Evicted certificate for company {company_id}")
+
+
+def get_company(company_id: int) -> Optional[Company]:
+    with SessionLocal() as db:
+        return companies.get_by_id(db, company_id)
+
+
+def get_active_companies() -> List[Company]:
+    with SessionLocal() as db:
+        return companies.get_all_active(db)
+
+
+async def load_company(company_id: int) -> Optional[CompanyAPI]:
+    # Parsing the certificate doesn't need the connection
+    company = await run_in_db_executor(get_company, company_id)
+    if company is None or not company.is_active:
+        return None
+    return await run_in_executor(create_company_api, company)
+
+
+async def load_lazily(company_id: int) -> Optional[CompanyAPI]:
     try:
-        return loaded_certificates[company_id]
-    except:
+        company_api = await load_company(company_id)
+    except Exception as e:
+        logger.error(f"Failed to load certificate for company {company_id}: {e}")
+        company_api = None
+    if company_api is None:
+        stats.load_failures += 1
+        not_loadable[company_id] = time.monotonic() + CERTIFICATE_NEGATIVE_TTL_SECONDS
+        return None
+    loaded_certificates[company_id] = company_api
+    touch(company_id)
+    evict()
+    return company_api
+
+
+async def get_api_for_company(company_id: int) -> CompanyAPI:
+    evict()
+    company_api = loaded_certificates.get(company_id)
+    if company_api is not None:
+        stats.hits += 1
+        touch(company_id)
+        return company_api
+    stats.misses += 1
+    if not CERTIFICATE_LAZY_LOADING:
+        raise HTTPException(status_code=404, detail="Company not found")
+    if not_loadable.get(company_id, 0) > time.monotonic():
+        raise HTTPException(status_code=404, detail="Company not found")
+
+    future = loading.get(company_id)
+    if future is None:
+        future = loading[company_id] = asyncio.ensure_future(load_lazily(company_id))
+        future.add_done_callback(lambda _: loading.pop(company_id, None))
+    # Shielded, so that a cancelled request doesn't abort the load for others
+    company_api = await asyncio.shield(future)
+    if company_api is None:
         raise HTTPException(status_code=404, detail="Company not found")
+    return company_api
 
 
 def load():
+    """
+    Load all certificates from scratch, on startup
+    """
+    global loaded_certificates
+    last_used.clear()
+    if CERTIFICATE_LAZY_LOADING:
+        # Loaded on first use
+        loaded_certificates = OrderedDict()
+        logger.info("Certificates are loaded on demand")
+        return
     logger.debug("Loading certificates")
-    with SessionLocal() as db:
-        active_companies = companies.get_all_active(db)
-    load_for_companies(active_companies)
+    loaded_certificates = refreshed(OrderedDict(), get_active_companies())
+    for company_id in list(loaded_certificates):
+        touch(company_id)
+    logger.info(f"Loaded {len(loaded_certificates)} certificate(s)")
 
 
-def load_for_companies(companies: List[Company]):
-    for company in companies:
-        cert_path = CERTIFICATE_DIR / f"{company.tax_id}.p12"
-        if not cert_path.is_file():
-            logger.warning(f"Certificate for company {company.tax_id} not found")
-            continue
+def certificate_path(company: Company) -> Path:
+    return CERTIFICATE_DIR / f"{company.tax_id}.p12"
+
+
+def is_current(company: Company, company_api: CompanyAPI) -> bool:
+    """
+    Whether the API was built from the company's current certificate and
+    password. Only hashes the certificate if its modification time or size
+    have changed.
+    """
+    version = company_api.version
+    if (
+        version is None
+        or version.cert_key != company.cert_key
+        or company_api.tax_id != company.tax_id
+    ):
+        return False
+    cert_path = certificate_path(company)
+    try:
+        stat = cert_path.stat()
+        if (stat.st_mtime_ns, stat.st_size) == (version.mtime_ns, version.size):
+            return True
+        sha256 = hashlib.sha256(cert_path.read_bytes()).hexdigest()
+    except OSError:
+        return False
+    if sha256 != version.sha256:
+        return False
+    # Touched or copied over with the same contents
+    company_api.version = replace(version, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    return True
+
+
+def refreshed(
+    current: "OrderedDict[int, CompanyAPI]", active_companies: List[Company]
+) -> "OrderedDict[int, CompanyAPI]":
+    """
+    Build a new mapping from `current`: APIs whose certificate and password
+    are unchanged are reused as they are, changed ones are rebuilt, and
+    companies that are no longer active (or whose certificate no longer
+    loads) are left out. Companies that aren't loaded yet are only added when
+    loading eagerly.
+    """
+    unchanged: Dict[int, CompanyAPI] = {}
+    changed: List[Company] = []
+    for company in active_companies:
+        company_api = current.get(company.id)
+        if company_api is not None and is_current(company, company_api):
+            unchanged[company.id] = company_api
+        elif company_api is not None or not CERTIFICATE_LAZY_LOADING:
+            changed.append(company)
+    rebuilt = dict(
+        zip([company.id for company in changed], create_company_apis(changed))
+    )
+
+    result: "OrderedDict[int, CompanyAPI]" = OrderedDict()
+    # In the current (least recently used first) order, new companies last
+    for company_id in [*current, *rebuilt]:
+        company_api = unchanged.get(company_id) or rebuilt.get(company_id)
+        if company_api is not None:
+            result[company_id] = company_api
+    stats.rebuilt += sum(company_api is not None for company_api in rebuilt.values())
+    stats.removed += len(current.keys() - result.keys())
+    stats.load_failures += sum(company_api is None for company_api in rebuilt.values())
+    if changed or current.keys() - result.keys():
+        logger.info(
+            f"Refreshed certificates: {len(changed)} changed, "
+            f"{len(current.keys() - result.keys())} removed, {len(result)} loaded"
+        )
+    return result
+
 
+async def refresh():
+    """
+    Rebuild the APIs of companies whose certificate or password changed and
+    drop disabled companies. The new mapping is built off the event loop and
+    swapped in at once, so requests never see a partially refreshed one.
+    """
+    global loaded_certificates
+    # The change that triggered the refresh might make these loadable
+    not_loadable.clear()
+    async with refresh_lock:
+        snapshot = OrderedDict(loaded_certificates)
+        active_companies = await run_in_db_executor(get_active_companies)
+        result = await run_in_executor(refreshed, snapshot, active_companies)
+        # Keep whatever was lazily loaded while refreshing
+        for company_id, company_api in loaded_certificates.items():
+            if company_id not in snapshot:
+                result[company_id] = company_api
+        loaded_certificates = result
+        for company_id in last_used.keys() - result.keys():
+            del last_used[company_id]
+        for company_id in result.keys() - last_used.keys():
+            touch(company_id)
+        stats.refreshes += 1
+    evict()
+
+
+def request_refresh(payload: str = ""):
+    refresh_requested.set()
+
+
+async def watch():
+    interval = (
+        CERTIFICATE_REFRESH_INTERVAL if CERTIFICATE_REFRESH_INTERVAL > 0 else None
+    )
+    while True:
+        try:
+            await asyncio.wait_for(refresh_requested.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        refresh_requested.clear()
         try:
-            cert_password = decrypt_cert_key(company.cert_key)
+            await refresh()
         except Exception as e:
-            logger.error(
-                f"Failed to decrypt certificate key for company {company.tax_id}: {e}"
-            )
-            continue
-
-        if cert_password is None or len(cert_password) == 0:
-            continue
-
-        # TODO: maybe load certificates from byte buffers?
-        loaded_certificates[company.id] = CompanyAPI(
-            company.tax_id,
-            FURSInvoiceAPI(
-                p12_path=cert_path,
-                p12_password=cert_password,
-                production=FURS_API_PRODUCTION,
-                request_timeout=float(FURS_API_TIMEOUT),
-            ),
-            FURSBusinessPremiseAPI(
-                p12_path=cert_path,
-                p12_password=cert_password,
-                production=FURS_API_PRODUCTION,
-                request_timeout=float(FURS_API_TIMEOUT),
-            ),
+            logger.error(f"Failed to refresh certificates: {e}")
+
+
+def start():
+    """
+    Refresh every CERTIFICATE_REFRESH_INTERVAL seconds, and whenever another
+    worker asks for it
+    """
+    global watch_task
+    notifications.subscribe(
+        notifications.CERTIFICATES, request_refresh, on_lost=request_refresh
+    )
+    watch_task = asyncio.create_task(watch())
+
+
+def stop():
+    if watch_task is not None:
+        watch_task.cancel()
+
+
+def publish_refresh(db: Session):
+    """
+    Have every worker refresh its certificates once the caller's transaction
+    commits
+    """
+    notifications.publish(db, notifications.CERTIFICATES)
+
+
+def create_company_api(company: Company) -> Optional[CompanyAPI]:
+    cert_path = certificate_path(company)
+    try:
+        # Stat first: if the file changes in between, the next refresh only
+        # hashes it again
+        stat = cert_path.stat()
+        cert_data = cert_path.read_bytes()
+    except OSError:
+        logger.warning(f"Certificate for company {company.tax_id} not found")
+        return None
+
+    try:
+        cert_password = decrypt_cert_key(company.cert_key)
+    except Exception as e:
+        logger.error(
+            f"Failed to decrypt certificate key for company {company.tax_id}: {e}"
         )
-        logger.debug(f"Loaded certificate for company {company.tax_id}")
+        return None
+
+    if cert_password is None or len(cert_password) == 0:
+        return None
+
+    # Read and parse the certificate once, and share the parsed identity (and
+    # the connection settings) between both API clients
+    try:
+        connector = Connector(cert_path, cert_password, cert_data)
+    except Exception as e:
+        logger.error(f"Failed to load certificate for company {company.tax_id}: {e}")
+        return None
+
+    logger.debug(f"Loaded certificate for company {company.tax_id}")
+    return CompanyAPI(
+        company.tax_id,
+        InvoiceAPI(connector),
+        PremiseAPI(connector),
+        cert_path=cert_path,
+        cert_password=cert_password,
+        version=CertificateVersion(
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            sha256=hashlib.sha256(cert_data).hexdigest(),
+            cert_key=company.cert_key,
+        ),
+    )
+
+
+def create_company_apis(companies: List[Company]) -> List[Optional[CompanyAPI]]:
+    if not companies:
+        return []
+    # Parsing is mostly PKCS#12 key derivation in OpenSSL, which releases the
+    # GIL, so certificates are loaded in parallel threads
+    with ThreadPoolExecutor(
+        max_workers=CERTIFICATE_LOAD_WORKERS, thread_name_prefix="certificates"
+    ) as pool:
+        return list(pool.map(create_company_api, companies))
+
+
+def load_for_companies(companies: List[Company]):
+    company_apis = create_company_apis(companies)
+    for company, company_api in zip(companies, company_apis):
+        if company_api is not None:
+            loaded_certificates[company.id] = company_api
+            touch(company.id)
     logger.info(f"Loaded {len(loaded_certificates)} certificate(s)")
 
 
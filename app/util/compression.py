@@ -0,0 +1,133 @@
+# Response compression, negotiated from the Accept-Encoding header. Brotli is
+# used when the client accepts it and the `brotli` package is installed, gzip
+# otherwise. Streamed responses are flushed after every chunk, so compression
+# doesn't hold rows back.
+import zlib
+from typing import Optional
+
+from app.settings import RESPONSE_COMPRESSION_MIN_SIZE
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+# Brotli's higher qualities are meant for static assets, they cost far more CPU
+BROTLI_QUALITY = 4
+
+
+class GzipCompressor:
+    encoding = "gzip"
+
+    def __init__(self):
+        # wbits 31 writes the gzip header and trailer
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class BrotliCompressor:
+    encoding = "br"
+
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.finish()
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    encodings = set()
+    for item in accept_encoding.split(","):
+        encoding, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def negotiate(accept_encoding: str) -> Optional[type]:
+    encodings = accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in encodings:
+        return BrotliCompressor
+    if "gzip" in encodings:
+        return GzipCompressor
+    return None
+
+
+def is_enabled() -> bool:
+    return RESPONSE_COMPRESSION_MIN_SIZE > 0
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        compressor_type = None
+        if scope["type"] == "http":
+            compressor_type = negotiate(Headers(scope=scope).get("Accept-Encoding", ""))
+        if compressor_type is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        compressor = None
+
+        async def send_compressed(message: Message):
+            nonlocal start_message, compressor
+            if message["type"] == "http.response.start":
+                # Held back until the first body shows whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                headers = MutableHeaders(scope=start_message)
+                if "content-encoding" in headers or (
+                    not more_body and len(body) < RESPONSE_COMPRESSION_MIN_SIZE
+                ):
+                    await send(start_message)
+                    start_message = None
+                    await send(message)
+                    return
+                compressor = compressor_type()
+                headers["Content-Encoding"] = compressor.encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    message["body"] = compressor.compress(body)
+                else:
+                    message["body"] = compressor.finish(body)
+                    headers["Content-Length"] = str(len(message["body"]))
+                await send(start_message)
+                start_message = None
+            elif compressor is not None:
+                if more_body:
+                    message["body"] = compressor.compress(body)
+                else:
+                    message["body"] = compressor.finish(body)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
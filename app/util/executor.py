@@ -0,0 +1,54 @@
+import asyncio
+import contextvars
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+
+from app.settings import (
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL_SIZE,
+    DATABASE_REPLICA_URL,
+    FURS_API_WORKERS,
+)
+
+furs_executor = ThreadPoolExecutor(
+    max_workers=FURS_API_WORKERS, thread_name_prefix="furs"
+)
+# Connections the blocking engines may open at once
+DB_CONNECTIONS = (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW) * (
+    2 if DATABASE_REPLICA_URL else 1
+)
+# Blocking database calls get their own threads, so that they never wait for
+# FURS calls holding all of the threads above (or the other way around): one
+# per connection, and as many again for calls waiting for a connection
+db_executor = ThreadPoolExecutor(
+    max_workers=2 * DB_CONNECTIONS, thread_name_prefix="db"
+)
+# Bounds the calls waiting for a connection, so that a session which holds one
+# always gets a thread to finish its transaction with
+db_checkouts = asyncio.Semaphore(DB_CONNECTIONS)
+
+
+async def run_on(executor: Executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # In the caller's context, so that e.g. per-request SQL stats are kept
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor, partial(context.run, func, *args, **kwargs)
+    )
+
+
+async def run_in_executor(func, *args, **kwargs):
+    return await run_on(furs_executor, func, *args, **kwargs)
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """
+    Run a blocking database call that may have to check out a connection
+    """
+    async with db_checkouts:
+        return await run_on(db_executor, func, *args, **kwargs)
+
+
+def shutdown():
+    furs_executor.shutdown(wait=False, cancel_futures=True)
+    db_executor.shutdown(wait=False, cancel_futures=True)
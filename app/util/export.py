@@ -0,0 +1,90 @@
+# Streaming invoice exports. Rows go from a server-side cursor straight to the
+# response in batches, so memory use is bounded by the batch size rather than
+# the number of exported invoices.
+import csv
+import enum
+import io
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+from typing import Iterator, Optional
+
+from app.database import SessionLocal, schemas
+from app.database.crud import invoices
+from app.settings import INVOICE_EXPORT_BATCH_SIZE
+from loguru import logger
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import sessionmaker
+
+from .responses import dumps
+
+COLUMNS = [column.key for column in invoices.COLUMNS]
+
+
+class ExportFormat(enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def to_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # As in the JSON responses
+        return float(value)
+    return value
+
+
+def to_values(row: Row) -> list:
+    return [to_value(value) for value in row]
+
+
+def ndjson_chunk(rows: list) -> bytes:
+    return b"".join(dumps(row._asdict()) + b"\n" for row in rows)
+
+
+def csv_chunk(rows: list, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(to_values(row) for row in rows)
+    return buffer.getvalue().encode()
+
+
+def stream_invoices(
+    invoice_filter: schemas.InvoiceFilter,
+    export_format: ExportFormat,
+    company_id: Optional[int] = None,
+    session_factory: sessionmaker = SessionLocal,
+) -> Iterator[bytes]:
+    """
+    Yield the export one batch of rows at a time. The session is owned by
+    the generator, as it outlives the request handler.
+    """
+    if export_format == ExportFormat.CSV:
+        # Sent before the query even runs
+        yield csv_chunk([], header=True)
+    with session_factory() as db:
+        rows = invoices.stream_for_export(
+            db, invoice_filter, INVOICE_EXPORT_BATCH_SIZE, company_id
+        )
+        exported = 0
+        while True:
+            batch = list(islice(rows, INVOICE_EXPORT_BATCH_SIZE))
+            if not batch:
+                break
+            exported += len(batch)
+            if export_format == ExportFormat.CSV:
+                yield csv_chunk(batch)
+            else:
+                yield ndjson_chunk(batch)
+    logger.debug(f"Exported {exported} invoice(s)")
@@ -1,59 +1,37 @@
-from typing import List
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
 from app.database import SessionLocal, models
-from app.database.crud import companies, premises
-from app.settings import SOFTWARE_SUPPLIER_TAX_NUMBER
+from app.database.crud import premises
+from app.settings import (
+    PREMISE_REGISTRATION_CONCURRENCY,
+    PREMISE_REGISTRATION_LEASE_SECONDS,
+    SOFTWARE_SUPPLIER_TAX_NUMBER,
+)
 from loguru import logger
 
-from .certificates import get_api_for_company
+from .certificates import CompanyAPI, get_api_for_company
+from .executor import run_in_db_executor
 
+registration_task: Optional[asyncio.Task] = None
 
-def register_premises():
-    logger.debug("Registering premises")
-    with SessionLocal() as db:
-        active_companies = companies.get_all_active(db)
-    for company in active_companies:
-        premises_to_register: List[
-            models.BusinessPremise
-        ] = premises.get_all_for_company(db, company.id)
-        for premise in premises_to_register:
-            if premise.premise_type == models.BusinessPremiseType.MOVABLE:
-                try:
-                    register_movable_premise(premise)
-                except Exception as e:
-                    logger.error(
-                        f"Failed to register movable premise {premise.furs_id} for company {company.tax_id}: {e}"
-                    )
-            elif premise.premise_type == models.BusinessPremiseType.IMMOVABLE:
-                try:
-                    register_immovable_premise(premise)
-                except Exception as e:
-                    logger.error(
-                        f"Failed to register immovable premise {premise.furs_id} for company {company.tax_id}: {e}"
-                    )
-            else:
-                logger.warning(f"Unknown premise type: {premise.premise_type}")
-    logger.info("Registered premises")
 
-
-def register_movable_premise(premise: models.BusinessPremise):
-    company_api = get_api_for_company(premise.company_id)
-    if not company_api.premise_api.register_movable_business_premise(
-        tax_number=company_api.tax_id,
+def movable_premise_data(premise: models.BusinessPremise) -> dict:
+    return dict(
         premise_id=premise.furs_id,
         movable_type=premise.movable_type.value,
         validity_date=premise.validity_from,
         software_supplier_tax_number=SOFTWARE_SUPPLIER_TAX_NUMBER,
         foreign_software_supplier_name=None,
         special_notes=premise.notes or "None",
-    ):
-        raise Exception("Failed to register premise")
+    )
 
 
-def register_immovable_premise(premise: models.BusinessPremise):
-    company_api = get_api_for_company(premise.company_id)
-    if not company_api.premise_api.register_immovable_business_premise(
-        tax_number=company_api.tax_id,
+def immovable_premise_data(premise: models.BusinessPremise) -> dict:
+    return dict(
         premise_id=premise.furs_id,
         real_estate_cadastral_number=premise.real_estate_cadastral_number,
         real_estate_building_number=premise.real_estate_building_number,
@@ -69,5 +47,149 @@ def register_immovable_premise(premise: models.BusinessPremise):
         foreign_software_supplier_name=None,
         special_notes=premise.notes or "None",
         close=False,
+    )
+
+
+def registration_hash(premise: models.BusinessPremise) -> Optional[str]:
+    """
+    Hash of everything sent to FURS when registering the premise, None for
+    unknown premise types
+    """
+    if premise.premise_type == models.BusinessPremiseType.MOVABLE:
+        data = movable_premise_data(premise)
+    elif premise.premise_type == models.BusinessPremiseType.IMMOVABLE:
+        data = immovable_premise_data(premise)
+    else:
+        return None
+    data.update(tax_number=premise.company.tax_id, premise_type=premise.premise_type)
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def get_unregistered_premises() -> List[Tuple[int, str]]:
+    """
+    Ids and FURS ids of the premises of active companies that are new or have
+    changed since they were last registered
+    """
+    with SessionLocal() as db:
+        all_premises = premises.get_all_for_active_companies(db)
+        unregistered = []
+        for premise in all_premises:
+            premise_hash = registration_hash(premise)
+            if premise_hash is None:
+                logger.warning(f"Unknown premise type: {premise.premise_type}")
+            elif premise.registration_hash != premise_hash:
+                unregistered.append((premise.id, premise.furs_id))
+    return unregistered
+
+
+def lease_premise(premise_id: int) -> Optional[Tuple[models.BusinessPremise, str]]:
+    """
+    The premise and its registration hash if it's still new or changed, leased
+    to this worker for PREMISE_REGISTRATION_LEASE_SECONDS, so that workers
+    starting at the same time don't register the same premise. None if it's
+    up to date or another worker has it.
+    """
+    lease_until = datetime.utcnow() + timedelta(
+        seconds=PREMISE_REGISTRATION_LEASE_SECONDS
+    )
+    # Still usable once the session is gone
+    with SessionLocal(expire_on_commit=False) as db:
+        premise = premises.lock_for_registration(db, premise_id)
+        if premise is None:
+            return None
+        premise_hash = registration_hash(premise)
+        if premise_hash is None or premise.registration_hash == premise_hash:
+            return None
+        premises.lease_for_registration(db, premise, lease_until)
+    return premise, premise_hash
+
+
+def record_registration(premise_id: int, premise_hash: Optional[str]):
+    """
+    Record the registration of the hashed premise data, or that it failed if
+    there's no hash, and end the lease
+    """
+    with SessionLocal() as db:
+        if premise_hash is None:
+            premises.release_registration(db, premise_id)
+        else:
+            premises.set_registered(db, premise_id, premise_hash)
+
+
+async def register_premise(premise_id: int) -> bool:
+    """
+    Register the premise if it's still new or changed. Returns whether it was
+    registered (rather than skipped).
+    """
+    leased = await run_in_db_executor(lease_premise, premise_id)
+    if leased is None:
+        return False
+    premise, premise_hash = leased
+    if premise.premise_type == models.BusinessPremiseType.MOVABLE:
+        register = register_movable_premise
+    else:
+        register = register_immovable_premise
+    try:
+        company_api = await get_api_for_company(premise.company_id)
+        async with company_api.limiter:
+            await company_api.breaker("premises").call(register, premise, company_api)
+    except BaseException:
+        await asyncio.shield(run_in_db_executor(record_registration, premise_id, None))
+        raise
+    await run_in_db_executor(record_registration, premise_id, premise_hash)
+    return True
+
+
+async def register_premises():
+    """
+    Register new and changed premises, a bounded number at once
+    """
+    logger.debug("Registering premises")
+    unregistered = await run_in_db_executor(get_unregistered_premises)
+    semaphore = asyncio.Semaphore(PREMISE_REGISTRATION_CONCURRENCY)
+
+    async def register(premise_id: int, furs_id: str) -> Optional[bool]:
+        async with semaphore:
+            try:
+                return await register_premise(premise_id)
+            except Exception as e:
+                logger.error(f"Failed to register premise {furs_id}: {e}")
+                return None
+
+    results = await asyncio.gather(
+        *(register(premise_id, furs_id) for premise_id, furs_id in unregistered)
+    )
+    logger.info(
+        f"Registered {results.count(True)} premise(s), " f"{results.count(None)} failed"
+    )
+
+
+def start():
+    """
+    Register premises in the background, without delaying startup
+    """
+    global registration_task
+    registration_task = asyncio.create_task(register_premises())
+
+
+def stop():
+    if registration_task is not None:
+        registration_task.cancel()
+
+
+def register_movable_premise(premise: models.BusinessPremise, company_api: CompanyAPI):
+    if not company_api.premise_api.register_movable_business_premise(
+        tax_number=company_api.tax_id, **movable_premise_data(premise)
+    ):
+        raise Exception("Failed to register premise")
+
+
+def register_immovable_premise(
+    premise: models.BusinessPremise, company_api: CompanyAPI
+):
+    if not company_api.premise_api.register_immovable_business_premise(
+        tax_number=company_api.tax_id, **immovable_premise_data(premise)
     ):
         raise Exception("Failed to register premise")
@@ -0,0 +1,107 @@
+# The FURS clients of furs_fiscal, adapted to the app. Each of its API classes
+# builds a connector of its own, which parses the .p12 and writes the
+# certificate and key to temporary PEM files (for requests) that it never
+# removes. Here both APIs of a company share one connector, which removes its
+# files once it's gone. This is the only module relying on furs_fiscal's
+# internals.
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from app.settings import FURS_API_ENDPOINT, FURS_API_PRODUCTION, FURS_API_TIMEOUT
+from furs_fiscal.api import FURSBusinessPremiseAPI, FURSInvoiceAPI
+from furs_fiscal.connector import Connector as BaseConnector
+from furs_fiscal.exceptions import ConnectionException, ConnectionTimedOutException
+from requests import RequestException
+
+# Per-thread timeout overrides, see `request_timeout`
+_local = threading.local()
+
+
+def remove_files(*paths: str):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def request_timeout(seconds: float) -> Iterator[None]:
+    """
+    Time out the FURS requests the current thread makes within the block after
+    `seconds` rather than FURS_API_TIMEOUT. Connecting and every read may each
+    take that long.
+    """
+    previous = getattr(_local, "timeout", None)
+    _local.timeout = seconds
+    try:
+        yield
+    finally:
+        _local.timeout = previous
+
+
+def is_unavailable(error: Exception) -> bool:
+    """
+    Whether a request failed because FURS couldn't be reached or failed itself,
+    rather than because it rejected the request
+    """
+    if isinstance(error, ConnectionException):
+        # furs_fiscal keeps the status code in a tuple
+        status_code = error.code[0] if isinstance(error.code, tuple) else error.code
+        return status_code >= 500
+    return isinstance(error, (ConnectionTimedOutException, RequestException))
+
+
+class Connector(BaseConnector):
+    """
+    Talks to FURS (or FURS_API_ENDPOINT) with a company's certificate
+    """
+
+    @property
+    def request_timeout(self) -> float:
+        timeout = getattr(_local, "timeout", None)
+        return self.default_timeout if timeout is None else timeout
+
+    @request_timeout.setter
+    def request_timeout(self, timeout: float):
+        self.default_timeout = timeout
+
+    def __init__(
+        self, p12_path: Path, p12_password: str, p12_buffer: Optional[bytes] = None
+    ):
+        super().__init__(
+            p12_path=p12_path,
+            p12_password=p12_password,
+            p12_buffer=p12_buffer,
+            production=FURS_API_PRODUCTION,
+            request_timeout=float(FURS_API_TIMEOUT),
+        )
+        if FURS_API_ENDPOINT:
+            self.endpoint = FURS_API_ENDPOINT
+        weakref.finalize(self, remove_files, self.cert_temp.name, self.pkey_temp.name)
+
+
+class KeyConnector(BaseConnector):
+    """
+    Only parses the .p12, for signing, and writes no files
+    """
+
+    def __init__(self, p12_path: Path, p12_password: str):
+        super().__init__(p12_path=p12_path, p12_password=p12_password, production=False)
+
+    def _store_temp_files(self):
+        pass
+
+
+class InvoiceAPI(FURSInvoiceAPI):
+    def __init__(self, connector: BaseConnector):
+        self.connector = connector
+
+
+class PremiseAPI(FURSBusinessPremiseAPI):
+    def __init__(self, connector: BaseConnector):
+        self.connector = connector
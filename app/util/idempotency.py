@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app.database import SessionLocal
+from app.database.crud import idempotency_keys
+from app.settings import (
+    IDEMPOTENCY_CACHE_SIZE,
+    IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS,
+    IDEMPOTENCY_TTL_SECONDS,
+)
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+
+from .executor import run_in_db_executor
+
+purge_task: Optional[asyncio.Task] = None
+
+
+def not_before() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+
+
+def abandoned_before() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS)
+
+
+def fingerprint(request: Any) -> str:
+    """
+    Hash of a request body, to tell a retry from a different request reusing
+    the key
+    """
+    body = json.dumps(jsonable_encoder(request), sort_keys=True)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Remembers responses by idempotency key for `ttl` seconds, keeping at most
+    `max_entries` of them (least recently used are evicted first), and
+    collapses concurrent requests with the same key onto a single execution.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return response
+
+    def put(self, key: Hashable, response: Any):
+        self.entries[key] = (time.monotonic() + self.ttl, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def run(
+        self,
+        key: Hashable,
+        execute: Callable[[], Awaitable[Any]],
+        lookup: Callable[[], Awaitable[Optional[Any]]],
+    ) -> Any:
+        """
+        Return the stored response for `key`, falling back to `lookup` (e.g. a
+        database query) and finally to `execute`
+        """
+        response = self.get(key)
+        if response is not None:
+            return response
+
+        in_flight = self.in_flight.get(key)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            response = await lookup()
+            if response is None:
+                response = await execute()
+            self.put(key, response)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved, there might be nobody waiting
+            future.exception()
+            raise
+        finally:
+            del self.in_flight[key]
+
+
+store = IdempotencyStore(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_CACHE_SIZE)
+
+
+def purge_expired() -> int:
+    with SessionLocal() as db:
+        return idempotency_keys.delete_expired(db, not_before())
+
+
+async def purge_forever():
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_TTL_SECONDS)
+        try:
+            deleted = await run_in_db_executor(purge_expired)
+            logger.debug(f"Purged {deleted} expired idempotency key(s)")
+        except Exception as e:
+            logger.error(f"Failed to purge expired idempotency keys: {e}")
+
+
+def start():
+    global purge_task
+    purge_task = asyncio.create_task(purge_forever())
+
+
+def stop():
+    if purge_task is not None:
+        purge_task.cancel()
@@ -1,2 +1,131 @@
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.database import schemas
+from furs_fiscal.api import TaxesPerSeller
+
+VatAmount = Tuple[float, float, float]
+
+CENT = Decimal("0.01")
+
+
+def round_cents(amount: Decimal) -> Decimal:
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def price_vat_amounts(
+    prices: Iterable[Tuple[Decimal, Decimal]],
+) -> List[Tuple[Decimal, Decimal, Decimal]]:
+    """
+    The (tax rate, taxable amount, VAT) of each of an invoice's (amount, tax
+    rate) prices, rounded to cents, as they are submitted to FURS
+    """
+    return [
+        (tax_rate, round_cents(amount), round_cents(amount * tax_rate / 100))
+        for amount, tax_rate in prices
+    ]
+
+
+def build_vat_lines(
+    vat_amounts: Iterable[Tuple[Decimal, Decimal, Decimal]],
+) -> List[schemas.VatLine]:
+    """
+    VAT breakdown of an invoice from its `price_vat_amounts`, summed per tax
+    rate, so that it adds up to exactly what was submitted to FURS
+    """
+    per_rate: Dict[Decimal, Tuple[Decimal, Decimal]] = {}
+    for tax_rate, base, tax in vat_amounts:
+        rate_base, rate_tax = per_rate.get(tax_rate, (Decimal(0), Decimal(0)))
+        per_rate[tax_rate] = (rate_base + base, rate_tax + tax)
+    return [
+        schemas.VatLine(tax_rate=tax_rate, base=base, tax=tax)
+        for tax_rate, (base, tax) in sorted(per_rate.items())
+    ]
+
+
 def generate_invoice_number(business_premise: str, device_id: str, seq_id: int) -> str:
     return f"{business_premise}-{device_id}-{seq_id}"
+
+
+def build_submission(
+    tax_number: int,
+    business_premise_id: str,
+    electronic_device_id: str,
+    invoice_amount: float,
+    vat_amounts: List[VatAmount],
+    operator_tax_number: int,
+    reference_invoice_number: Optional[str] = None,
+    reference_invoice_business_premise_id: Optional[str] = None,
+    reference_invoice_electronic_device_id: Optional[str] = None,
+    reference_invoice_issued_date: Optional[datetime] = None,
+) -> dict:
+    """
+    Build a JSON-serializable description of everything FURS needs to issue an
+    EOR for an invoice, apart from the data that is already stored on the invoice
+    itself (ZOI, invoice number, issue date). The result is persisted with the
+    invoice, so that it can be (re)submitted later.
+    """
+    submission = {
+        "tax_number": tax_number,
+        "business_premise_id": business_premise_id,
+        "electronic_device_id": electronic_device_id,
+        "invoice_amount": invoice_amount,
+        "vat_amounts": [list(vat) for vat in vat_amounts],
+        "operator_tax_number": operator_tax_number,
+    }
+    if reference_invoice_number is not None:
+        submission["reference"] = {
+            "invoice_number": reference_invoice_number,
+            "business_premise_id": reference_invoice_business_premise_id,
+            "electronic_device_id": reference_invoice_electronic_device_id,
+            "issued_date": reference_invoice_issued_date.isoformat(),
+        }
+    return submission
+
+
+def build_eor_request(
+    submission: dict,
+    zoi: str,
+    issued_at: datetime,
+    invoice_number: str,
+    subsequent_submit: bool,
+) -> dict:
+    """
+    Build keyword arguments for `FURSInvoiceAPI.get_invoice_eor` from a stored
+    submission (see `build_submission`)
+    """
+    seller_one = TaxesPerSeller(
+        other_taxes_amount=None,
+        exempt_vat_taxable_amount=None,
+        reverse_vat_taxable_amount=None,
+        non_taxable_amount=None,
+        special_tax_rules_amount=None,
+        seller_tax_number=None,
+    )
+    for tax_rate, tax_base, tax_amount in submission["vat_amounts"]:
+        seller_one.add_vat_amount(tax_rate, tax_base, tax_amount)
+
+    reference = submission.get("reference")
+    return dict(
+        zoi=zoi,
+        tax_number=submission["tax_number"],
+        issued_date=issued_at,
+        invoice_number=invoice_number,
+        business_premise_id=submission["business_premise_id"],
+        electronic_device_id=submission["electronic_device_id"],
+        invoice_amount=submission["invoice_amount"],
+        taxes_per_seller=[seller_one],
+        operator_tax_number=submission["operator_tax_number"],
+        subsequent_submit=subsequent_submit,
+        reference_invoice_number=reference["invoice_number"] if reference else None,
+        reference_invoice_business_premise_id=(
+            reference["business_premise_id"] if reference else None
+        ),
+        reference_invoice_electronic_device_id=(
+            reference["electronic_device_id"] if reference else None
+        ),
+        reference_invoice_issued_date=(
+            datetime.fromisoformat(reference["issued_date"]) if reference else None
+        ),
+    )
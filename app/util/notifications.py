@@ -0,0 +1,109 @@
+# Broadcasts between workers over Postgres LISTEN/NOTIFY. Each worker keeps one
+# dedicated listening connection for all channels. Without Postgres, nothing is
+# broadcast and every worker only sees its own changes.
+import asyncio
+from typing import Callable, Dict, Optional
+
+from app.database import engine
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Channels
+PRINCIPALS = "principal_invalidation"
+CERTIFICATES = "certificate_refresh"
+
+LISTEN_RETRY_SECONDS = 5
+
+handlers: Dict[str, Callable[[str], None]] = {}
+# Called when the connection is lost, as notifications may have been missed
+lost_handlers: Dict[str, Callable[[], None]] = {}
+
+listener_connection = None
+
+
+def is_enabled() -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def subscribe(
+    channel: str,
+    handler: Callable[[str], None],
+    on_lost: Optional[Callable[[], None]] = None,
+):
+    """
+    Call `handler` with the payload of every notification on `channel`. Must
+    be called before `start`.
+    """
+    handlers[channel] = handler
+    if on_lost is not None:
+        lost_handlers[channel] = on_lost
+
+
+def publish(db: Session, channel: str, payload: str = ""):
+    """
+    Notify all workers (this one included) once the caller's transaction
+    commits
+    """
+    if db.bind.dialect.name == "postgresql":
+        db.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            {"channel": channel, "payload": payload},
+        )
+
+
+def _dispatch(channel: str, payload: str):
+    try:
+        handlers[channel](payload)
+    except Exception as e:
+        logger.error(f"Failed to handle notification on {channel}: {e}")
+
+
+def _receive():
+    try:
+        listener_connection.poll()
+    except Exception as e:
+        logger.error(f"Lost the notification listener: {e}")
+        for on_lost in lost_handlers.values():
+            on_lost()
+        stop()
+        asyncio.get_running_loop().call_later(LISTEN_RETRY_SECONDS, _restart)
+        return
+    while listener_connection.notifies:
+        notify = listener_connection.notifies.pop(0)
+        _dispatch(notify.channel, notify.payload)
+
+
+def _restart():
+    try:
+        start()
+    except Exception as e:
+        logger.error(f"Failed to listen for notifications: {e}")
+        asyncio.get_running_loop().call_later(LISTEN_RETRY_SECONDS, _restart)
+
+
+def start():
+    global listener_connection
+    if not is_enabled() or not handlers:
+        return
+    connection = engine.raw_connection()
+    # A dedicated connection, it never goes back to the pool
+    connection.detach()
+    connection.set_session(autocommit=True)
+    with connection.cursor() as cursor:
+        for channel in handlers:
+            cursor.execute(f"LISTEN {channel}")
+    listener_connection = connection
+    asyncio.get_running_loop().add_reader(connection.fileno(), _receive)
+
+
+def stop():
+    global listener_connection
+    if listener_connection is None:
+        return
+    try:
+        asyncio.get_running_loop().remove_reader(listener_connection.fileno())
+        listener_connection.close()
+    except Exception:
+        pass
+    listener_connection = None
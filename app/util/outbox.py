@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional, Union
+
+from app.database import SessionLocal
+from app.database.crud import invoices
+from app.settings import (
+    FURS_OUTBOX_BACKOFF_BASE,
+    FURS_OUTBOX_BACKOFF_MAX,
+    FURS_OUTBOX_BATCH_SIZE,
+    FURS_OUTBOX_LEASE_SECONDS,
+    FURS_OUTBOX_POLL_INTERVAL,
+)
+from loguru import logger
+from sqlalchemy.engine import Row
+
+from .certificates import get_api_for_company
+from .executor import run_in_db_executor
+from .invoices import build_eor_request
+
+drain_task: Optional[asyncio.Task] = None
+
+
+async def submit(invoice: Row) -> str:
+    company_api = await get_api_for_company(invoice.company_id)
+    return await company_api.get_invoice_eor(
+        **build_eor_request(
+            invoice.submission,
+            zoi=invoice.zoi,
+            issued_at=invoice.issued_at,
+            invoice_number=invoice.invoice_number,
+            subsequent_submit=True,
+        )
+    )
+
+
+def backoff(attempts: int) -> timedelta:
+    delay = FURS_OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, FURS_OUTBOX_BACKOFF_MAX))
+
+
+def lease_batch() -> List[Row]:
+    lease_until = datetime.utcnow() + timedelta(seconds=FURS_OUTBOX_LEASE_SECONDS)
+    with SessionLocal() as db:
+        return invoices.lease_pending_for_submit(
+            db, FURS_OUTBOX_BATCH_SIZE, lease_until
+        )
+
+
+def record_results(pending: List[Row], results: List[Union[str, BaseException]]):
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        for invoice, result in zip(pending, results):
+            if isinstance(result, BaseException):
+                attempts = invoice.submit_attempts + 1
+                logger.warning(
+                    f"Failed to submit invoice {invoice.invoice_number} "
+                    f"(attempt {attempts}): {result}"
+                )
+                invoices.set_submit_failed(
+                    db, invoice.id, str(result), now + backoff(attempts)
+                )
+            else:
+                invoices.set_submitted(db, invoice.id, result)
+        db.commit()
+
+
+async def drain_once() -> int:
+    """
+    Submit one batch of pending invoices to FURS. Returns the number of
+    invoices that were picked up.
+
+    The batch is leased for FURS_OUTBOX_LEASE_SECONDS and committed before
+    anything is submitted, so no rows stay locked and no connection is held
+    while waiting for FURS. Invoices of a worker that dies meanwhile are
+    picked up again once their lease runs out.
+    """
+    pending = await run_in_db_executor(lease_batch)
+    if not pending:
+        return 0
+
+    results = await asyncio.gather(
+        *(submit(invoice) for invoice in pending), return_exceptions=True
+    )
+    await run_in_db_executor(record_results, pending, results)
+    logger.debug(f"Drained {len(pending)} invoice(s) from the outbox")
+    return len(pending)
+
+
+async def drain_forever():
+    while True:
+        try:
+            drained = await drain_once()
+        except Exception as e:
+            logger.error(f"Failed to drain invoice outbox: {e}")
+            drained = 0
+        # Keep going without pause while there is a backlog
+        if drained < FURS_OUTBOX_BATCH_SIZE:
+            await asyncio.sleep(FURS_OUTBOX_POLL_INTERVAL)
+
+
+def start():
+    global drain_task
+    drain_task = asyncio.create_task(drain_forever())
+
+
+def stop():
+    if drain_task is not None:
+        drain_task.cancel()
@@ -0,0 +1,18 @@
+# Opaque cursors for keyset pagination: the sort key of the last row of a page
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(issued_at: datetime, id: int) -> str:
+    return urlsafe_b64encode(f"{issued_at.isoformat()}|{id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        issued_at, id = urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(issued_at), int(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -0,0 +1,117 @@
+# Argon2 hashing and verification in a small pool of worker processes, so that
+# logins don't stall the event loop (and invoice issuance with it). Logins are
+# admission-controlled: a bounded number is hashed at once, a bounded number
+# waits, and the rest is turned away with 503.
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from app.settings import (
+    ARGON2_MEMORY_COST,
+    ARGON2_PARALLELISM,
+    ARGON2_TIME_COST,
+    LOGIN_CONCURRENCY,
+    LOGIN_QUEUE_SIZE,
+    PASSWORD_HASHING_PROCESSES,
+)
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHash, VerificationError
+from fastapi import HTTPException, status
+from loguru import logger
+
+from .executor import run_in_executor
+
+hasher = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+)
+hashing_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _hash(password: str) -> str:
+    return hasher.hash(password)
+
+
+def _verify(password_hash: str, password: str) -> Tuple[bool, bool]:
+    try:
+        hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHash):
+        return False, False
+    return True, hasher.check_needs_rehash(password_hash)
+
+
+def _ready():
+    pass
+
+
+def start(processes: int = PASSWORD_HASHING_PROCESSES):
+    global hashing_pool
+    if processes <= 0:
+        return
+    # Fork, so that the workers don't re-import (and re-initialize) the app
+    hashing_pool = ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context("fork")
+    )
+    # Fork the workers now rather than on the first login
+    hashing_pool.submit(_ready)
+    logger.info(f"Started {processes} password hashing process(es)")
+
+
+def shutdown():
+    global hashing_pool
+    if hashing_pool is not None:
+        hashing_pool.shutdown(wait=False, cancel_futures=True)
+        hashing_pool = None
+
+
+async def _run(func, *args):
+    if hashing_pool is None:
+        # Argon2 releases the GIL, threads still keep the event loop free
+        return await run_in_executor(func, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hashing_pool, func, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_password(password_hash: str, password: str) -> Tuple[bool, bool]:
+    """
+    Check a password against its hash. Returns whether it matches and whether
+    the hash should be replaced, because the Argon2 parameters have changed.
+    """
+    return await _run(_verify, password_hash, password)
+
+
+class LoginAdmission:
+    """
+    Lets at most `concurrency` logins hash at once and `queue_size` more wait
+    for their turn; any further login is rejected right away
+    """
+
+    def __init__(self, concurrency: int, queue_size: int):
+        self.queue_size = queue_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+
+    async def __aenter__(self):
+        if self.semaphore.locked() and self.waiting >= self.queue_size:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent logins, try again later",
+                headers={"Retry-After": "1"},
+            )
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+
+login_admission = LoginAdmission(LOGIN_CONCURRENCY, LOGIN_QUEUE_SIZE)
@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.database.schemas import User
+from app.settings import PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from . import notifications
+
+
+class PrincipalCache:
+    """
+    Caches authenticated users by id for `ttl` seconds, keeping at most
+    `max_entries` of them (least recently used are evicted first).
+
+    Every invalidation bumps a generation counter; a user read from the
+    database before an invalidation is not cached, so that a lookup racing
+    with a disable can't re-insert the stale state.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[int, Tuple[float, User]]" = OrderedDict()
+        self.generation = 0
+
+    def get(self, user_id: int) -> Optional[User]:
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            del self.entries[user_id]
+            return None
+        self.entries.move_to_end(user_id)
+        return user
+
+    def put(self, user: User, generation: int):
+        if self.ttl <= 0 or generation != self.generation:
+            return
+        self.entries[user.id] = (time.monotonic() + self.ttl, user)
+        self.entries.move_to_end(user.id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        self.generation += 1
+        self.entries.pop(user_id, None)
+
+    def invalidate_company(self, company_id: int):
+        self.generation += 1
+        for user_id in [
+            user_id
+            for user_id, (_, user) in self.entries.items()
+            if user.company_id == company_id
+        ]:
+            del self.entries[user_id]
+
+
+cache = PrincipalCache(PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_SIZE)
+
+
+def apply(payload: str):
+    kind, _, id = payload.partition(":")
+    if kind == "user":
+        cache.invalidate_user(int(id))
+    elif kind == "company":
+        cache.invalidate_company(int(id))
+    else:
+        logger.warning(f"Unknown principal invalidation: {payload}")
+
+
+def publish(db: Session, payload: str):
+    """
+    Invalidate locally, and let other workers know once the caller's
+    transaction commits
+    """
+    apply(payload)
+    notifications.publish(db, notifications.PRINCIPALS, payload)
+
+
+def invalidate_user(db: Session, user_id: int):
+    publish(db, f"user:{user_id}")
+
+
+def invalidate_company(db: Session, company_id: int):
+    publish(db, f"company:{company_id}")
+
+
+def start():
+    """
+    Listen for invalidations from other workers. Without Postgres, other
+    workers only pick up changes once their cached entries expire.
+    """
+    if PRINCIPAL_CACHE_TTL_SECONDS <= 0:
+        return
+    notifications.subscribe(
+        notifications.PRINCIPALS, apply, on_lost=cache.entries.clear
+    )
@@ -0,0 +1,260 @@
+# Routing of read-only requests to the replica (DATABASE_REPLICA_URL). Reads
+# fall back to the primary while the replica lags by more than
+# DATABASE_REPLICA_MAX_LAG seconds (or can't be reached), and for clients
+# whose writes it hasn't replayed yet. A response to a request that committed
+# carries the primary's WAL position after it, as an X-Min-LSN header and a
+# cookie, and the client's reads only go to a replica that has replayed up to
+# the position it sends back. Clients without cookies (e.g. devices using API
+# keys) send the header instead.
+import asyncio
+import math
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from app.database import (
+    AsyncReplicaSessionLocal,
+    AsyncSessionLocal,
+    ReplicaSessionLocal,
+    SessionLocal,
+    async_engine,
+    engine,
+    open_session,
+    replica_engine,
+)
+from app.settings import DATABASE_REPLICA_LAG_INTERVAL, DATABASE_REPLICA_MAX_LAG
+from app.util.executor import run_in_db_executor
+from fastapi import Request
+from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.orm import sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# A standby that has replayed everything it received is current, even if the
+# last replayed transaction is old because the primary is idle, but only while
+# it's still streaming from the primary; otherwise its lag is unknown. Roles
+# without pg_read_all_stats only see whether a WAL receiver runs, not its
+# status. A server that isn't a standby at all (e.g. the primary itself) has
+# no lag and has everything.
+LAG_QUERY = text("""
+    SELECT
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN NOT EXISTS (
+                SELECT FROM pg_stat_wal_receiver
+                WHERE coalesce(status, 'streaming') = 'streaming'
+            ) THEN NULL
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END,
+        CASE
+            WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn()
+            ELSE pg_current_wal_lsn()
+        END
+    """)
+# Includes whatever was committed before, asynchronous commits too
+LSN_QUERY = text("SELECT pg_current_wal_insert_lsn()")
+LSN_HEADER = "X-Min-LSN"
+LSN_COOKIE = "min_lsn"
+# Reads only go to the replica while its lag is at most the maximum, so a write
+# is on the replica once it's older than that, plus the time the lag may have
+# grown since it was last measured
+WRITE_WINDOW = DATABASE_REPLICA_MAX_LAG + DATABASE_REPLICA_LAG_INTERVAL
+
+
+@dataclass
+class ReplicaStatus:
+    enabled: bool
+    # None while unknown, e.g. when the replica can't be reached
+    lag_seconds: Optional[float]
+    max_lag_seconds: float
+    replayed_lsn: Optional[str]
+    replica_reads: int
+    primary_reads: int
+
+
+@dataclass
+class RequestWrites:
+    committed: bool = False
+
+
+# Replica lag and WAL position as last measured, None while unknown
+lag: Optional[float] = None
+replayed_lsn: Optional[int] = None
+replica_reads = 0
+primary_reads = 0
+monitor_task: Optional[asyncio.Task] = None
+current_writes: ContextVar[Optional[RequestWrites]] = ContextVar(
+    "replica_writes", default=None
+)
+
+
+def is_enabled() -> bool:
+    return replica_engine is not None
+
+
+def parse_lsn(lsn: Optional[str]) -> Optional[int]:
+    """
+    A WAL position like 16/B374D848 as a number, None if it isn't one
+    """
+    try:
+        high, low = lsn.split("/")
+        return int(high, 16) << 32 | int(low, 16)
+    except (AttributeError, ValueError):
+        return None
+
+
+def format_lsn(lsn: int) -> str:
+    return f"{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}"
+
+
+def client_lsn(request: Request) -> Optional[int]:
+    """
+    The WAL position of the client's last write, as far as it told us
+    """
+    positions = [
+        parse_lsn(request.headers.get(LSN_HEADER)),
+        parse_lsn(request.cookies.get(LSN_COOKIE)),
+    ]
+    return max((lsn for lsn in positions if lsn is not None), default=None)
+
+
+def is_current(measured: Optional[float]) -> bool:
+    return measured is not None and measured <= DATABASE_REPLICA_MAX_LAG
+
+
+def use_replica(min_lsn: Optional[int]) -> bool:
+    if not is_enabled() or not is_current(lag):
+        return False
+    return min_lsn is None or (replayed_lsn is not None and replayed_lsn >= min_lsn)
+
+
+def read_session_factory(min_lsn: Optional[int]) -> sessionmaker:
+    """
+    The blocking session factory reads of a client should use, e.g. for
+    sessions outliving the request
+    """
+    global replica_reads, primary_reads
+    if use_replica(min_lsn):
+        replica_reads += 1
+        return ReplicaSessionLocal
+    primary_reads += 1
+    return SessionLocal
+
+
+async def get_read_db(request: Request):
+    """
+    Like `get_db`, but on the replica when it has the client's writes
+    """
+    global replica_reads, primary_reads
+    if use_replica(client_lsn(request)):
+        replica_reads += 1
+        factories = (ReplicaSessionLocal, AsyncReplicaSessionLocal)
+    else:
+        primary_reads += 1
+        factories = (SessionLocal, AsyncSessionLocal)
+    async with open_session(*factories) as db:
+        yield db
+
+
+def get_status() -> ReplicaStatus:
+    return ReplicaStatus(
+        enabled=is_enabled(),
+        lag_seconds=lag,
+        max_lag_seconds=DATABASE_REPLICA_MAX_LAG,
+        replayed_lsn=format_lsn(replayed_lsn) if replayed_lsn is not None else None,
+        replica_reads=replica_reads,
+        primary_reads=primary_reads,
+    )
+
+
+def measure_lag() -> Tuple[Optional[float], Optional[int]]:
+    with replica_engine.connect() as connection:
+        measured, lsn = connection.execute(LAG_QUERY).one()
+    return (float(measured) if measured is not None else None), parse_lsn(lsn)
+
+
+def current_lsn() -> str:
+    with engine.connect() as connection:
+        return connection.execute(LSN_QUERY).scalar()
+
+
+def _commit(conn):
+    writes = current_writes.get()
+    if writes is not None:
+        writes.committed = True
+
+
+def install():
+    """
+    Note commits on the primary, for `ReplicaMiddleware`
+    """
+    event.listen(engine, "commit", _commit)
+    if async_engine is not None:
+        event.listen(async_engine.sync_engine, "commit", _commit)
+
+
+class ReplicaMiddleware:
+    """
+    Hands clients the WAL position after their writes, see above
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        writes = RequestWrites()
+        token = current_writes.set(writes)
+        try:
+
+            async def send_with_lsn(message: Message):
+                if message["type"] == "http.response.start" and writes.committed:
+                    try:
+                        lsn = await run_in_db_executor(current_lsn)
+                    except Exception as e:
+                        logger.warning(f"Failed to get the WAL position: {e}")
+                    else:
+                        headers = MutableHeaders(scope=message)
+                        headers[LSN_HEADER] = lsn
+                        headers.append(
+                            "Set-Cookie",
+                            f"{LSN_COOKIE}={lsn}; Max-Age={math.ceil(WRITE_WINDOW)}; "
+                            "Path=/; HttpOnly; SameSite=Lax",
+                        )
+                await send(message)
+
+            await self.app(scope, receive, send_with_lsn)
+        finally:
+            current_writes.reset(token)
+
+
+async def monitor_forever():
+    global lag, replayed_lsn
+    while True:
+        try:
+            measured, lsn = await run_in_db_executor(measure_lag)
+        except Exception as e:
+            measured = lsn = None
+            logger.warning(f"Failed to measure replica lag: {e}")
+        if is_current(measured) and not is_current(lag):
+            logger.info(f"Reading from the replica, replica lag is {measured}")
+        elif is_current(lag) and not is_current(measured):
+            logger.warning(f"Reading from the primary, replica lag is {measured}")
+        lag, replayed_lsn = measured, lsn
+        await asyncio.sleep(DATABASE_REPLICA_LAG_INTERVAL)
+
+
+def start():
+    global monitor_task
+    if is_enabled():
+        monitor_task = asyncio.create_task(monitor_forever())
+
+
+def stop():
+    if monitor_task is not None:
+        monitor_task.cancel()
@@ -0,0 +1,29 @@
+# Fast responses for large listings. Rows are plain dicts built from SQL tuples
+# and encoded by orjson, skipping ORM instances, pydantic validation and
+# `jsonable_encoder`. The output matches what the response models produce.
+from decimal import Decimal
+from typing import Iterable, List
+
+import orjson
+from fastapi.responses import JSONResponse
+from sqlalchemy.engine import Row
+
+
+def default(value):
+    if isinstance(value, Decimal):
+        # As pydantic encodes them
+        return float(value)
+    raise TypeError
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=default)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def to_dicts(rows: Iterable[Row]) -> List[dict]:
+    return [row._asdict() for row in rows]
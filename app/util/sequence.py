@@ -0,0 +1,20 @@
+from datetime import datetime
+from typing import Tuple
+
+import pytz
+from app.database.crud import devices
+from sqlalchemy.orm import Session
+
+
+def take_numbers(db: Session, device_id: int, count: int = 1) -> Tuple[range, datetime]:
+    """
+    Take the next `count` invoice sequence numbers of a device, and the time to
+    issue them at.
+
+    The time is taken while the caller's transaction holds the device row lock,
+    so across all workers a device's later numbers are never issued at an
+    earlier time. The numbers are the caller's until it commits, and are taken
+    again by the next request if it rolls back.
+    """
+    numbers = devices.reserve_ids(db, device_id, count)
+    return numbers, datetime.now(tz=pytz.UTC)
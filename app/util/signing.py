@@ -0,0 +1,108 @@
+# ZOI signing in a pool of worker processes, so that RSA signatures are spread
+# across all cores instead of competing with request handling for the GIL. Each
+# worker keeps a parsed signing key per company, for the most recently used
+# CERTIFICATE_CACHE_SIZE companies.
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+from app.settings import CERTIFICATE_CACHE_SIZE, ZOI_SIGNING_PROCESSES
+from loguru import logger
+
+from .furs_client import InvoiceAPI, KeyConnector
+
+# (tax number, path to the .p12 file, .p12 password, hash of the .p12 contents)
+Credentials = Tuple[int, Path, str, Optional[str]]
+
+signing_pool: Optional[ProcessPoolExecutor] = None
+signing_processes = 0
+
+
+# Worker process state: parsed signing keys per company tax number, least
+# recently used first
+_signers: "OrderedDict[int, Tuple[Credentials, InvoiceAPI]]" = OrderedDict()
+
+
+def _get_signer(credentials: Credentials) -> InvoiceAPI:
+    tax_id = credentials[0]
+    cached = _signers.get(tax_id)
+    if cached is None or cached[0] != credentials:
+        _, cert_path, cert_password, _ = credentials
+        signer = InvoiceAPI(KeyConnector(cert_path, cert_password))
+        cached = _signers[tax_id] = (credentials, signer)
+        while len(_signers) > CERTIFICATE_CACHE_SIZE:
+            _signers.popitem(last=False)
+    _signers.move_to_end(tax_id)
+    return cached[1]
+
+
+def _preload(all_credentials: List[Credentials]):
+    for credentials in all_credentials[-CERTIFICATE_CACHE_SIZE:]:
+        try:
+            _get_signer(credentials)
+        except Exception:
+            # Reported by the parent process when the key is actually used
+            pass
+
+
+def _calculate_zois(credentials: Credentials, requests: List[tuple]) -> List[str]:
+    signer = _get_signer(credentials)
+    return [signer.calculate_zoi(*request) for request in requests]
+
+
+def is_enabled() -> bool:
+    return signing_pool is not None
+
+
+def start(all_credentials: List[Credentials], processes: int = ZOI_SIGNING_PROCESSES):
+    """
+    Start the signing pool and preload the given keys in every worker. Called
+    on startup, before the executors start any threads.
+    """
+    global signing_pool, signing_processes
+    if processes <= 0:
+        return
+    # Fork, so that the workers don't re-import (and re-initialize) the app
+    signing_processes = processes
+    signing_pool = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_preload,
+        initargs=(all_credentials,),
+    )
+    # The pool would otherwise only fork its workers on the first request, from
+    # a process running executor threads whose locks the children could
+    # inherit in a held state. All workers are forked at once.
+    signing_pool.submit(int).result()
+    logger.info(f"Started {processes} ZOI signing process(es)")
+
+
+def shutdown():
+    global signing_pool
+    if signing_pool is not None:
+        signing_pool.shutdown(wait=False, cancel_futures=True)
+        signing_pool = None
+
+
+async def calculate_zois(
+    credentials: Credentials, requests: Sequence[tuple]
+) -> List[str]:
+    """
+    Calculate ZOIs for a batch of `FURSInvoiceAPI.calculate_zoi` argument
+    tuples. Large batches are split across all workers.
+    """
+    loop = asyncio.get_running_loop()
+    chunk_size = max(1, -(-len(requests) // signing_processes))
+    chunks = [
+        list(requests[i : i + chunk_size]) for i in range(0, len(requests), chunk_size)
+    ]
+    results = await asyncio.gather(
+        *(
+            loop.run_in_executor(signing_pool, _calculate_zois, credentials, chunk)
+            for chunk in chunks
+        )
+    )
+    return [zoi for chunk in results for zoi in chunk]
@@ -0,0 +1,99 @@
+# Per-request SQL statement counts and time, to catch N+1 query patterns. When
+# enabled, every response carries X-SQL-Statements, X-SQL-Time-Ms and
+# X-SQL-Pool-Wait-Ms headers, and requests running more than
+# SQL_STATEMENT_WARNING statements are logged.
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from app.database import get_engines, pool
+from app.settings import SQL_DEBUG_HEADERS, SQL_STATEMENT_WARNING
+from loguru import logger
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+@dataclass
+class SqlStats:
+    statements: int = 0
+    seconds: float = 0.0
+    # Spent waiting for connections from the pool
+    pool_wait_seconds: float = 0.0
+
+
+current: ContextVar[Optional[SqlStats]] = ContextVar("sql_stats", default=None)
+
+
+def is_enabled() -> bool:
+    return SQL_DEBUG_HEADERS or SQL_STATEMENT_WARNING > 0
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    conn.info.setdefault("sql_stats_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    started = conn.info["sql_stats_started"].pop()
+    stats = current.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.seconds += time.perf_counter() - started
+
+
+def _pool_wait(seconds: float):
+    stats = current.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+def install():
+    for target in get_engines().values():
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+    pool.wait_hooks.append(_pool_wait)
+
+
+@contextmanager
+def track() -> Iterator[SqlStats]:
+    """
+    Count the statements executed within the block, including those run in
+    the executor on its behalf
+    """
+    stats = SqlStats()
+    token = current.set(stats)
+    try:
+        yield stats
+    finally:
+        current.reset(token)
+
+
+class SqlStatsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track() as stats:
+
+            async def send_with_stats(message: Message):
+                # Streamed responses only count what ran before the first byte
+                if message["type"] == "http.response.start" and SQL_DEBUG_HEADERS:
+                    headers = MutableHeaders(scope=message)
+                    headers["X-SQL-Statements"] = str(stats.statements)
+                    headers["X-SQL-Time-Ms"] = f"{stats.seconds * 1000:.1f}"
+                    pool_wait_ms = stats.pool_wait_seconds * 1000
+                    headers["X-SQL-Pool-Wait-Ms"] = f"{pool_wait_ms:.1f}"
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
+        if 0 < SQL_STATEMENT_WARNING < stats.statements:
+            logger.warning(
+                f"{scope['method']} {scope['path']} ran {stats.statements} SQL "
+                f"statements in {stats.seconds * 1000:.1f} ms"
+            )
@@ -0,0 +1,161 @@
+"""
+Shared helpers for the benchmarks: environment set-up, throwaway certificates
+and machine-readable (JSON lines) result reporting.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, List, Optional, TextIO
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509.oid import NameOID
+
+# Hex key used to encrypt the certificate passwords of benchmark companies
+CERTIFICATE_KEY = "00" * 32
+
+DEFAULT_ENVIRONMENT = {
+    "DATABASE_URL": "sqlite://",
+    "JWT_KEY": "benchmark",
+    "API_KEY_SECRET": "benchmark",
+    "CERTIFICATE_KEY": CERTIFICATE_KEY,
+    "SOFTWARE_SUPPLIER_TAX_NUMBER": "12345678",
+}
+
+output: Optional[TextIO] = None
+
+
+def setup_environment(**overrides: str):
+    """
+    Configure the app for a benchmark run. Must be called before `app` is
+    imported, as settings are read at import time.
+    """
+    for name, value in DEFAULT_ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+    os.environ.update({k: str(v) for k, v in overrides.items() if v is not None})
+
+
+def generate_p12(path: Path, password: str):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "benchmark")])
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.utcnow())
+        .not_valid_after(datetime.utcnow() + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    path.write_bytes(
+        pkcs12.serialize_key_and_certificates(
+            b"benchmark",
+            key,
+            cert,
+            None,
+            serialization.BestAvailableEncryption(password.encode()),
+        )
+    )
+
+
+def encrypt_cert_key(password: str) -> str:
+    """
+    Encrypt a certificate password the way `encrypt_key.py` does
+    """
+    from base64 import b64encode
+
+    from Crypto.Cipher import ChaCha20_Poly1305
+
+    cipher = ChaCha20_Poly1305.new(key=bytes.fromhex(os.environ["CERTIFICATE_KEY"]))
+    ciphertext, tag = cipher.encrypt_and_digest(password.encode("utf-8"))
+    jk = ["nonce", "ciphertext", "tag"]
+    jv = [b64encode(x).decode("utf-8") for x in (cipher.nonce, ciphertext, tag)]
+    return json.dumps(dict(zip(jk, jv)), separators=(",", ":"))
+
+
+def revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure(func: Callable[[], object], count: int) -> List[float]:
+    """
+    Call `func` `count` times, returning the duration of every call
+    """
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(
+    name: str,
+    params: dict,
+    elapsed: Optional[float] = None,
+    count: Optional[int] = None,
+    samples: Optional[List[float]] = None,
+    **extra,
+):
+    """
+    Print one result as a JSON line (and append it to the output file, if
+    one was given). `elapsed` defaults to the sum of `samples`, `count` to
+    their number.
+    """
+    result = {
+        "benchmark": name,
+        "params": params,
+        "revision": revision(),
+        "python": platform.python_version(),
+        "database": os.environ["DATABASE_URL"].split(":", 1)[0],
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+    if samples:
+        count = len(samples) if count is None else count
+        elapsed = sum(samples) if elapsed is None else elapsed
+        result.update(
+            p50_ms=round(percentile(samples, 0.5) * 1000, 3),
+            p99_ms=round(percentile(samples, 0.99) * 1000, 3),
+            max_ms=round(max(samples) * 1000, 3),
+        )
+    if count is not None and elapsed is not None:
+        result.update(
+            count=count,
+            seconds=round(elapsed, 4),
+            per_second=round(count / elapsed, 1) if elapsed > 0 else None,
+        )
+    result.update(extra)
+
+    line = json.dumps(result, default=str)
+    print(line, flush=True)
+    if output is not None:
+        output.write(line + "\n")
+        output.flush()
+
+
+def skip(name: str, params: dict, reason: str):
+    report(name, params, skipped=reason)
+    print(f"{name}: skipped, {reason}", file=sys.stderr)
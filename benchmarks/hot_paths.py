@@ -0,0 +1,469 @@
+"""
+Benchmarks for the relay's hot paths, run against a throwaway database and an
+in-process FURS mock (see `furs_mock`).
+
+    python -m benchmarks.hot_paths --output results.jsonl
+    python -m benchmarks.hot_paths --database postgresql://localhost/bench \\
+        --only create_invoice,get_inc_id
+
+The database is wiped and re-created, so never point --database at real data.
+It defaults to BENCHMARK_DATABASE_URL, or a SQLite file in the temp directory.
+Benchmarks that need UPDATE/INSERT ... RETURNING (issuing invoices) only run
+on PostgreSQL and are reported as skipped on SQLite.
+
+Every result is printed as a JSON line (see `benchmarks.common.report`).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+import uvicorn
+
+from benchmarks import common
+from benchmarks.common import measure, report, skip
+from furs_mock import MockConfig, create_app
+
+BENCHMARKS = [
+    "get_current_user",
+    "create_invoice",
+    "get_inc_id",
+    "load_for_companies",
+    "list_invoices",
+    "serialize_invoices",
+]
+CERT_PASSWORD = "benchmark"
+BASE_TAX_ID = 10000000
+SEED_CHUNK_SIZE = 10000
+SEED_ISSUED_AT = datetime(2022, 1, 1)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_furs_mock(port: int, latency: float) -> uvicorn.Server:
+    server = uvicorn.Server(
+        uvicorn.Config(
+            create_app(MockConfig(latency_median=latency, seed=0)),
+            host="127.0.0.1",
+            port=port,
+            log_level="warning",
+        )
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def supports_returning() -> bool:
+    from app.database import engine
+
+    return engine.dialect.name == "postgresql"
+
+
+def reset_database():
+    from app.database import engine, migrations, models
+
+    models.Base.metadata.drop_all(bind=engine)
+    migrations.upgrade(engine)
+
+
+def create_company(db, index: int, cert_file: Path):
+    """
+    Create an active company with its certificate, an admin user, a movable
+    premise and a device
+    """
+    from app.database import models
+    from app.settings import CERTIFICATE_DIR
+    from argon2 import PasswordHasher
+
+    tax_id = BASE_TAX_ID + index
+    (CERTIFICATE_DIR / f"{tax_id}.p12").write_bytes(cert_file.read_bytes())
+    company = models.Company(
+        name=f"Company {index}",
+        tax_id=tax_id,
+        cert_key=common.encrypt_cert_key(CERT_PASSWORD),
+    )
+    db.add(company)
+    db.flush()
+    premise = models.BusinessPremise(
+        furs_id=f"BP{index}",
+        premise_type=models.BusinessPremiseType.MOVABLE,
+        movable_type=models.MovablePremiseType.A,
+        company_id=company.id,
+    )
+    db.add(premise)
+    db.add(
+        models.User(
+            username=f"admin{index}",
+            email=f"admin{index}@example.com",
+            password=PasswordHasher().hash(CERT_PASSWORD),
+            role=models.UserRole.ADMIN,
+            company_id=company.id,
+        )
+    )
+    db.flush()
+    device = models.Device(device_id=f"DEV{index}", premise_id=premise.id)
+    db.add(device)
+    db.commit()
+    db.refresh(company)
+    db.refresh(device)
+    return company, device
+
+
+def invoice_body(device_id: int) -> dict:
+    return {
+        "device_id": device_id,
+        "operator_tax_id": 12345678,
+        "prices": [
+            {"amount": "12.20", "tax_rate": "22"},
+            {"amount": "9.50", "tax_rate": "9.5"},
+        ],
+    }
+
+
+def bench_get_current_user(ctx, args):
+    from app.database import SessionLocal
+    from app.util.auth import get_current_user
+
+    params = {"calls": args.calls}
+
+    async def validate_all() -> List[float]:
+        samples = []
+        with SessionLocal() as db:
+            for _ in range(args.calls):
+                start = time.perf_counter()
+                await get_current_user(ctx.token, db)
+                samples.append(time.perf_counter() - start)
+        return samples
+
+    report("get_current_user", params, samples=asyncio.run(validate_all()))
+
+
+def bench_create_invoice(ctx, args):
+    params = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "furs_latency": args.furs_latency,
+    }
+    if not supports_returning():
+        return skip("create_invoice", params, "needs PostgreSQL")
+
+    def create():
+        response = ctx.client.post(
+            "/invoices/create", json=invoice_body(ctx.device.id), headers=ctx.headers
+        )
+        assert response.status_code == 201, response.text
+
+    # Warm up connections and the breaker
+    create()
+    start = time.perf_counter()
+    if args.concurrency <= 1:
+        samples = measure(create, args.requests)
+    else:
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            per_thread = args.requests // args.concurrency
+            futures = [
+                pool.submit(measure, create, per_thread)
+                for _ in range(args.concurrency)
+            ]
+            samples = [sample for future in futures for sample in future.result()]
+    report("create_invoice", params, time.perf_counter() - start, samples=samples)
+
+
+def bench_get_inc_id(ctx, args):
+    from app.database import SessionLocal
+    from app.database.crud import devices
+
+    for threads in args.threads:
+        params = {"threads": threads, "calls": args.calls}
+        if not supports_returning():
+            skip("get_inc_id", params, "needs PostgreSQL")
+            continue
+
+        def take_id():
+            with SessionLocal() as db:
+                devices.get_inc_id(db, ctx.device.id)
+                db.commit()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            futures = [
+                pool.submit(measure, take_id, args.calls // threads)
+                for _ in range(threads)
+            ]
+            samples = [sample for future in futures for sample in future.result()]
+        report("get_inc_id", params, time.perf_counter() - start, samples=samples)
+
+
+def bench_load_for_companies(ctx, args):
+    from app.database import SessionLocal, models
+    from app.util import certificates
+
+    created = 0
+    for count in args.companies:
+        with SessionLocal() as db:
+            while created < count:
+                # Index 0 is the base company
+                created += 1
+                create_company(db, created, ctx.cert_file)
+            companies = (
+                db.query(models.Company)
+                .filter(models.Company.tax_id > BASE_TAX_ID)
+                .order_by(models.Company.tax_id)
+                .limit(count)
+                .all()
+            )
+
+        def load():
+            for company in companies:
+                certificates.loaded_certificates.pop(company.id, None)
+            certificates.load_for_companies(companies)
+
+        samples = measure(load, args.repeat)
+        params = {"companies": count}
+        report("load_for_companies", params, count=count * args.repeat, samples=samples)
+    # Leave only the base company loaded
+    for company in companies:
+        certificates.loaded_certificates.pop(company.id, None)
+    certificates.load_for_companies([ctx.company])
+
+
+def seed_invoices(ctx, first: int, last: int):
+    from app.database import SessionLocal, models
+    from sqlalchemy import insert
+
+    with SessionLocal() as db:
+        for chunk in range(first, last + 1, SEED_CHUNK_SIZE):
+            rows = [
+                {
+                    "zoi": f"{i:032x}",
+                    "eor": f"00000000-0000-4000-8000-{i:012d}",
+                    "invoice_number": f"BP0-DEV0-{i}",
+                    "issued_at": SEED_ISSUED_AT + timedelta(seconds=i),
+                    "total": 21.7,
+                    "status": models.InvoiceStatus.SUBMITTED,
+                    "submit_attempts": 0,
+                    "user_id": ctx.user_id,
+                    "company_id": ctx.company.id,
+                    "device_id": ctx.device.id,
+                }
+                for i in range(chunk, min(chunk + SEED_CHUNK_SIZE, last + 1))
+            ]
+            db.execute(insert(models.Invoice), rows)
+            db.commit()
+
+
+def ensure_invoices(ctx, count: int):
+    from app.database import SessionLocal, models
+
+    with SessionLocal() as db:
+        seeded = db.query(models.Invoice).count()
+    if seeded < count:
+        start = time.perf_counter()
+        seed_invoices(ctx, seeded + 1, count)
+        elapsed = time.perf_counter() - start
+        report("seed_invoices", {"invoices": count}, elapsed, count - seeded)
+
+
+def bench_list_invoices(ctx, args):
+    from app.util.pagination import encode_cursor
+
+    for count in args.invoices:
+        ensure_invoices(ctx, count)
+
+        # The newest page, and the oldest one: keyset pages cost the same
+        # however deep they are
+        oldest = encode_cursor(
+            SEED_ISSUED_AT + timedelta(seconds=args.page_size + 1), 0
+        )
+        for name, endpoint, cursor in (
+            ("list_invoices", "/invoices/list", None),
+            ("list_invoices.deep", "/invoices/list", oldest),
+            ("list_invoices.all", "/invoices/list/all", None),
+        ):
+            sizes = []
+            params = {"limit": args.page_size}
+            if cursor is not None:
+                params["cursor"] = cursor
+
+            def fetch():
+                response = ctx.client.get(endpoint, params=params, headers=ctx.headers)
+                assert response.status_code == 200, response.text
+                assert len(response.json()["invoices"]) == args.page_size
+                sizes.append(len(response.content))
+
+            samples = measure(fetch, args.repeat)
+            report(
+                name,
+                {"invoices": count, "endpoint": endpoint, "page_size": args.page_size},
+                count=args.repeat,
+                samples=samples,
+                rows_per_second=round(args.page_size * args.repeat / sum(samples), 1),
+                response_bytes=sizes[-1],
+            )
+
+
+def bench_serialize_invoices(ctx, args):
+    """
+    A page of `--rows` invoices encoded through ORM instances, pydantic and
+    `jsonable_encoder` (FastAPI's default), against plain rows and orjson, and
+    the whole request with each response encoding
+    """
+    from app.database import SessionLocal, models, schemas
+    from app.database.crud import invoices
+    from app.util.responses import FastJSONResponse, to_dicts
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    ensure_invoices(ctx, args.rows)
+    params = {"rows": args.rows}
+    newest_first = (models.Invoice.issued_at.desc(), models.Invoice.id.desc())
+
+    def orm():
+        with SessionLocal() as db:
+            page = db.query(models.Invoice).order_by(*newest_first).limit(args.rows)
+            content = [schemas.Invoice.from_orm(invoice) for invoice in page]
+            return JSONResponse(jsonable_encoder(content)).body
+
+    def fast():
+        with SessionLocal() as db:
+            page = invoices.get_page(db, schemas.InvoiceFilter(), args.rows)
+            return FastJSONResponse(to_dicts(page)).body
+
+    assert json.loads(orm()) == json.loads(fast())
+    for name, func in (("orm", orm), ("fast", fast)):
+        samples = measure(func, args.repeat)
+        report(
+            f"serialize_invoices.{name}",
+            params,
+            count=args.repeat,
+            samples=samples,
+            rows_per_second=round(args.rows * args.repeat / sum(samples), 1),
+        )
+
+    for encoding in ("identity", "gzip", "br"):
+        sizes = []
+
+        def fetch():
+            response = ctx.client.get(
+                "/invoices/list",
+                params={"limit": args.rows},
+                headers={**ctx.headers, "Accept-Encoding": encoding},
+            )
+            assert response.status_code == 200, response.text
+            sizes.append(int(response.headers["Content-Length"]))
+
+        samples = measure(fetch, args.repeat)
+        report(
+            "serialize_invoices.http",
+            {**params, "encoding": encoding},
+            count=args.repeat,
+            samples=samples,
+            rows_per_second=round(args.rows * args.repeat / sum(samples), 1),
+            response_bytes=sizes[-1],
+        )
+
+
+class Context:
+    pass
+
+
+def run(args, workdir: Path):
+    from fastapi.testclient import TestClient
+
+    from app import app
+    from app.database import SessionLocal, models
+
+    reset_database()
+    ctx = Context()
+    ctx.cert_file = workdir / "benchmark.p12"
+    common.generate_p12(ctx.cert_file, CERT_PASSWORD)
+    with SessionLocal() as db:
+        ctx.company, ctx.device = create_company(db, 0, ctx.cert_file)
+        ctx.user_id = db.query(models.User.id).filter_by(username="admin0").scalar()
+
+    with TestClient(app) as client:
+        ctx.client = client
+        response = client.post(
+            "/auth/token", data={"username": "admin0", "password": CERT_PASSWORD}
+        )
+        ctx.token = response.json()["access_token"]
+        ctx.headers = {"Authorization": f"Bearer {ctx.token}"}
+
+        for name in args.only:
+            globals()[f"bench_{name}"](ctx, args)
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--database",
+        default=os.getenv("BENCHMARK_DATABASE_URL"),
+        help="Database to benchmark against; it is wiped first",
+    )
+    parser.add_argument(
+        "--only",
+        default=BENCHMARKS,
+        type=lambda value: value.split(","),
+        help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}",
+    )
+    parser.add_argument("--output", type=Path, help="Append results to this file")
+    parser.add_argument("--furs-latency", default=0.05, type=float)
+    parser.add_argument("--requests", default=200, type=int)
+    parser.add_argument("--concurrency", default=1, type=int)
+    parser.add_argument("--calls", default=1000, type=int)
+    parser.add_argument("--threads", default=[1, 4, 16], type=int_list)
+    parser.add_argument("--companies", default=[1, 10, 100], type=int_list)
+    parser.add_argument(
+        "--invoices", default=[10_000, 100_000, 1_000_000], type=int_list
+    )
+    parser.add_argument("--page-size", default=100, type=int)
+    parser.add_argument("--rows", default=10_000, type=int)
+    parser.add_argument("--repeat", default=3, type=int)
+    args = parser.parse_args()
+    unknown = set(args.only) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        (workdir / "certificates").mkdir()
+        port = free_port()
+        common.setup_environment(
+            DATABASE_URL=args.database
+            or f"sqlite:///{workdir / 'benchmark.db'}?check_same_thread=false",
+            CERTIFICATE_DIR=workdir / "certificates",
+            FURS_API_ENDPOINT=f"http://127.0.0.1:{port}",
+            INVOICE_PAGE_MAX_SIZE=max(args.rows, args.page_size),
+        )
+        mock = start_furs_mock(port, args.furs_latency)
+        try:
+            if args.output is not None:
+                common.output = args.output.open("a")
+            run(args, workdir)
+        finally:
+            mock.should_exit = True
+            if common.output is not None:
+                common.output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare ZOI signing throughput in-process and in the signing process pool.
+
+    python -m benchmarks.zoi_signing --invoices 2000 --processes 4
+
+Uses a throwaway self-signed certificate unless --p12/--password are given.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+from benchmarks import common
+from benchmarks.common import generate_p12, report, setup_environment
+
+setup_environment()
+
+
+def zoi_requests(count: int):
+    issued_at = datetime.utcnow()
+    return [
+        (12345678, issued_at, str(i), "PP1", "DEV1", Decimal("12.34"))
+        for i in range(1, count + 1)
+    ]
+
+
+async def run(args, cert_path: Path, password: str):
+    from app.util import signing
+    from app.util.certificates import CompanyAPI
+    from furs_fiscal.api import FURSInvoiceAPI
+
+    requests = zoi_requests(args.invoices)
+    params = {"invoices": args.invoices, "processes": args.processes}
+    api = FURSInvoiceAPI(p12_path=cert_path, p12_password=password, production=False)
+    company_api = CompanyAPI(12345678, api, None, cert_path, password)
+
+    def done(name: str, start: float):
+        report(
+            f"zoi_signing.{name}", params, time.perf_counter() - start, len(requests)
+        )
+
+    start = time.perf_counter()
+    for request in requests:
+        api.calculate_zoi(*request)
+    done("in_process", start)
+
+    start = time.perf_counter()
+    await company_api.calculate_zois(requests)
+    done("thread_pool", start)
+
+    signing.start([company_api.credentials], processes=args.processes)
+    try:
+        # Warm up the workers, so that process start-up isn't measured
+        await company_api.calculate_zois(requests[: args.processes])
+
+        start = time.perf_counter()
+        await company_api.calculate_zois(requests)
+        done("process_pool_batch", start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(company_api.calculate_zoi(*r) for r in requests))
+        done("process_pool_single", start)
+    finally:
+        signing.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--invoices", default=2000, type=int)
+    parser.add_argument("--processes", default=os.cpu_count(), type=int)
+    parser.add_argument("--p12", type=Path)
+    parser.add_argument("--password", default="benchmark")
+    parser.add_argument("--output", type=Path, help="Append results to this file")
+    args = parser.parse_args()
+    if args.output is not None:
+        common.output = args.output.open("a")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert_path = args.p12
+        if cert_path is None:
+            cert_path = Path(tmp) / "benchmark.p12"
+            generate_p12(cert_path, args.password)
+        asyncio.run(run(args, cert_path, args.password))
+
+
+if __name__ == "__main__":
+    main()
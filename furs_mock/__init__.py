@@ -0,0 +1,110 @@
+import asyncio
+import json
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException
+from jose import jws
+from pydantic import BaseModel
+
+REGISTER_BUSINESS_UNIT_PATH = "/v1/cash_registers/invoices/register"
+INVOICE_ISSUE_PATH = "/v1/cash_registers/invoices"
+ECHO_PATH = "/v1/cash_registers/echo"
+
+# Responses are not verified by the client, any key will do
+SIGNING_KEY = "furs-mock"
+
+
+@dataclass
+class MockConfig:
+    # Log-normal latency distribution; a sigma of 0 gives a fixed latency
+    latency_median: float = 0.05
+    latency_sigma: float = 0.0
+    # Share of requests answered with a FURS error message
+    error_rate: float = 0.0
+    # Share of requests answered with HTTP 500
+    http_error_rate: float = 0.0
+    # Share of requests that are only answered after `timeout_seconds`
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 60.0
+    seed: Optional[int] = None
+
+
+class SignedMessage(BaseModel):
+    token: str
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    """
+    Stand-in for the FURS invoice and business premise endpoints, with
+    configurable latency and fault injection
+    """
+    app = FastAPI(title="FURS mock")
+    rng = random.Random(config.seed)
+
+    def header() -> dict:
+        return {
+            "MessageID": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "DateTime": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def signed(message: dict) -> dict:
+        return {"token": jws.sign(message, SIGNING_KEY, algorithm="HS256")}
+
+    async def respond(response_key: str, body: dict) -> dict:
+        roll = rng.random()
+        latency = config.latency_median
+        if config.latency_sigma > 0:
+            latency = rng.lognormvariate(0, config.latency_sigma) * latency
+        if roll < config.timeout_rate:
+            latency = config.timeout_seconds
+        await asyncio.sleep(latency)
+
+        roll -= config.timeout_rate
+        if 0 <= roll < config.http_error_rate:
+            raise HTTPException(status_code=500, detail="Injected server error")
+        roll -= config.http_error_rate
+        if 0 <= roll < config.error_rate:
+            return signed(
+                {
+                    response_key: {
+                        "Header": header(),
+                        "Error": {
+                            "ErrorCode": "S100",
+                            "ErrorMessage": "Injected system error",
+                        },
+                    }
+                }
+            )
+        return signed({response_key: {"Header": header(), **body}})
+
+    def claims(message: SignedMessage, request_key: str) -> dict:
+        try:
+            data = json.loads(jws.get_unverified_claims(message.token))
+            return data[request_key]
+        except Exception:
+            raise HTTPException(status_code=400, detail="Malformed request")
+
+    @app.post(INVOICE_ISSUE_PATH)
+    async def issue_invoice(message: SignedMessage):
+        invoice = claims(message, "InvoiceRequest")
+        if "Invoice" not in invoice and "SalesBookInvoice" not in invoice:
+            raise HTTPException(status_code=400, detail="Missing invoice")
+        eor = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        return await respond("InvoiceResponse", {"UniqueInvoiceID": eor})
+
+    @app.post(REGISTER_BUSINESS_UNIT_PATH)
+    async def register_premise(message: SignedMessage):
+        premise = claims(message, "BusinessPremiseRequest")
+        if "BusinessPremise" not in premise:
+            raise HTTPException(status_code=400, detail="Missing business premise")
+        return await respond("BusinessPremiseResponse", {})
+
+    @app.post(ECHO_PATH)
+    async def echo(message: dict):
+        return {"EchoResponse": message.get("EchoRequest")}
+
+    return app
@@ -0,0 +1,38 @@
+import argparse
+
+import uvicorn
+
+from furs_mock import MockConfig, create_app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the FURS invoice and premise endpoints"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=9002, type=int)
+    parser.add_argument(
+        "--latency", default=0.05, type=float, help="Median latency in seconds"
+    )
+    parser.add_argument(
+        "--latency-sigma",
+        default=0.0,
+        type=float,
+        help="Sigma of the log-normal latency distribution (0 = fixed latency)",
+    )
+    parser.add_argument("--error-rate", default=0.0, type=float)
+    parser.add_argument("--http-error-rate", default=0.0, type=float)
+    parser.add_argument("--timeout-rate", default=0.0, type=float)
+    parser.add_argument("--timeout-seconds", default=60.0, type=float)
+    parser.add_argument("--seed", default=None, type=int)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_median=args.latency,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        http_error_rate=args.http_error_rate,
+        timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
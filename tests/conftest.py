@@ -0,0 +1,135 @@
+# Most tests run against a PostgreSQL database given in TEST_DATABASE_URL, whose
+# public schema they drop and recreate. Without it those are skipped.
+import hashlib
+import os
+from dataclasses import dataclass
+
+import pytest
+from sqlalchemy import create_engine
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+# Before anything from `app` reads its settings. Without a test database the
+# engines are still created, but never connect.
+os.environ.update(
+    DATABASE_URL=TEST_DATABASE_URL or "postgresql:///unused",
+    SQL_DEBUG_HEADERS="1",
+    CREDPATH=os.devnull,
+)
+os.environ.setdefault("JWT_KEY", "test")
+os.environ.setdefault("API_KEY_SECRET", "test")
+os.environ.setdefault("CERTIFICATE_KEY", "00" * 32)
+os.environ.setdefault("SOFTWARE_SUPPLIER_TAX_NUMBER", "12345678")
+
+if TEST_DATABASE_URL is not None:
+    engine = create_engine(TEST_DATABASE_URL)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+    engine.dispose()
+
+
+class FakeFURS:
+    """
+    Stands in for the FURS invoice API of a company
+    """
+
+    def __init__(self):
+        self.on_submit = None
+
+    def calculate_zoi(self, tax_number, issued_date, invoice_number, *args) -> str:
+        content = f"{tax_number}{issued_date}{invoice_number}{args}"
+        return hashlib.md5(content.encode()).hexdigest()
+
+    def get_invoice_eor(self, **kwargs) -> str:
+        if self.on_submit is not None:
+            self.on_submit(**kwargs)
+        return f"eor-{kwargs['invoice_number']}"
+
+
+@dataclass
+class Tenant:
+    company_id: int
+    user_id: int
+    device_id: int
+    furs: FakeFURS
+
+
+@pytest.fixture(scope="session")
+def app():
+    if TEST_DATABASE_URL is None:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from app import app
+    from app.database import engine, migrations
+
+    # The app migrates on startup, the fixtures need the tables before
+    migrations.upgrade(engine)
+    return app
+
+
+@pytest.fixture(scope="session")
+def tenant(app) -> Tenant:
+    from app.database import SessionLocal, models
+
+    with SessionLocal() as db:
+        company = models.Company(name="Company", tax_id=12345678, cert_key="{}")
+        db.add(company)
+        db.flush()
+        user = models.User(
+            username="admin",
+            email="admin@example.com",
+            password="",
+            role=models.UserRole.ADMIN,
+            company_id=company.id,
+        )
+        premise = models.BusinessPremise(
+            furs_id="P1",
+            premise_type=models.BusinessPremiseType.MOVABLE,
+            movable_type=models.MovablePremiseType.A,
+            company_id=company.id,
+        )
+        db.add_all([user, premise])
+        db.flush()
+        device = models.Device(device_id="D1", premise_id=premise.id)
+        db.add(device)
+        db.commit()
+        return Tenant(company.id, user.id, device.id, FakeFURS())
+
+
+@pytest.fixture(scope="session")
+def client(app, tenant):
+    from app.util import certificates
+    from app.util.auth import create_access_token
+    from fastapi.testclient import TestClient
+
+    token = create_access_token({"sub": str(tenant.user_id)})
+    with TestClient(app) as client:
+        certificates.loaded_certificates[tenant.company_id] = certificates.CompanyAPI(
+            12345678, tenant.furs, None
+        )
+        client.headers["Authorization"] = f"Bearer {token}"
+        # Caches the user, so that statement counts don't depend on the order
+        # the tests run in
+        client.get("/auth/me")
+        yield client
+
+
+@pytest.fixture
+def furs(tenant) -> FakeFURS:
+    yield tenant.furs
+    tenant.furs.on_submit = None
+
+
+@pytest.fixture
+def new_invoice(tenant):
+    """
+    Builds the body of an invoice to create for the tenant's device
+    """
+
+    def new_invoice(**kwargs) -> dict:
+        return {
+            "device_id": tenant.device_id,
+            "operator_tax_id": 12345678,
+            "prices": [{"amount": "10.00", "tax_rate": "22"}],
+            **kwargs,
+        }
+
+    return new_invoice
@@ -0,0 +1,24 @@
+def test_api_keys_only_issue_invoices(client, tenant, new_invoice):
+    created = client.post(f"/devices/api-keys/create/{tenant.device_id}", json={})
+    assert created.status_code == 201
+    headers = {"Authorization": f"Bearer {created.json()['key']}"}
+
+    response = client.post("/invoices/create", json=new_invoice(), headers=headers)
+    assert response.status_code == 201
+
+    # The key's user is an admin, the key isn't
+    for path in ["/auth/me", "/invoices/list", "/users/list", "/companies/list"]:
+        assert client.get(path, headers=headers).status_code == 403
+
+
+def test_api_keys_are_disabled_without_a_secret(client, tenant, monkeypatch):
+    from app.util import api_keys
+
+    created = client.post(f"/devices/api-keys/create/{tenant.device_id}", json={})
+    headers = {"Authorization": f"Bearer {created.json()['key']}"}
+
+    monkeypatch.setattr(api_keys, "API_KEY_SECRET", None)
+    response = client.post(f"/devices/api-keys/create/{tenant.device_id}", json={})
+    assert response.status_code == 404
+    assert client.get(f"/devices/api-keys/list/{tenant.device_id}").status_code == 404
+    assert client.get("/auth/me", headers=headers).status_code == 401
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from app.util import breaker
+from app.util.breaker import BreakerState, CircuitBreaker, CircuitOpenError
+from furs_fiscal.exceptions import ConnectionException, FURSException
+from requests import ConnectionError
+
+
+def fail(error: Exception):
+    def call():
+        raise error
+
+    return call
+
+
+def call(circuit: CircuitBreaker, func):
+    return asyncio.run(circuit.call(func))
+
+
+@pytest.fixture
+def circuit(monkeypatch) -> CircuitBreaker:
+    monkeypatch.setattr(breaker, "FURS_BREAKER_MIN_REQUESTS", 4)
+    monkeypatch.setattr(breaker, "FURS_BREAKER_ERROR_THRESHOLD", 0.5)
+    monkeypatch.setattr(breaker, "FURS_BREAKER_HALF_OPEN_PROBES", 1)
+    return CircuitBreaker("test")
+
+
+def trip(circuit: CircuitBreaker):
+    for _ in range(4):
+        with pytest.raises(ConnectionError):
+            call(circuit, fail(ConnectionError("refused")))
+    assert circuit.state == BreakerState.OPEN
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        ConnectionError("refused"),
+        ConnectionException(code=503, message="Unavailable"),
+    ],
+)
+def test_unavailable_furs_counts_as_failure(circuit, error):
+    with pytest.raises(type(error)):
+        call(circuit, fail(error))
+    assert circuit.status().requests == 1
+    assert circuit.error_rate == 1
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        FURSException(code="S001", message="Invalid tax number"),
+        ConnectionException(code=400, message="Bad request"),
+        ValueError("Invalid invoice"),
+    ],
+)
+def test_rejected_requests_do_not_count(circuit, error):
+    for _ in range(10):
+        with pytest.raises(type(error)):
+            call(circuit, fail(error))
+    assert circuit.state == BreakerState.CLOSED
+    assert circuit.status().requests == 0
+
+
+def test_opens_and_closes_after_a_probe(circuit, monkeypatch):
+    trip(circuit)
+    with pytest.raises(CircuitOpenError):
+        call(circuit, lambda: "eor")
+
+    # After the cool-down, a probe is let through
+    monkeypatch.setattr(breaker, "FURS_BREAKER_OPEN_SECONDS", 0)
+    assert call(circuit, lambda: "eor") == "eor"
+    assert circuit.state == BreakerState.CLOSED
+    assert circuit.status().requests == 1
+
+
+def test_failed_probe_opens_again(circuit, monkeypatch):
+    trip(circuit)
+    monkeypatch.setattr(breaker, "FURS_BREAKER_OPEN_SECONDS", 0)
+    with pytest.raises(ConnectionError):
+        call(circuit, fail(ConnectionError("refused")))
+    assert circuit.state == BreakerState.OPEN
+
+
+def test_rejected_probe_frees_its_slot(circuit, monkeypatch):
+    trip(circuit)
+    monkeypatch.setattr(breaker, "FURS_BREAKER_OPEN_SECONDS", 0)
+    with pytest.raises(FURSException):
+        call(circuit, fail(FURSException(code="S001", message="Invalid")))
+    assert circuit.state == BreakerState.HALF_OPEN
+
+    assert call(circuit, lambda: "eor") == "eor"
+    assert circuit.state == BreakerState.CLOSED
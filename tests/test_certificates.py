@@ -0,0 +1,139 @@
+# Certificates are loaded from throwaway .p12 files, with the database lookups
+# of companies replaced
+import asyncio
+import gc
+from collections import OrderedDict
+from pathlib import Path
+
+import pytest
+from app.database import models
+from app.util import certificates
+from app.util.furs_client import request_timeout
+from benchmarks.common import encrypt_cert_key, generate_p12
+
+PASSWORD = "secret"
+
+
+@pytest.fixture(scope="module")
+def p12(tmp_path_factory) -> bytes:
+    path = tmp_path_factory.mktemp("p12") / "certificate.p12"
+    generate_p12(path, PASSWORD)
+    return path.read_bytes()
+
+
+@pytest.fixture
+def certificate_dir(tmp_path, monkeypatch) -> Path:
+    monkeypatch.setattr(certificates, "CERTIFICATE_DIR", tmp_path)
+    monkeypatch.setattr(certificates, "loaded_certificates", OrderedDict())
+    monkeypatch.setattr(certificates, "last_used", {})
+    monkeypatch.setattr(certificates, "not_loadable", {})
+    monkeypatch.setattr(certificates, "company_limits", {})
+    return tmp_path
+
+
+@pytest.fixture
+def new_company(certificate_dir, p12):
+    def new_company(company_id: int, password: str = PASSWORD) -> models.Company:
+        company = models.Company(
+            id=company_id,
+            name=f"Company {company_id}",
+            tax_id=10000000 + company_id,
+            cert_key=encrypt_cert_key(password),
+            is_active=True,
+        )
+        certificates.certificate_path(company).write_bytes(p12)
+        return company
+
+    return new_company
+
+
+def test_apis_share_one_parsed_certificate(new_company):
+    company_api = certificates.create_company_api(new_company(1))
+    connector = company_api.api.connector
+    assert company_api.premise_api.connector is connector
+
+    # The connector's PEM files go with it
+    files = [Path(connector.cert_temp.name), Path(connector.pkey_temp.name)]
+    assert all(path.exists() for path in files)
+    del company_api, connector
+    gc.collect()
+    assert not any(path.exists() for path in files)
+
+
+def test_certificates_that_do_not_load_are_skipped(new_company):
+    wrong_password = new_company(1, password="wrong")
+    no_certificate = new_company(2)
+    certificates.certificate_path(no_certificate).unlink()
+    loaded = certificates.create_company_apis(
+        [wrong_password, no_certificate, new_company(3)]
+    )
+    assert loaded[:2] == [None, None]
+    assert loaded[2].tax_id == 10000003
+
+
+def test_request_timeout_is_per_thread(new_company):
+    connector = certificates.create_company_api(new_company(1)).api.connector
+    default = connector.request_timeout
+    with request_timeout(1.5):
+        assert connector.request_timeout == 1.5
+    assert connector.request_timeout == default
+
+
+def test_evicted_companies_keep_their_limits(new_company, monkeypatch):
+    monkeypatch.setattr(certificates, "CERTIFICATE_LAZY_LOADING", True)
+    monkeypatch.setattr(certificates, "CERTIFICATE_CACHE_SIZE", 2)
+    companies = {company_id: new_company(company_id) for company_id in [1, 2, 3]}
+    monkeypatch.setattr(certificates, "get_company", companies.get)
+    evictions = certificates.get_stats().evictions
+
+    async def use_companies():
+        first = await certificates.get_api_for_company(1)
+        breaker, limiter = first.breaker("invoices"), first.limiter
+        await certificates.get_api_for_company(2)
+        # Used again, so the second one is the least recently used
+        assert await certificates.get_api_for_company(1) is first
+        await certificates.get_api_for_company(3)
+        assert list(certificates.loaded_certificates) == [1, 3]
+
+        await certificates.get_api_for_company(2)
+        await certificates.get_api_for_company(3)
+        assert list(certificates.loaded_certificates) == [2, 3]
+        reloaded = await certificates.get_api_for_company(1)
+        assert reloaded is not first
+        assert reloaded.breaker("invoices") is breaker
+        assert reloaded.limiter is limiter
+
+    asyncio.run(use_companies())
+    assert certificates.get_stats().evictions == evictions + 3
+
+
+def test_refresh_swaps_in_a_new_mapping(new_company, monkeypatch):
+    companies = [new_company(company_id) for company_id in [1, 2, 3]]
+    active = companies
+    monkeypatch.setattr(certificates, "get_active_companies", lambda: active)
+    certificates.load()
+    before = certificates.loaded_certificates
+    loaded = dict(before)
+
+    # Unchanged but touched, with a new password, disabled
+    certificates.certificate_path(companies[0]).touch()
+    companies[1].cert_key = encrypt_cert_key(PASSWORD)
+    active = companies[:2]
+    # Loaded while the refresh reads the companies
+    lazily_loaded = certificates.create_company_api(new_company(4))
+
+    def get_active_companies():
+        certificates.loaded_certificates[4] = lazily_loaded
+        return active
+
+    monkeypatch.setattr(certificates, "get_active_companies", get_active_companies)
+    asyncio.run(certificates.refresh())
+
+    after = certificates.loaded_certificates
+    assert after is not before
+    assert list(after) == [1, 2, 4]
+    assert after[1] is loaded[1]
+    assert after[2] is not loaded[2]
+    assert after[4] is lazily_loaded
+    # Requests holding the old mapping still see all of it
+    assert [before[company_id] for company_id in [1, 2, 3]] == list(loaded.values())
@@ -0,0 +1,113 @@
+import asyncio
+import gzip
+import zlib
+from typing import List, Tuple
+
+import pytest
+from app.util import compression
+from app.util.compression import BrotliCompressor, CompressionMiddleware, GzipCompressor
+from starlette.datastructures import Headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+needs_brotli = pytest.mark.skipif(brotli is None, reason="brotli is not installed")
+
+BODY = b'{"invoice_number": "P1-D1-1", "total": 10.0}\n' * 100
+
+
+def respond(
+    chunks: List[bytes], accept_encoding: str, content_encoding: str = None
+) -> Tuple[Headers, List[bytes]]:
+    """
+    Send the chunks through the middleware, return the headers and body chunks
+    that come out
+    """
+
+    async def app(scope, receive, send):
+        headers = [(b"content-type", b"application/json")]
+        if len(chunks) == 1:
+            headers.append((b"content-length", str(len(chunks[0])).encode()))
+        if content_encoding is not None:
+            headers.append((b"content-encoding", content_encoding.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for i, chunk in enumerate(chunks):
+            more_body = i < len(chunks) - 1
+            await send(
+                {"type": "http.response.body", "body": chunk, "more_body": more_body}
+            )
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    asyncio.run(CompressionMiddleware(app)(scope, None, send))
+    start, *bodies = messages
+    return Headers(raw=start["headers"]), [message["body"] for message in bodies]
+
+
+@pytest.fixture(autouse=True)
+def min_size(monkeypatch):
+    monkeypatch.setattr(compression, "RESPONSE_COMPRESSION_MIN_SIZE", 500)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, compressor",
+    [
+        pytest.param("gzip, deflate, br", BrotliCompressor, marks=needs_brotli),
+        ("br;q=0, gzip", GzipCompressor),
+        ("GZIP;q=0.5", GzipCompressor),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_negotiation(accept_encoding, compressor):
+    assert compression.negotiate(accept_encoding) is compressor
+
+
+def test_gzip_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert compression.negotiate("br, gzip") is GzipCompressor
+    assert compression.negotiate("br") is None
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, decompress",
+    [
+        ("gzip", gzip.decompress),
+        pytest.param("br", lambda body: brotli.decompress(body), marks=needs_brotli),
+    ],
+)
+def test_responses_are_compressed(accept_encoding, decompress):
+    headers, (body,) = respond([BODY], accept_encoding)
+    assert headers["Content-Encoding"] == accept_encoding
+    assert headers["Vary"] == "Accept-Encoding"
+    assert int(headers["Content-Length"]) == len(body) < len(BODY)
+    assert decompress(body) == BODY
+
+
+def test_small_and_encoded_responses_are_left_alone():
+    headers, (body,) = respond([b"{}"], "gzip")
+    assert "Content-Encoding" not in headers and body == b"{}"
+
+    headers, (body,) = respond([BODY], "gzip", content_encoding="identity")
+    assert headers["Content-Encoding"] == "identity" and body == BODY
+
+
+def test_streamed_chunks_are_flushed():
+    chunks = [BODY[:100], BODY[100:200], BODY[200:]]
+    headers, bodies = respond(chunks, "gzip")
+    assert headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in headers
+    # Each chunk decompresses to its rows as soon as it arrives
+    decompressor = zlib.decompressobj(31)
+    for chunk, body in zip(chunks, bodies):
+        assert decompressor.decompress(body) == chunk
+    assert decompressor.eof
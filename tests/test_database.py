@@ -0,0 +1,25 @@
+from sqlalchemy import text
+
+
+def test_sessions_run_in_utc(client):
+    from app.database import engine
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SHOW TimeZone")).scalar() == "UTC"
+
+
+def test_replica_reads_wait_for_the_clients_writes(monkeypatch):
+    from app.util import replica
+
+    monkeypatch.setattr(replica, "replica_engine", object())
+    monkeypatch.setattr(replica, "lag", 0.0)
+    monkeypatch.setattr(replica, "replayed_lsn", replica.parse_lsn("16/B374D848"))
+    assert replica.format_lsn(replica.parse_lsn("16/B374D848")) == "16/B374D848"
+    assert replica.parse_lsn("not an LSN") is None
+
+    assert replica.use_replica(None)
+    assert replica.use_replica(replica.parse_lsn("16/B374D848"))
+    assert not replica.use_replica(replica.parse_lsn("16/B374D849"))
+    # Nor while its lag is unknown, e.g. when it stopped streaming
+    monkeypatch.setattr(replica, "lag", None)
+    assert not replica.use_replica(None)
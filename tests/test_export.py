@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+
+import pytest
+
+
+@pytest.fixture
+def exported(client, new_invoice, monkeypatch):
+    """
+    Five new invoices, and the query selecting just them, exported in batches
+    smaller than that
+    """
+    from app.util import export
+
+    monkeypatch.setattr(export, "INVOICE_EXPORT_BATCH_SIZE", 2)
+    created = [
+        client.post("/invoices/create", json=new_invoice()).json() for _ in range(5)
+    ]
+    return created, {"issued_from": created[0]["issued_at"]}
+
+
+def test_ndjson_export_has_one_invoice_per_line(client, exported):
+    created, params = exported
+    response = client.get("/invoices/export", params={**params, "format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    assert "invoices.ndjson" in response.headers["Content-Disposition"]
+
+    assert response.text.endswith("\n")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == [
+        invoice["internal_id"] for invoice in created
+    ]
+    assert [line["invoice_number"] for line in lines] == [
+        invoice["invoice_number"] for invoice in created
+    ]
+
+
+def test_csv_export_has_one_header(client, exported):
+    from app.util.export import COLUMNS
+
+    created, params = exported
+    response = client.get("/invoices/export", params={**params, "format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("text/csv")
+
+    header, *rows = csv.reader(io.StringIO(response.text))
+    assert header == COLUMNS
+    assert [int(row[COLUMNS.index("id")]) for row in rows] == [
+        invoice["internal_id"] for invoice in created
+    ]
+    assert {row[COLUMNS.index("status")] for row in rows} == {"SUBMITTED"}
+
+
+def test_empty_csv_export_is_just_the_header(client):
+    from app.util.export import COLUMNS
+
+    params = {"issued_from": "2100-01-01T00:00:00", "format": "csv"}
+    response = client.get("/invoices/export", params=params)
+    assert list(csv.reader(io.StringIO(response.text))) == [COLUMNS]
@@ -0,0 +1,126 @@
+# The furs_fiscal client against the FURS stand-in, served on a local port
+import json
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+import uvicorn
+from app.util import furs_client
+from app.util.furs_client import Connector, InvoiceAPI, is_unavailable
+from app.util.invoices import build_eor_request, build_submission
+from benchmarks.common import generate_p12
+from fastapi.testclient import TestClient
+from furs_fiscal.exceptions import (
+    ConnectionException,
+    ConnectionTimedOutException,
+    FURSException,
+)
+from furs_mock import INVOICE_ISSUE_PATH, MockConfig, create_app
+from jose import jws
+
+PASSWORD = "secret"
+
+
+@pytest.fixture(scope="module")
+def p12_path(tmp_path_factory) -> Path:
+    path = tmp_path_factory.mktemp("p12") / "certificate.p12"
+    generate_p12(path, PASSWORD)
+    return path
+
+
+@pytest.fixture
+def invoice_api(p12_path, monkeypatch):
+    """
+    Starts the mock with the given settings, returns a client talking to it
+    """
+    servers = []
+
+    def invoice_api(**settings) -> InvoiceAPI:
+        config = uvicorn.Config(
+            create_app(MockConfig(latency_median=0, **settings)),
+            host="127.0.0.1",
+            port=0,
+            log_level="warning",
+        )
+        server = uvicorn.Server(config)
+        threading.Thread(target=server.run, daemon=True).start()
+        servers.append(server)
+        while not server.started:
+            time.sleep(0.01)
+        (port,) = [socket.getsockname()[1] for socket in server.servers[0].sockets]
+        monkeypatch.setattr(
+            furs_client, "FURS_API_ENDPOINT", f"http://127.0.0.1:{port}"
+        )
+        return InvoiceAPI(Connector(p12_path, PASSWORD))
+
+    yield invoice_api
+    for server in servers:
+        server.should_exit = True
+
+
+def get_eor(api: InvoiceAPI) -> str:
+    submission = build_submission(
+        tax_number=12345678,
+        business_premise_id="P1",
+        electronic_device_id="D1",
+        invoice_amount=12.2,
+        vat_amounts=[(22.0, 10.0, 2.2)],
+        operator_tax_number=12345678,
+    )
+    issued_at = datetime.utcnow()
+    zoi = api.calculate_zoi(12345678, issued_at, "1", "P1", "D1", 12.2)
+    return api.get_invoice_eor(
+        **build_eor_request(
+            submission,
+            zoi=zoi,
+            issued_at=issued_at,
+            invoice_number="1",
+            subsequent_submit=False,
+        )
+    )
+
+
+def test_issues_eors(invoice_api):
+    api = invoice_api()
+    first, second = get_eor(api), get_eor(api)
+    assert len(first) == 36 and first != second
+
+
+def test_injected_furs_errors_are_rejections(invoice_api):
+    with pytest.raises(FURSException) as error:
+        get_eor(invoice_api(error_rate=1))
+    assert not is_unavailable(error.value)
+
+
+def test_injected_server_errors_are_unavailability(invoice_api):
+    with pytest.raises(ConnectionException) as error:
+        get_eor(invoice_api(http_error_rate=1))
+    assert is_unavailable(error.value)
+
+
+def test_injected_hangs_time_out(invoice_api):
+    api = invoice_api(timeout_rate=1, timeout_seconds=1)
+    with furs_client.request_timeout(0.1):
+        with pytest.raises(ConnectionTimedOutException):
+            get_eor(api)
+
+
+def test_seeded_runs_repeat():
+    message = {
+        "token": jws.sign(
+            {"InvoiceRequest": {"Invoice": {}}}, "client", algorithm="HS256"
+        )
+    }
+
+    def eors(seed: int):
+        client = TestClient(create_app(MockConfig(latency_median=0, seed=seed)))
+        eors = []
+        for _ in range(3):
+            token = client.post(INVOICE_ISSUE_PATH, json=message).json()["token"]
+            response = json.loads(jws.get_unverified_claims(token))
+            eors.append(response["InvoiceResponse"]["UniqueInvoiceID"])
+        return eors
+
+    assert eors(1) == eors(1) != eors(2)
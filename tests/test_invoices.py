@@ -0,0 +1,184 @@
+import threading
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+# Statements a request may run, regressions to N+1 patterns or extra round
+# trips show up as a higher count
+CREATE_STATEMENTS = 6
+# Claiming the key and binding it to the invoice
+IDEMPOTENT_CREATE_STATEMENTS = CREATE_STATEMENTS + 4
+LIST_STATEMENTS = 1
+GET_STATEMENTS = 1
+
+
+def test_create_statements(client, new_invoice):
+    for _ in range(3):
+        response = client.post("/invoices/create", json=new_invoice())
+        assert response.status_code == 201
+        assert int(response.headers["X-SQL-Statements"]) == CREATE_STATEMENTS
+
+
+def test_idempotent_create_statements(client, new_invoice):
+    for n in range(3):
+        headers = {"Idempotency-Key": f"statements-{n}"}
+        response = client.post("/invoices/create", json=new_invoice(), headers=headers)
+        assert response.status_code == 201
+        statements = int(response.headers["X-SQL-Statements"])
+        assert statements == IDEMPOTENT_CREATE_STATEMENTS
+
+
+def test_list_and_get_statements(client, new_invoice):
+    for _ in range(3):
+        invoice = client.post("/invoices/create", json=new_invoice()).json()
+        for path in ["/invoices/list", "/invoices/list/all"]:
+            response = client.get(path)
+            assert response.status_code == 200
+            assert int(response.headers["X-SQL-Statements"]) == LIST_STATEMENTS
+        for path in [
+            f"/invoices/get/{invoice['internal_id']}",
+            f"/invoices/by-number/{invoice['invoice_number']}",
+            f"/invoices/by-zoi/{invoice['zoi']}",
+            f"/invoices/by-eor/{invoice['eor']}",
+        ]:
+            response = client.get(path)
+            assert response.status_code == 200
+            assert int(response.headers["X-SQL-Statements"]) == GET_STATEMENTS
+
+
+def test_create_releases_device_before_submitting(client, tenant, furs, new_invoice):
+    from app.database import engine
+
+    def lock_device(**kwargs):
+        with engine.connect() as connection:
+            connection.execute(
+                text("SELECT id FROM devices WHERE id = :id FOR UPDATE NOWAIT"),
+                {"id": tenant.device_id},
+            )
+
+    furs.on_submit = lock_device
+    response = client.post("/invoices/create", json=new_invoice())
+    assert response.status_code == 201
+    assert response.json()["eor"] is not None
+
+
+def test_idempotency_key_is_bound_to_the_invoice(client, new_invoice):
+    headers = {"Idempotency-Key": "bound"}
+    first = client.post("/invoices/create", json=new_invoice(), headers=headers)
+    retry = client.post("/invoices/create", json=new_invoice(), headers=headers)
+    assert retry.json() == first.json()
+
+    other = new_invoice(operator_tax_id=87654321)
+    response = client.post("/invoices/create", json=other, headers=headers)
+    assert response.status_code == 422
+
+
+def test_submitted_vat_amounts_keep_the_invoice_totals(client, furs, new_invoice):
+    submitted = []
+    furs.on_submit = lambda **kwargs: submitted.append(kwargs)
+    prices = [("10.00", "22"), ("0.05", "9.5"), ("3.33", "9.5"), ("-1.99", "22")]
+    response = client.post(
+        "/invoices/create",
+        json=new_invoice(
+            prices=[{"amount": amount, "tax_rate": rate} for amount, rate in prices],
+        ),
+    )
+    assert response.status_code == 201
+
+    # As submitted before the VAT amounts were rounded to cents
+    old = [
+        (float(rate), float(amount), float(Decimal(amount) * Decimal(rate) / 100))
+        for amount, rate in prices
+    ]
+    (request,) = submitted
+    vat_amounts = request["taxes_per_seller"][0].vat_amounts
+    assert request["invoice_amount"] == pytest.approx(sum(base for _, base, _ in old))
+    assert [(vat["TaxRate"], vat["TaxableAmount"]) for vat in vat_amounts] == [
+        (rate, base) for rate, base, _ in old
+    ]
+    for vat, (_, _, tax) in zip(vat_amounts, old):
+        assert vat["TaxAmount"] == round(vat["TaxAmount"], 2)
+        assert vat["TaxAmount"] == pytest.approx(tax, abs=0.005)
+
+
+def test_vat_lines_add_up_to_the_submitted_amounts(client, furs, new_invoice):
+    from app.database import engine
+
+    submitted = []
+    furs.on_submit = lambda taxes_per_seller, **kwargs: submitted.extend(
+        taxes_per_seller[0].vat_amounts
+    )
+    # 0.05 at 9.5% is 0.00475, so the VAT is 0.00 on each price but would be
+    # 0.01 on their sum
+    prices = [{"amount": "0.05", "tax_rate": "9.5"}] * 3
+    response = client.post("/invoices/create", json=new_invoice(prices=prices))
+    assert response.status_code == 201
+    assert [(vat["TaxableAmount"], vat["TaxAmount"]) for vat in submitted] == [
+        (0.05, 0.0)
+    ] * 3
+
+    with engine.connect() as connection:
+        lines = connection.execute(
+            text(
+                "SELECT tax_rate, base, tax FROM invoice_vat_lines "
+                "WHERE invoice_id = :id"
+            ),
+            {"id": response.json()["internal_id"]},
+        ).all()
+    assert lines == [(Decimal("9.5"), Decimal("0.15"), Decimal("0.00"))]
+
+
+def test_batch_stores_invoices_before_submitting(client, furs, new_invoice):
+    from app.database import engine
+
+    stored = []
+    # The invoices are submitted concurrently
+    lock = threading.Lock()
+
+    def check_stored(invoice_number, **kwargs):
+        with engine.connect() as connection:
+            status = connection.execute(
+                text("SELECT status FROM invoices WHERE invoice_number = :number"),
+                {"number": invoice_number},
+            ).scalar()
+        with lock:
+            stored.append(status)
+            if len(stored) == 2:
+                raise ValueError("Rejected by FURS")
+
+    furs.on_submit = check_stored
+    response = client.post("/invoices/create/batch", json=[new_invoice()] * 2)
+    assert response.status_code == 200
+    assert stored == ["PENDING", "PENDING"]
+
+    submitted, failed = sorted(
+        response.json(), key=lambda result: result["success"], reverse=True
+    )
+    assert submitted["success"] and submitted["invoice"]["status"] == "SUBMITTED"
+    # Reported as an error, as for a single invoice, and left to the outbox
+    assert not failed["success"] and failed["error"] == "Rejected by FURS"
+    assert failed["invoice"]["status"] == "PENDING"
+    with engine.connect() as connection:
+        status, error = connection.execute(
+            text("SELECT status, last_submit_error FROM invoices WHERE id = :id"),
+            {"id": failed["invoice"]["internal_id"]},
+        ).one()
+    assert (status, error) == ("PENDING", "Rejected by FURS")
+
+
+def test_batch_submits_invoices_concurrently(client, furs, new_invoice):
+    # Only passes once all of the batch's submissions are waiting at once
+    barrier = threading.Barrier(5, timeout=5)
+    furs.on_submit = lambda **kwargs: barrier.wait()
+    response = client.post("/invoices/create/batch", json=[new_invoice()] * 5)
+    assert response.status_code == 200
+
+    results = response.json()
+    assert all(result["success"] for result in results)
+    assert {result["invoice"]["status"] for result in results} == {"SUBMITTED"}
+    # Numbers are taken for the whole batch at once, in order
+    numbers = [
+        int(result["invoice"]["invoice_number"].rsplit("-", 1)[1]) for result in results
+    ]
+    assert numbers == list(range(numbers[0], numbers[0] + 5))
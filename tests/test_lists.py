@@ -0,0 +1,55 @@
+# The list endpoints load nested rows eagerly, so the statements they run don't
+# grow with the rows they return
+from itertools import count
+
+import pytest
+
+LIST_STATEMENTS = {
+    "/companies/list": 3,
+    "/premises/list": 2,
+    "/premises/list/all": 2,
+    "/devices/list": 1,
+    "/devices/list/all": 1,
+    "/users/list": 1,
+    "/users/list/all": 1,
+}
+# Keeps the rows each test adds apart
+row_numbers = count()
+
+
+def add_rows(tenant):
+    from app.database import SessionLocal, models
+
+    n = next(row_numbers)
+    with SessionLocal() as db:
+        company = models.Company(
+            name=f"Company {n}", tax_id=10000000 + n, cert_key="{}"
+        )
+        db.add(company)
+        db.flush()
+        for company_id in [tenant.company_id, company.id]:
+            premise = models.BusinessPremise(
+                furs_id=f"L{n}",
+                premise_type=models.BusinessPremiseType.MOVABLE,
+                movable_type=models.MovablePremiseType.A,
+                company_id=company_id,
+            )
+            user = models.User(
+                username=f"user-{company_id}-{n}",
+                email=f"user-{company_id}-{n}@example.com",
+                password="",
+                company_id=company_id,
+            )
+            db.add_all([premise, user])
+            db.flush()
+            db.add(models.Device(device_id=f"L{company_id}-{n}", premise_id=premise.id))
+        db.commit()
+
+
+@pytest.mark.parametrize("path", LIST_STATEMENTS)
+def test_list_statements(client, tenant, path):
+    for _ in range(3):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert int(response.headers["X-SQL-Statements"]) == LIST_STATEMENTS[path]
+        add_rows(tenant)
@@ -0,0 +1,38 @@
+from sqlalchemy import text
+
+
+def test_drain_releases_invoices_before_submitting(client, furs, new_invoice):
+    from app.database import engine
+    from app.util import outbox
+
+    invoice = client.post("/invoices/create", json=new_invoice()).json()
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "UPDATE invoices SET status = 'PENDING', eor = NULL, "
+                "next_submit_at = now() WHERE id = :id"
+            ),
+            {"id": invoice["internal_id"]},
+        )
+
+    def lock_invoice(**kwargs):
+        with engine.connect() as connection:
+            connection.execute(
+                text("SELECT id FROM invoices WHERE id = :id FOR UPDATE NOWAIT"),
+                {"id": invoice["internal_id"]},
+            )
+
+    furs.on_submit = lock_invoice
+    assert client.portal.call(outbox.drain_once) == 1
+    # Leased while submitting, and done with since
+    assert client.portal.call(outbox.drain_once) == 0
+    with engine.connect() as connection:
+        status, eor, attempts = connection.execute(
+            text("SELECT status, eor, submit_attempts FROM invoices WHERE id = :id"),
+            {"id": invoice["internal_id"]},
+        ).one()
+    assert (status, eor, attempts) == (
+        "SUBMITTED",
+        f"eor-{invoice['invoice_number']}",
+        1,
+    )
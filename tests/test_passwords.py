@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from app.util import passwords
+from argon2 import PasswordHasher
+from fastapi import HTTPException
+
+
+def cheap_hasher(time_cost: int = 1) -> PasswordHasher:
+    return PasswordHasher(time_cost=time_cost, memory_cost=8, parallelism=1)
+
+
+@pytest.fixture(params=[0, 1], ids=["threads", "processes"])
+def hashing_pool(request, monkeypatch):
+    # Before the workers fork, so that they use it too
+    monkeypatch.setattr(passwords, "hasher", cheap_hasher())
+    passwords.start(request.param)
+    yield
+    passwords.shutdown()
+
+
+def test_hash_and_verify(hashing_pool):
+    async def check():
+        password_hash = await passwords.hash_password("secret")
+        results = [
+            await passwords.verify_password(password_hash, "secret"),
+            await passwords.verify_password(password_hash, "wrong"),
+            await passwords.verify_password("not a hash", "secret"),
+        ]
+        # Whether it matches, and whether it needs rehashing
+        assert results == [(True, False), (False, False), (False, False)]
+
+    asyncio.run(check())
+
+
+def test_hashes_with_other_parameters_need_rehashing(hashing_pool):
+    password_hash = cheap_hasher(time_cost=2).hash("secret")
+    result = asyncio.run(passwords.verify_password(password_hash, "secret"))
+    assert result == (True, True)
+
+
+def test_logins_beyond_the_queue_are_rejected():
+    async def check():
+        admission = passwords.LoginAdmission(concurrency=1, queue_size=1)
+        release = asyncio.Event()
+        entered = []
+
+        async def login(n: int):
+            async with admission:
+                entered.append(n)
+                await release.wait()
+
+        first = asyncio.create_task(login(1))
+        waiting = asyncio.create_task(login(2))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await login(3)
+        assert error.value.status_code == 503
+        assert entered == [1]
+
+        release.set()
+        await asyncio.gather(first, waiting)
+        assert entered == [1, 2]
+
+    asyncio.run(check())
@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from itertools import count
+
+import pytest
+
+premise_numbers = count()
+
+
+class FakePremiseAPI:
+    """
+    Stands in for the FURS premise API of a company, recording registrations
+    """
+
+    def __init__(self):
+        self.registered = []
+        self.error = None
+        self.lock = threading.Lock()
+
+    def register_movable_business_premise(self, premise_id, **kwargs) -> bool:
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            self.registered.append(premise_id)
+        return True
+
+
+@pytest.fixture
+def premise_api(client, tenant, monkeypatch) -> FakePremiseAPI:
+    from app.util import certificates
+
+    premise_api = FakePremiseAPI()
+    company_api = certificates.CompanyAPI(12345678, tenant.furs, premise_api)
+    monkeypatch.setitem(
+        certificates.loaded_certificates, tenant.company_id, company_api
+    )
+    return premise_api
+
+
+@pytest.fixture
+def premise(tenant) -> int:
+    from app.database import SessionLocal, models
+
+    with SessionLocal() as db:
+        premise = models.BusinessPremise(
+            furs_id=f"R{next(premise_numbers)}",
+            premise_type=models.BusinessPremiseType.MOVABLE,
+            movable_type=models.MovablePremiseType.A,
+            company_id=tenant.company_id,
+        )
+        db.add(premise)
+        db.commit()
+        return premise.id
+
+
+def get_premise(premise_id: int):
+    from app.database import SessionLocal, models
+
+    with SessionLocal() as db:
+        return db.get(models.BusinessPremise, premise_id)
+
+
+def register_premises(client, runs: int = 1):
+    from app.util import furs
+
+    async def register():
+        await asyncio.gather(*(furs.register_premises() for _ in range(runs)))
+
+    # On the app's event loop
+    client.portal.call(register)
+
+
+def test_only_new_or_changed_premises_are_registered(client, premise_api, premise):
+    from app.database import SessionLocal, models
+
+    furs_id = get_premise(premise).furs_id
+    register_premises(client)
+    register_premises(client)
+    assert premise_api.registered.count(furs_id) == 1
+    assert get_premise(premise).registered_at is not None
+
+    with SessionLocal() as db:
+        db.get(models.BusinessPremise, premise).notes = "Moved"
+        db.commit()
+    register_premises(client)
+    assert premise_api.registered.count(furs_id) == 2
+
+
+def test_concurrent_runs_register_a_premise_once(client, premise_api, premise):
+    register_premises(client, runs=4)
+    assert premise_api.registered.count(get_premise(premise).furs_id) == 1
+
+
+def test_failed_registration_is_retried(client, premise_api, premise):
+    premise_api.error = ConnectionError("FURS is down")
+    register_premises(client)
+    failed = get_premise(premise)
+    assert failed.registration_hash is None
+    assert failed.registration_leased_until is None
+
+    premise_api.error = None
+    register_premises(client)
+    assert premise_api.registered.count(failed.furs_id) == 1
@@ -0,0 +1,69 @@
+from app.database.models import UserRole
+from app.database.schemas import User
+from app.util.principals import PrincipalCache
+
+
+def new_user(user_id: int, company_id: int = 1) -> User:
+    return User(
+        id=user_id,
+        username=f"user{user_id}",
+        email=f"user{user_id}@example.com",
+        role=UserRole.DEFAULT,
+        active=True,
+        company_id=company_id,
+    )
+
+
+def test_invalidated_users_are_dropped():
+    cache = PrincipalCache(ttl=60, max_entries=10)
+    for user in [new_user(1), new_user(2), new_user(3, company_id=2)]:
+        cache.put(user, cache.generation)
+
+    cache.invalidate_user(1)
+    assert cache.get(1) is None
+    cache.invalidate_company(2)
+    assert cache.get(3) is None
+    assert cache.get(2) is not None
+
+
+def test_users_read_before_an_invalidation_are_not_cached():
+    cache = PrincipalCache(ttl=60, max_entries=10)
+    generation = cache.generation
+    cache.invalidate_user(1)
+    cache.put(new_user(1), generation)
+    assert cache.get(1) is None
+
+
+def test_least_recently_used_users_are_evicted():
+    cache = PrincipalCache(ttl=60, max_entries=2)
+    cache.put(new_user(1), cache.generation)
+    cache.put(new_user(2), cache.generation)
+    cache.get(1)
+    cache.put(new_user(3), cache.generation)
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+
+
+def test_disabled_user_is_rejected_at_once(client, tenant):
+    from app.database import SessionLocal, models
+    from app.util.auth import create_access_token
+
+    with SessionLocal() as db:
+        user = models.User(
+            username="cached",
+            email="cached@example.com",
+            password="",
+            company_id=tenant.company_id,
+        )
+        db.add(user)
+        db.commit()
+        user_id = user.id
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+
+    assert client.get("/auth/me", headers=headers).status_code == 200
+    # Served from the cache now
+    me = client.get("/auth/me", headers=headers)
+    assert int(me.headers["X-SQL-Statements"]) == 0
+
+    assert client.post(f"/users/disable/{user_id}").status_code == 200
+    assert client.get("/auth/me", headers=headers).status_code == 403
@@ -0,0 +1,101 @@
+from decimal import Decimal
+
+from sqlalchemy import text
+
+ALL_DAYS = {"date_from": "2000-01-01", "date_to": "2100-01-01"}
+
+
+def vat_bases(report: dict) -> dict:
+    return {
+        Decimal(str(vat["tax_rate"])): Decimal(str(vat["base"]))
+        for vat in report["vat"]
+    }
+
+
+def test_backfill_rebuilds_the_reports_of_earlier_invoices(client, new_invoice):
+    from app.database import engine, migrations
+
+    prices = [
+        {"amount": "10.00", "tax_rate": "22"},
+        {"amount": "3.33", "tax_rate": "9.5"},
+    ]
+    invoices = [
+        client.post("/invoices/create", json=new_invoice(prices=prices)).json()
+        for _ in range(3)
+    ]
+    expected = client.get("/reports/sales", params=ALL_DAYS).json()
+
+    # As if the invoices were issued before the upgrade, one of them before
+    # submissions were stored
+    with engine.begin() as connection:
+        connection.execute(text("TRUNCATE invoice_vat_lines, daily_sales, daily_vat"))
+        connection.execute(
+            text("UPDATE invoices SET submission = NULL WHERE id = :id"),
+            {"id": invoices[0]["internal_id"]},
+        )
+        connection.execute(
+            text("DELETE FROM schema_migrations WHERE name LIKE '0005_%'")
+        )
+    migrations.upgrade(engine)
+
+    report = client.get("/reports/sales", params=ALL_DAYS).json()
+    assert report["invoices"] == expected["invoices"]
+    assert report["total"] == expected["total"]
+    assert report["days"] == expected["days"]
+    # Without the submission, the VAT of that invoice is unknown
+    bases = vat_bases(report)
+    for rate, base in vat_bases(expected).items():
+        assert bases[rate] == base - sum(
+            Decimal(price["amount"])
+            for price in prices
+            if Decimal(price["tax_rate"]) == rate
+        )
+
+
+def test_sales_report_adds_up_the_invoices(client, tenant, new_invoice):
+    from app.database import engine
+
+    # 00:30 on the 16th in Ljubljana, the report time zone
+    issued_at = "2026-01-15T23:30:00+00:00"
+    prices = [
+        {"amount": "10.00", "tax_rate": "22"},
+        {"amount": "3.33", "tax_rate": "9.5"},
+    ]
+    for _ in range(2):
+        response = client.post(
+            "/invoices/create", json=new_invoice(prices=prices, issued_at=issued_at)
+        )
+        assert response.status_code == 201
+
+    day = {"date_from": "2026-01-16", "date_to": "2026-01-16"}
+    report = client.get("/reports/sales", params=day).json()
+    assert report["invoices"] == 2
+    assert Decimal(str(report["total"])) == Decimal("26.66")
+    assert report["days"] == [{"day": "2026-01-16", "invoices": 2, "total": 26.66}]
+    assert vat_bases(report) == {Decimal("9.5"): Decimal("6.66"), Decimal(22): 20}
+    previous_day = {"date_from": "2026-01-15", "date_to": "2026-01-15"}
+    assert client.get("/reports/sales", params=previous_day).json()["invoices"] == 0
+
+    # The rollups add up to the invoices
+    report = client.get("/reports/sales", params=ALL_DAYS).json()
+    with engine.connect() as connection:
+        invoices, total = connection.execute(
+            text(
+                "SELECT count(*), sum(round(total::numeric, 2)) FROM invoices "
+                "WHERE company_id = :company_id"
+            ),
+            {"company_id": tenant.company_id},
+        ).one()
+        bases = dict(
+            connection.execute(
+                text(
+                    "SELECT tax_rate, sum(base) FROM invoice_vat_lines "
+                    "JOIN invoices ON invoices.id = invoice_id "
+                    "WHERE company_id = :company_id GROUP BY tax_rate"
+                ),
+                {"company_id": tenant.company_id},
+            ).all()
+        )
+    assert report["invoices"] == invoices
+    assert Decimal(str(report["total"])) == total
+    assert vat_bases(report) == bases